@@ -2,3 +2,5 @@ import os
 
 ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.join(ROOT_DIR, 'data')
+FEATURE_CACHE_DIR = os.path.join(DATA_DIR, 'feature_cache')
+HISTORY_FEATURES_DIR = os.path.join(DATA_DIR, 'history_features')
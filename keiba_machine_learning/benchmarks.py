@@ -0,0 +1,214 @@
+"""スクレイピング・データセットの作成・特徴量の変換・学習の各段階の速度を計測する
+
+    結果は JSON で保存でき、保存しておいた結果(ベースライン)と比べて一定以上遅くなった項目を検出できる
+    (変更で夜間のバッチが遅くならないかを確認するためのもの。計測方法は scripts/netkeiba/run_benchmarks.py を参照)
+
+    各項目は repeat 回計測して最も速かったものを使う(他のプロセスの影響を受けにくくするため)
+
+    Examples:
+        results = run_benchmarks(pages, sizes=(1_000, 10_000))
+        save_results(results, 'benchmark.json')
+        regressions = compare(results, load_results('baseline.json'), threshold=0.2)
+"""
+import io
+import json
+import time
+import warnings
+from typing import Callable, Dict, List, NamedTuple, Sequence
+
+import numpy as np
+import pandas as pd
+from sklearn.exceptions import ConvergenceWarning
+from sklearn.linear_model import LogisticRegression
+
+from keiba_machine_learning.features import CATEGORICAL_COLUMNS, SparseOneHotEncoder
+from keiba_machine_learning.netkeiba.constants import ENCODING_OF_WEB_PAGE
+from keiba_machine_learning.netkeiba.datasets import to_table
+from keiba_machine_learning.netkeiba.pipelines import COLUMNS, race_page_to_columns
+from keiba_machine_learning.netkeiba.scrapers import (DataNotFound, IncompatibleDataDetected, ParserBackend,
+                                                      RaceInformationScraper, RacePageScraper, RaceResultScraper)
+from keiba_machine_learning.training import under_sample
+from keiba_machine_learning.types import RacePage
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+
+
+class BenchmarkResult(NamedTuple):
+    name: str
+    value: float
+    unit: str
+    higher_is_better: bool  # pages/s などは True、秒は False
+
+
+class Regression(NamedTuple):
+    name: str
+    baseline: float
+    value: float
+    change: float  # 悪くなった割合(0.2 なら 20% 悪化)
+
+
+def run_benchmarks(pages: Sequence[bytes], sizes: Sequence[int] = DEFAULT_SIZES, repeat: int = 3,
+                   parser: ParserBackend = ParserBackend.HTML_PARSER) -> List[BenchmarkResult]:
+    """ 全ての項目を計測する
+
+    Args:
+        pages (Sequence[bytes]): スクレイピングするページ(EUC-JP)。レース結果があるページが1つ以上必要
+        sizes (Sequence[int]): 特徴量の変換・学習を計測する行数
+        repeat (int): 各項目を計測する回数
+        parser (ParserBackend): HTMLのパースに使うライブラリ
+
+    Returns:
+        List[BenchmarkResult]
+    """
+    race_pages = _scrape_all(pages, parser)
+    if not race_pages:
+        raise ValueError("at least one page with race results is required.")
+
+    results = benchmark_scrapers(pages, repeat, parser)
+    results.append(benchmark_dataset_build(race_pages, repeat))
+    results.extend(benchmark_model(race_pages, sizes, repeat))
+    return results
+
+
+def benchmark_scrapers(pages: Sequence[bytes], repeat: int = 3,
+                       parser: ParserBackend = ParserBackend.HTML_PARSER) -> List[BenchmarkResult]:
+    """ レース情報・レース結果それぞれのスクレイピングの速度(ページ/秒) """
+    results = []
+    for name, scraper in (('race_information', RaceInformationScraper), ('race_result', RaceResultScraper)):
+        def scrape_all() -> None:
+            for content in pages:
+                try:
+                    scraper.scrape(_open(content), parser=parser)
+                except (DataNotFound, IncompatibleDataDetected):
+                    # データが存在しないページ・対象外のページもパースのコストはかかるので計測対象に含める
+                    pass
+
+        elapsed = _best_of(scrape_all, repeat)
+        results.append(BenchmarkResult(f'scrape.{name}', len(pages) / elapsed, 'pages/s', True))
+    return results
+
+
+def benchmark_dataset_build(race_pages: Sequence[RacePage], repeat: int = 3,
+                            min_row_count: int = 10_000) -> BenchmarkResult:
+    """ スクレイピング結果を列にして SCHEMA の型の DataFrame にする速度(行/秒) """
+    row_count_per_round = sum(len(race_page['race_records']) for race_page in race_pages)
+    rounds = max(1, -(-min_row_count // row_count_per_round))
+
+    def build() -> None:
+        columns: Dict[str, list] = {column: [] for column in COLUMNS}
+        for race_id in range(rounds):
+            for race_page in race_pages:
+                race_page_to_columns(race_id, race_page, columns)
+        to_table(columns).to_pandas()
+
+    elapsed = _best_of(build, repeat)
+    return BenchmarkResult('build.data_frame', rounds * row_count_per_round / elapsed, 'rows/s', True)
+
+
+def benchmark_model(race_pages: Sequence[RacePage], sizes: Sequence[int] = DEFAULT_SIZES,
+                    repeat: int = 3) -> List[BenchmarkResult]:
+    """ logistic_regression_exam.ipynb と同じ流れ(one-hot → アンダーサンプリング → LogisticRegression)の
+        変換・学習にかかる時間(秒)を行数ごとに計測する
+    """
+    columns: Dict[str, list] = {column: [] for column in COLUMNS}
+    for race_id, race_page in enumerate(race_pages):
+        race_page_to_columns(race_id, race_page, columns)
+    base = to_table(columns).to_pandas()
+
+    results = []
+    for size in sizes:
+        df = synthetic_race_results(base, size)
+        y = np.minimum(df['order_of_placing'].to_numpy(dtype=np.int64), 4)
+        encoder = SparseOneHotEncoder(CATEGORICAL_COLUMNS)
+        x = encoder.fit_transform(df)
+
+        def fit() -> None:
+            x_resampled, y_resampled = under_sample(x, y, max_order_of_placing=4, random_state=0)
+            # 反復回数を固定して計測するので収束しなくてもよい
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', ConvergenceWarning)
+                LogisticRegression(max_iter=100).fit(x_resampled, y_resampled)
+
+        results.append(BenchmarkResult(f'model.encode[{size}]', _best_of(lambda: encoder.fit_transform(df), repeat),
+                                       's', False))
+        results.append(BenchmarkResult(f'model.fit[{size}]', _best_of(fit, repeat), 's', False))
+    return results
+
+
+def synthetic_race_results(base: pd.DataFrame, row_count: int, seed: int = 0) -> pd.DataFrame:
+    """ base の行を元に値をばらつかせて row_count 行にしたもの(同じ行の繰り返しだと学習がすぐに終わってしまうため)
+
+        レースは base の最大頭数ごとに区切り、着順・人気はレース内で重複しないようにする
+    """
+    rng = np.random.default_rng(seed)
+    field_size = int(base.groupby('race_id').size().max())
+    df = base.iloc[rng.integers(0, len(base), size=row_count)].reset_index(drop=True)
+    df['race_id'] = np.arange(row_count) // field_size
+    for column in ('order_of_placing', 'favorite_order'):
+        # レース内で乱数の順位を付ける
+        ranks = pd.Series(rng.random(row_count)).groupby(df['race_id']).rank(method='first')
+        df[column] = ranks.to_numpy().astype(df[column].dtype)
+    df['win_betting_ratio'] = np.round(rng.lognormal(2.0, 1.0, size=row_count), 1).astype(np.float32)
+    df['horse_weight'] = rng.integers(400, 560, size=row_count).astype(df['horse_weight'].dtype)
+    df['weight_change'] = rng.integers(-20, 21, size=row_count).astype(df['weight_change'].dtype)
+    df['jockey_id'] = pd.Categorical([f'{jockey:05d}' for jockey in rng.integers(0, 300, size=row_count)])
+    return df
+
+
+def compare(results: Sequence[BenchmarkResult], baseline: Sequence[BenchmarkResult],
+            threshold: float = 0.2) -> List[Regression]:
+    """ ベースラインより threshold の割合を超えて悪くなった項目(ベースラインにない項目は比べない)
+
+    Args:
+        results (Sequence[BenchmarkResult]): 今回の結果
+        baseline (Sequence[BenchmarkResult]): 比較対象の結果
+        threshold (float): 許容する悪化の割合(0.2 なら 20% までは許容する)
+
+    Returns:
+        List[Regression]: 悪化した項目
+    """
+    baseline_by_name = {result.name: result for result in baseline}
+    regressions = []
+    for result in results:
+        base = baseline_by_name.get(result.name)
+        if base is None or base.value <= 0 or result.value <= 0:
+            continue
+        # 速度(大きいほど良い)も時間(小さいほど良い)も「何割悪くなったか」に揃える
+        change = base.value / result.value - 1 if result.higher_is_better else result.value / base.value - 1
+        if change > threshold:
+            regressions.append(Regression(result.name, base.value, result.value, change))
+    return regressions
+
+
+def save_results(results: Sequence[BenchmarkResult], file_path: str) -> None:
+    with open(file_path, mode='w') as file:
+        json.dump({'results': [result._asdict() for result in results]}, file, indent=2)
+
+
+def load_results(file_path: str) -> List[BenchmarkResult]:
+    with open(file_path) as file:
+        return [BenchmarkResult(**result) for result in json.load(file)['results']]
+
+
+def _scrape_all(pages: Sequence[bytes], parser: ParserBackend) -> List[RacePage]:
+    race_pages = []
+    for content in pages:
+        try:
+            race_pages.append(RacePageScraper.scrape(_open(content), parser=parser))
+        except (DataNotFound, IncompatibleDataDetected):
+            continue
+    return race_pages
+
+
+def _open(content: bytes) -> io.TextIOWrapper:
+    return io.TextIOWrapper(io.BytesIO(content), encoding=ENCODING_OF_WEB_PAGE)
+
+
+def _best_of(function: Callable[[], object], repeat: int) -> float:
+    """ repeat 回実行して最も短かった時間(秒) """
+    elapsed_times = []
+    for _ in range(max(repeat, 1)):
+        started_at = time.perf_counter()
+        function()
+        elapsed_times.append(time.perf_counter() - started_at)
+    return min(elapsed_times)
@@ -0,0 +1,356 @@
+"""学習・予測に使う特徴量の作成
+
+    pd.get_dummies で one-hot にすると、騎手・オッズ・馬体重のように値の種類が多い列があるため
+    ほとんどが 0 の列が数千列ある密な DataFrame になってしまう
+    ここでは列ごとに値の一覧(語彙)を一度だけ学習し、1 の位置だけを持つ疎行列(CSR)を作る
+
+    また、データセットの読み込み → 着順の整理 → 訓練データとテストデータへの分割 → one-hot を FeaturePipeline にまとめており、
+    その結果はデータセットと設定が変わらない限りディスクにキャッシュしたものを使う
+
+    Examples:
+        encoder = SparseOneHotEncoder(['race_track', 'jockey_id', 'win_betting_ratio'])
+        x_train = encoder.fit_transform(train_df)
+        x_test = encoder.transform(test_df)  # 学習時になかった値は全ての列が 0 になる
+        encoder.save('encoder.pickle')
+
+        features = FeaturePipeline().prepare()
+        model.fit(features.x_train, features.y_train)
+"""
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import scipy.sparse
+from sklearn.model_selection import train_test_split
+
+from constants import FEATURE_CACHE_DIR
+from keiba_machine_learning.netkeiba.constants import RACE_RESULTS_DATASET_DIR
+from keiba_machine_learning.model_selection import period_keys, train_period_cutoff
+from keiba_machine_learning.netkeiba.datasets import dataset_version, iter_race_results, load_race_results
+
+# one-hot にする列
+# horse_id や horse_name などはユニークな値が 10,000 件以上あるので(素振り段階では)使わない
+CATEGORICAL_COLUMNS = [
+    'race_track', 'track_kind', 'track_direction', 'race_distance_by_meter', 'track_surface', 'weather',
+    'bracket_number', 'horse_number', 'horse_age', 'horse_gender', 'impost', 'jockey_id',
+    'win_betting_ratio', 'favorite_order', 'horse_weight', 'weight_change',
+]
+TARGET_COLUMN = 'order_of_placing'
+SPLIT_BY = ('race', 'row')
+
+# FeaturePipeline の処理内容を変えたら上げる(古いキャッシュを使わないようにする)
+FEATURE_PIPELINE_VERSION = 2
+
+
+class SparseOneHotEncoder:
+    """ 指定した列を one-hot にして、列を横に並べた疎行列(CSR)に変換する
+
+        出力する行列の列の並びは columns の順番 → 各列の値の昇順(pd.get_dummies と同じ)
+    """
+
+    def __init__(self, columns: Sequence[str], dtype: Any = np.float64) -> None:
+        """
+        Args:
+            columns (Sequence[str]): one-hot にする列
+            dtype (Any): 出力する行列の型
+        """
+        self.columns = list(columns)
+        self.dtype = dtype
+        self.vocabularies: Optional[Dict[str, pd.Index]] = None
+
+    def fit(self, df: pd.DataFrame) -> 'SparseOneHotEncoder':
+        """ 列ごとに出現する値の一覧を学習する(欠損値は語彙に含めない) """
+        self.vocabularies = None
+        return self.partial_fit(df)
+
+    def partial_fit(self, df: pd.DataFrame) -> 'SparseOneHotEncoder':
+        """ 学習済みの値の一覧に df に出現する値を追加する(データを分けて渡しても全体で fit したのと同じになる) """
+        vocabularies = {}
+        for column in self.columns:
+            series = df[column]
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                # 値を1つずつ見なくてもカテゴリーの一覧からわかる
+                values = series.cat.remove_unused_categories().cat.categories
+            else:
+                values = series.dropna().unique()
+            vocabulary = pd.Index(np.sort(np.asarray(values)))
+            if self.vocabularies is not None:
+                vocabulary = self.vocabularies[column].union(vocabulary)
+            vocabularies[column] = vocabulary
+        self.vocabularies = vocabularies
+        return self
+
+    def transform(self, df: pd.DataFrame) -> scipy.sparse.csr_matrix:
+        """
+        Args:
+            df (pd.DataFrame): columns を含むもの
+
+        Raises:
+            ValueError: fit していない場合
+
+        Returns:
+            scipy.sparse.csr_matrix: 行数 × len(feature_names()) の疎行列
+        """
+        if self.vocabularies is None:
+            raise ValueError("SparseOneHotEncoder is not fitted yet.")
+
+        row_count = len(df)
+        rows = []
+        indices = []
+        offset = 0
+        for column in self.columns:
+            vocabulary = self.vocabularies[column]
+            # 語彙にない値(学習時になかった値・欠損値)は -1 になり、その列は全て 0 になる
+            codes = vocabulary.get_indexer(np.asarray(df[column]))
+            known = codes >= 0
+            rows.append(np.flatnonzero(known))
+            indices.append(codes[known] + offset)
+            offset += len(vocabulary)
+
+        row_indices = np.concatenate(rows) if rows else np.array([], dtype=np.int64)
+        column_indices = np.concatenate(indices) if indices else np.array([], dtype=np.int64)
+        data = np.ones(len(row_indices), dtype=self.dtype)
+        return scipy.sparse.csr_matrix((data, (row_indices, column_indices)), shape=(row_count, offset))
+
+    def fit_transform(self, df: pd.DataFrame) -> scipy.sparse.csr_matrix:
+        return self.fit(df).transform(df)
+
+    def feature_names(self) -> List[str]:
+        """
+        Returns:
+            List[str]: 出力する行列の各列の名前({列名}_{値}。pd.get_dummies と同じ)
+        """
+        if self.vocabularies is None:
+            raise ValueError("SparseOneHotEncoder is not fitted yet.")
+        return [f'{column}_{value}' for column in self.columns for value in self.vocabularies[column]]
+
+    def save(self, file_path: str) -> None:
+        with open(file_path, mode='wb') as file:
+            pickle.dump(self, file)
+
+    @staticmethod
+    def load(file_path: str) -> 'SparseOneHotEncoder':
+        with open(file_path, mode='rb') as file:
+            encoder = pickle.load(file)
+        if not isinstance(encoder, SparseOneHotEncoder):
+            raise TypeError(f"{file_path} is not a SparseOneHotEncoder.")
+        return encoder
+
+
+class PreparedFeatures(NamedTuple):
+    x_train: scipy.sparse.csr_matrix
+    x_test: scipy.sparse.csr_matrix
+    y_train: np.ndarray
+    y_test: np.ndarray
+    encoder: SparseOneHotEncoder  # 訓練データで fit したもの(予測時に同じ変換をするのに使う)
+
+
+class FeaturePipeline:
+    """ データセットから学習にそのまま使える訓練データ・テストデータを作る
+
+        1. データセットから必要な列だけを読み込む
+        2. 着順を max_order_of_placing 着以下をまとめた目的変数にする(馬券に絡まない着順は区別しない)
+        3. 訓練データとテストデータに分ける(デフォルトはレース単位・時系列順。split_by='row' で従来の行単位のランダムな分割)
+        4. 訓練データで SparseOneHotEncoder を fit して両方を変換する
+
+        prepare の結果は {cache_dir}/{キー}/ に保存しておき、キー(データセットのバージョン + 設定のハッシュ値)が
+        変わらなければそれを読み込む(データセットを更新するか設定を変えると自動的に作り直す)
+    """
+
+    def __init__(self,
+                 categorical_columns: Sequence[str] = CATEGORICAL_COLUMNS,
+                 max_order_of_placing: int = 4,
+                 test_size: float = 0.3,
+                 random_state: int = 0,
+                 filters: Optional[List[Tuple[str, str, Any]]] = None,
+                 split_by: str = 'race') -> None:
+        """
+        Args:
+            categorical_columns (Sequence[str]): one-hot にする列
+            max_order_of_placing (int): これ以下の着順はこの値にまとめる
+            test_size (float): テストデータの割合
+            random_state (int): 分割に使う乱数のシード(split_by='row' の場合のみ使う)
+            filters (Optional[List[Tuple[str, str, Any]]]): 読み込むデータセットの条件(load_race_results と同じ)
+            split_by (str): race: 後の日のレースをテストデータにする(model_selection.race_grouped_train_test_split),
+                            row: 目的変数で層化して行単位でランダムに分ける
+        """
+        if split_by not in SPLIT_BY:
+            raise ValueError(f"split_by must be one of {SPLIT_BY}.")
+
+        self.categorical_columns = list(categorical_columns)
+        self.max_order_of_placing = max_order_of_placing
+        self.test_size = test_size
+        self.random_state = random_state
+        self.filters = filters
+        self.split_by = split_by
+
+    def config(self) -> Dict[str, Any]:
+        return {
+            'version': FEATURE_PIPELINE_VERSION,
+            'categorical_columns': self.categorical_columns,
+            'max_order_of_placing': self.max_order_of_placing,
+            'test_size': self.test_size,
+            'random_state': self.random_state,
+            'filters': self.filters,
+            'split_by': self.split_by,
+        }
+
+    def cache_key(self, directory: str = RACE_RESULTS_DATASET_DIR) -> str:
+        key = json.dumps({'dataset': dataset_version(directory), 'config': self.config()},
+                         sort_keys=True, default=str)
+        return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+    def to_target(self, order_of_placing: pd.Series) -> np.ndarray:
+        return np.minimum(order_of_placing.to_numpy(dtype=np.int64), self.max_order_of_placing)
+
+    def train_cutoff(self, race_ids: np.ndarray) -> int:
+        """ split_by='race' で訓練データにする最後の日のキー(model_selection.train_period_cutoff)
+
+            日が1つしかない場合は全て訓練データになるように、その日のキーを返す
+        """
+        keys = period_keys(race_ids)
+        if len(np.unique(keys)) < 2:
+            return int(keys.max()) if len(keys) > 0 else 0
+        return train_period_cutoff(race_ids, test_size=self.test_size)
+
+    def dataset_train_cutoff(self, directory: str = RACE_RESULTS_DATASET_DIR,
+                             chunk_size: int = 100_000) -> int:
+        """ データセット全体のレースIDから train_cutoff を求める(race_id の列だけを読み込む) """
+        race_ids = np.array([], dtype=np.int64)
+        for df in iter_race_results(columns=['race_id'], filters=self.filters,
+                                    directory=directory, batch_size=chunk_size):
+            race_ids = np.union1d(race_ids, df['race_id'].to_numpy(dtype=np.int64))
+        return self.train_cutoff(race_ids)
+
+    def split(self, race_ids: np.ndarray, y: np.ndarray, random_state: int,
+              train_cutoff: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """ 訓練データとテストデータの行番号に分ける
+
+            split_by='race' の場合は train_cutoff の日までのレースを訓練データにする
+            (省略時は race_ids から求める。日が1つしかない場合は全て訓練データになる)
+            split_by='row' で層化できないほど行が少ないクラスがある場合は層化せずに分ける
+        """
+        if self.split_by == 'race':
+            if train_cutoff is None:
+                train_cutoff = self.train_cutoff(race_ids)
+            is_train = period_keys(race_ids) <= train_cutoff
+            return np.flatnonzero(is_train), np.flatnonzero(~is_train)
+
+        _, counts = np.unique(y, return_counts=True)
+        stratify = y if len(counts) > 0 and counts.min() >= 2 else None
+        train_indices, test_indices = train_test_split(
+            np.arange(len(y)), stratify=stratify, test_size=self.test_size, random_state=random_state)
+        return train_indices, test_indices
+
+    def iter_chunks(self, directory: str = RACE_RESULTS_DATASET_DIR,
+                    chunk_size: int = 100_000,
+                    train_cutoff: Optional[int] = None,
+                    shuffle_seed: Optional[int] = None) -> Iterator[Tuple[pd.DataFrame, pd.DataFrame, np.ndarray, np.ndarray]]:
+        """ データセットを chunk_size 行ずつ読み込み、チャンクごとに訓練データとテストデータに分ける
+
+            split_by='race' の場合はデータセット全体で求めた1つの境目(dataset_train_cutoff)で全チャンクを分けるので、
+            チャンクをまたぐレースが訓練データとテストデータの両方に入ることはなく、build と同じ分け方になる
+            split_by='row' の場合の分け方はチャンクの順番で決まるので、何度読み込んでも同じ行が訓練データ・テストデータになる
+
+        Args:
+            train_cutoff (Optional[int]): dataset_train_cutoff の結果(何度も読み込む場合に渡すと求め直さずに済む)
+            shuffle_seed (Optional[int]): 指定するとパーティション(年・競馬場)を読む順番をシャッフルする(iter_race_results)
+                                          split_by='row' の分け方はチャンクの順番で決まるので指定できない
+
+        Returns:
+            Iterator[Tuple[pd.DataFrame, pd.DataFrame, np.ndarray, np.ndarray]]: 訓練データ、テストデータ、それぞれの目的変数
+        """
+        if self.split_by == 'row' and shuffle_seed is not None:
+            raise ValueError("can't shuffle chunks when split_by is 'row'.")
+        if self.split_by == 'race' and train_cutoff is None:
+            train_cutoff = self.dataset_train_cutoff(directory, chunk_size)
+
+        chunks = iter_race_results(columns=self._columns(), filters=self.filters,
+                                   directory=directory, batch_size=chunk_size, shuffle_seed=shuffle_seed)
+        for index, df in enumerate(chunks):
+            y = self.to_target(df[TARGET_COLUMN])
+            train_indices, test_indices = self.split(df['race_id'].to_numpy(), y, self.random_state + index,
+                                                     train_cutoff)
+            yield df.iloc[train_indices], df.iloc[test_indices], y[train_indices], y[test_indices]
+
+    def fit_encoder(self, directory: str = RACE_RESULTS_DATASET_DIR,
+                    chunk_size: int = 100_000,
+                    train_cutoff: Optional[int] = None) -> SparseOneHotEncoder:
+        """ iter_chunks の訓練データだけで SparseOneHotEncoder を fit する """
+        encoder = SparseOneHotEncoder(self.categorical_columns)
+        for train_df, _, _, _ in self.iter_chunks(directory, chunk_size, train_cutoff):
+            encoder.partial_fit(train_df)
+        return encoder
+
+    def build(self, directory: str = RACE_RESULTS_DATASET_DIR) -> PreparedFeatures:
+        """ キャッシュを使わずに作る """
+        df = load_race_results(columns=self._columns(), filters=self.filters, directory=directory)
+        y = self.to_target(df[TARGET_COLUMN])
+        train_indices, test_indices = self.split(df['race_id'].to_numpy(), y, self.random_state)
+
+        encoder = SparseOneHotEncoder(self.categorical_columns)
+        x_train = encoder.fit_transform(df.iloc[train_indices])
+        x_test = encoder.transform(df.iloc[test_indices])
+        return PreparedFeatures(x_train, x_test, y[train_indices], y[test_indices], encoder)
+
+    def prepare(self, directory: str = RACE_RESULTS_DATASET_DIR,
+                cache_dir: str = FEATURE_CACHE_DIR) -> PreparedFeatures:
+        """ キャッシュがあればそれを読み込み、なければ作ってキャッシュする
+
+        Args:
+            directory (str): データセットの保存先
+            cache_dir (str): キャッシュの保存先
+
+        Returns:
+            PreparedFeatures
+        """
+        entry_dir = os.path.join(cache_dir, self.cache_key(directory))
+        if os.path.isdir(entry_dir):
+            return self._load(entry_dir)
+
+        features = self.build(directory)
+        self._save(features, entry_dir)
+        return features
+
+    def _columns(self) -> List[str]:
+        return list(dict.fromkeys(['race_id', *self.categorical_columns, TARGET_COLUMN]))
+
+    def _save(self, features: PreparedFeatures, entry_dir: str) -> None:
+        # 書き込み途中のものを読み込まないように、一時ディレクトリに書き込んでから rename する
+        os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+        temporary_dir = tempfile.mkdtemp(dir=os.path.dirname(entry_dir), prefix='.')
+        try:
+            scipy.sparse.save_npz(os.path.join(temporary_dir, 'x_train.npz'), features.x_train)
+            scipy.sparse.save_npz(os.path.join(temporary_dir, 'x_test.npz'), features.x_test)
+            np.save(os.path.join(temporary_dir, 'y_train.npy'), features.y_train)
+            np.save(os.path.join(temporary_dir, 'y_test.npy'), features.y_test)
+            features.encoder.save(os.path.join(temporary_dir, 'encoder.pickle'))
+            with open(os.path.join(temporary_dir, 'config.json'), mode='w') as file:
+                json.dump(self.config(), file, default=str)
+        except BaseException:
+            shutil.rmtree(temporary_dir, ignore_errors=True)
+            raise
+
+        try:
+            os.rename(temporary_dir, entry_dir)
+        except OSError:
+            # 別のプロセスが先に同じキャッシュを作った場合はそちらを使う
+            shutil.rmtree(temporary_dir, ignore_errors=True)
+            if not os.path.isdir(entry_dir):
+                raise
+
+    @staticmethod
+    def _load(entry_dir: str) -> PreparedFeatures:
+        return PreparedFeatures(
+            x_train=scipy.sparse.load_npz(os.path.join(entry_dir, 'x_train.npz')).tocsr(),
+            x_test=scipy.sparse.load_npz(os.path.join(entry_dir, 'x_test.npz')).tocsr(),
+            y_train=np.load(os.path.join(entry_dir, 'y_train.npy')),
+            y_test=np.load(os.path.join(entry_dir, 'y_test.npy')),
+            encoder=SparseOneHotEncoder.load(os.path.join(entry_dir, 'encoder.pickle')),
+        )
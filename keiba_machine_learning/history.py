@@ -0,0 +1,200 @@
+"""馬・騎手の過去の成績の特徴量
+
+    馬・騎手ごとに「各レースが終わった時点での累積の成績」(出走数・勝率・直近 N 走の着順・同じ条件での平均タイム)を
+    あらかじめ計算して発走日時(ページの開催日・発走時刻から読み取ったもの)の順に並べた表として保存しておき、
+    特徴量を作るときは pd.merge_asof で「そのレースの発走日時より前に発走したレースのうち最新のもの」を結合する
+
+    レースIDの回・日目は競馬場ごとの通し番号で、別の競馬場のレースとの前後がわからないので並べ替えには使わない
+
+    そのレース自身やそれより後のレースの結果を使うことはない(リークしない)ので、
+    学習データにも当日の予想にも同じ表を使える
+
+    Examples:
+        store = HistoryFeatureStore.from_dataset()
+        store.save(HISTORY_FEATURES_DIR)
+
+        df = load_race_results(filters=[('year', '==', 2019)])
+        df = HistoryFeatureStore.load(HISTORY_FEATURES_DIR).join(df)
+"""
+import os
+import shutil
+import tempfile
+from typing import Any, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from constants import HISTORY_FEATURES_DIR
+from keiba_machine_learning.netkeiba.constants import RACE_RESULTS_DATASET_DIR
+from keiba_machine_learning.netkeiba.datasets import load_race_results
+
+# 成績を計算するのに使う列
+HISTORY_COLUMNS = [
+    'starts_at', 'horse_id', 'jockey_id', 'track_kind', 'race_distance_by_meter', 'track_surface',
+    'order_of_placing', 'race_time',
+]
+# 並べ替え・結合に使う列(各表はこの列の順に並んでいる)
+ORDER_COLUMN = 'starts_at'
+# 平均タイムを計算する条件(芝・ダート, 距離, 馬場状態)
+COURSE_COLUMNS = ['track_kind', 'race_distance_by_meter', 'track_surface']
+
+# 各表のファイル名と結合に使う列
+_TABLES = (
+    ('horses', ['horse_id']),
+    ('jockeys', ['jockey_id']),
+    ('horse_courses', ['horse_id'] + COURSE_COLUMNS),
+)
+
+
+class HistoryFeatureStore:
+    """ 馬・騎手ごとの累積の成績を発走日時の順に並べた表を持ち、レースに結合する """
+
+    def __init__(self, horses: pd.DataFrame, jockeys: pd.DataFrame, horse_courses: pd.DataFrame,
+                 last_n: int) -> None:
+        """
+        Args:
+            horses (pd.DataFrame): 馬ごとの成績(build で作ったもの)
+            jockeys (pd.DataFrame): 騎手ごとの成績
+            horse_courses (pd.DataFrame): 馬・条件ごとの平均タイム
+            last_n (int): 直近何走の着順を持っているか
+        """
+        self.horses = horses
+        self.jockeys = jockeys
+        self.horse_courses = horse_courses
+        self.last_n = last_n
+
+    @staticmethod
+    def build(df: pd.DataFrame, last_n: int = 5) -> 'HistoryFeatureStore':
+        """
+        Args:
+            df (pd.DataFrame): HISTORY_COLUMNS を含むレース結果(1頭1行)
+            last_n (int): 直近何走の着順を特徴量にするか
+
+        Returns:
+            HistoryFeatureStore
+        """
+        # groupby().shift() が発走日時の順になるように並べておく
+        df = _normalize(df[HISTORY_COLUMNS]).sort_values(ORDER_COLUMN, kind='stable').reset_index(drop=True)
+        df['win'] = (df['order_of_placing'] == 1).astype(np.int32)
+        df['placed'] = df['order_of_placing'].notna().astype(np.int32)
+        df['has_race_time'] = df['race_time'].notna().astype(np.int32)
+        df['race_time'] = df['race_time'].astype(np.float64)
+
+        horses = _cumulative(df, ['horse_id'], ['win', 'placed'])
+        horses['win_rate'] = horses['win'] / horses['placed'].where(horses['placed'] > 0)
+        grouped = df.groupby('horse_id', sort=False)
+        for k in range(last_n):
+            horses[f'last_placing_{k + 1}'] = grouped['order_of_placing'].shift(k).loc[horses.index].astype(np.float32)
+        horses = horses.rename(columns={'win': 'win_count', 'placed': 'placed_count'})
+
+        jockeys = _cumulative(df, ['jockey_id'], ['win', 'placed'])
+        jockeys['win_rate'] = jockeys['win'] / jockeys['placed'].where(jockeys['placed'] > 0)
+        jockeys = jockeys.rename(columns={'win': 'win_count', 'placed': 'placed_count'})
+
+        df['race_time_sum'] = df['race_time'].fillna(0.0)
+        horse_courses = _cumulative(df, ['horse_id'] + COURSE_COLUMNS, ['race_time_sum', 'has_race_time'])
+        horse_courses['average_race_time'] = (
+            horse_courses['race_time_sum'] / horse_courses['has_race_time'].where(horse_courses['has_race_time'] > 0))
+        horse_courses = horse_courses.drop(columns=['race_time_sum', 'has_race_time', 'race_count'])
+
+        return HistoryFeatureStore(_sort(horses), _sort(jockeys), _sort(horse_courses), last_n)
+
+    @staticmethod
+    def from_dataset(directory: str = RACE_RESULTS_DATASET_DIR,
+                     filters: Optional[List[Tuple[str, str, Any]]] = None,
+                     last_n: int = 5) -> 'HistoryFeatureStore':
+        """ データセットの必要な列だけを読み込んで作る """
+        return HistoryFeatureStore.build(load_race_results(HISTORY_COLUMNS, filters, directory), last_n)
+
+    def feature_names(self) -> List[str]:
+        """ join で追加される列 """
+        return ([f'horse_{column}' for column in self._value_columns(self.horses, ['horse_id'])]
+                + [f'jockey_{column}' for column in self._value_columns(self.jockeys, ['jockey_id'])]
+                + ['horse_average_race_time'])
+
+    def join(self, df: pd.DataFrame) -> pd.DataFrame:
+        """ 各行のレースの発走日時より前の成績を列として追加する
+
+            成績がない(初出走など)場合、出走数・勝利数は 0、それ以外は NaN になる
+
+        Args:
+            df (pd.DataFrame): starts_at, horse_id, jockey_id と COURSE_COLUMNS を含むもの(データセット・当日の出走表のどちらでもよい)
+
+        Returns:
+            pd.DataFrame: df に feature_names() の列を追加したもの(行の順番は変わらない)
+        """
+        left = _normalize(df[[ORDER_COLUMN, 'horse_id', 'jockey_id'] + COURSE_COLUMNS])
+        left[ORDER_COLUMN] = left[ORDER_COLUMN].astype(self.horses[ORDER_COLUMN].dtype)
+        left['row'] = np.arange(len(left))
+        # merge_asof は結合に使う列(発走日時)で並んでいる必要がある
+        left = left.sort_values(ORDER_COLUMN, kind='stable')
+
+        for (name, by), prefix in zip(_TABLES, ('horse_', 'jockey_', 'horse_')):
+            right: pd.DataFrame = getattr(self, name)
+            right = right.rename(columns={column: prefix + column for column in self._value_columns(right, by)})
+            # 同じ発走日時の結果(そのレース自身や同時刻に発走した別の競馬場のレース)は使わない
+            left = pd.merge_asof(left, right, on=ORDER_COLUMN, by=by, allow_exact_matches=False)
+
+        left = left.sort_values('row')
+        result = df.copy()
+        for column in self.feature_names():
+            values = left[column].to_numpy()
+            if column.endswith('_count'):
+                values = np.nan_to_num(values.astype(np.float64), nan=0.0).astype(np.int32)
+            result[column] = values
+        return result
+
+    def save(self, directory: str = HISTORY_FEATURES_DIR) -> None:
+        """ 表ごとに Parquet で保存する(書き込み途中の状態が残らないように一時ディレクトリに書いてから置き換える) """
+        parent = os.path.dirname(os.path.abspath(directory))
+        os.makedirs(parent, exist_ok=True)
+        temp_dir = tempfile.mkdtemp(dir=parent)
+        try:
+            for name, _ in _TABLES:
+                table = pa.Table.from_pandas(getattr(self, name), preserve_index=False)
+                table = table.replace_schema_metadata({**(table.schema.metadata or {}), b'last_n': str(self.last_n).encode()})
+                pq.write_table(table, os.path.join(temp_dir, f'{name}.parquet'))
+            if os.path.exists(directory):
+                shutil.rmtree(directory)
+            os.replace(temp_dir, directory)
+        except BaseException:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            raise
+
+    @staticmethod
+    def load(directory: str = HISTORY_FEATURES_DIR) -> 'HistoryFeatureStore':
+        tables = {name: pq.read_table(os.path.join(directory, f'{name}.parquet')) for name, _ in _TABLES}
+        last_n = int(tables['horses'].schema.metadata[b'last_n'])
+        return HistoryFeatureStore(last_n=last_n, **{name: table.to_pandas() for name, table in tables.items()})
+
+    @staticmethod
+    def _value_columns(table: pd.DataFrame, by: Sequence[str]) -> List[str]:
+        return [column for column in table.columns if column != ORDER_COLUMN and column not in by]
+
+
+def _normalize(df: pd.DataFrame) -> pd.DataFrame:
+    """ 結合に使う列の型を揃える(データセットの jockey_id は辞書型なので文字列にする) """
+    df = df.copy()
+    df['jockey_id'] = df['jockey_id'].astype(str)
+    df['horse_id'] = df['horse_id'].astype(np.int64)
+    for column in COURSE_COLUMNS:
+        df[column] = df[column].astype(np.int64)
+    return df
+
+
+def _cumulative(df: pd.DataFrame, by: List[str], columns: List[str]) -> pd.DataFrame:
+    """ by ごとに発走日時の順で columns を累積した表(各行はそのレースが終わった時点の値) """
+    df = df.sort_values(by + [ORDER_COLUMN], kind='stable')
+    grouped = df.groupby(by, sort=False)
+    result = df[[ORDER_COLUMN] + by].copy()
+    result['race_count'] = (grouped.cumcount() + 1).astype(np.int32)
+    for column in columns:
+        result[column] = grouped[column].cumsum()
+    return result
+
+
+def _sort(df: pd.DataFrame) -> pd.DataFrame:
+    """ merge_asof で使えるように発走日時の順に並べる """
+    return df.sort_values([ORDER_COLUMN], kind='stable').reset_index(drop=True)
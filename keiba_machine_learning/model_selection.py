@@ -0,0 +1,180 @@
+"""訓練データとテストデータの分け方
+
+    行単位でランダムに分けると同じレースの馬が訓練データとテストデータの両方に入ってしまい、
+    実際の予想(過去のレースで学習して未来のレースを予想する)よりも良い結果になってしまうので、
+    レース単位・時系列順に分ける
+
+    レースの日付はレースIDに含まれる 年・回・日目 で近似する
+    (回・日目は競馬場ごとの連番なので、同じ年の異なる競馬場の間の前後関係は厳密ではない)
+
+    いずれも行番号(整数の配列)を返すだけなので、分割ごとに特徴量の行列をコピーすることはない
+
+    Examples:
+        train_indices, test_indices = race_grouped_train_test_split(race_ids, test_size=0.3)
+
+        splitter = WalkForwardSplit(n_splits=5, train_size=3)  # 直近3年で学習して次の1年を予想する、を5年分
+        for train_indices, test_indices in splitter.split(x, groups=race_ids):
+            model.fit(x[train_indices], y[train_indices])
+"""
+from typing import Any, Iterator, Optional, Tuple
+
+import numpy as np
+
+from keiba_machine_learning.models import Race
+from keiba_machine_learning.netkeiba import race_ids as race_id_codec
+
+PERIODS = ('year', 'series', 'day')
+
+
+def period_keys(race_ids: np.ndarray, period: str = 'day') -> np.ndarray:
+    """ レースIDから時系列順に並べるためのキーを作る
+
+    Args:
+        race_ids (np.ndarray): レースID
+        period (str): キーの単位(year: 年, series: 年・回, day: 年・回・日目)
+
+    Returns:
+        np.ndarray: 同じ期間のレースは同じ値、後の期間ほど大きい値になる
+    """
+    if period not in PERIODS:
+        raise ValueError(f"period must be one of {PERIODS}.")
+
+    year, _, series_number, day_number, _ = race_id_codec.decode(np.asarray(race_ids, dtype=np.int64))
+
+    if period == 'year':
+        return year
+    if period == 'series':
+        return year * (Race.MAX_SERIES_NUMBER + 1) + series_number
+    return (year * (Race.MAX_SERIES_NUMBER + 1) + series_number) * (Race.MAX_DAY_NUMBER + 1) + day_number
+
+
+def train_period_cutoff(race_ids: np.ndarray, test_size: float = 0.3, period: str = 'day') -> int:
+    """ race_grouped_train_test_split で訓練データにする最後の期間のキー(period_keys の値)
+
+        データセットをチャンクごとに読み込む場合は、全体のレースIDでこれを一度だけ求めて各チャンクの行を
+        period_keys(race_ids, period) <= cutoff かどうかで分ければ、チャンクをまたいでも同じレースが両方に入ることはない
+
+    Args:
+        race_ids (np.ndarray): レースID(各行のものでも、重複を除いたものでもよい)
+        test_size (float): テストデータにするレースの割合の目安
+        period (str): 区切りの単位(period_keys を参照)
+
+    Returns:
+        int: この値以下の期間が訓練データ、それより後の期間がテストデータになる
+
+    Raises:
+        ValueError: 期間が1つしかない場合
+    """
+    if not 0 < test_size < 1:
+        raise ValueError("test_size must be between 0 and 1.")
+
+    keys = period_keys(race_ids, period)
+    unique_keys, race_counts = _race_counts_by_period(np.asarray(race_ids), keys)
+    if len(unique_keys) < 2:
+        raise ValueError("at least 2 periods are required to split.")
+
+    # 訓練データのレース数の割合が (1 - test_size) を超えない最後の期間までを訓練データにする
+    # (どちらも少なくとも1期間は含める)
+    cumulative = np.cumsum(race_counts) / race_counts.sum()
+    train_period_count = int(np.searchsorted(cumulative, 1 - test_size, side='right'))
+    train_period_count = min(max(train_period_count, 1), len(unique_keys) - 1)
+    return int(unique_keys[train_period_count - 1])
+
+
+def race_grouped_train_test_split(race_ids: np.ndarray, test_size: float = 0.3,
+                                  period: str = 'day') -> Tuple[np.ndarray, np.ndarray]:
+    """ 後の期間のレースがテストデータになるように分ける(同じ期間のレースはどちらか一方にだけ入る)
+
+        何度実行しても同じ結果になる
+
+    Args:
+        race_ids (np.ndarray): 各行のレースID
+        test_size (float): テストデータにするレースの割合の目安(期間の境目で区切るのでぴったりにはならない)
+        period (str): 区切りの単位(period_keys を参照)
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: 訓練データとテストデータの行番号(それぞれ昇順)
+
+    Raises:
+        ValueError: 期間が1つしかない場合
+    """
+    cutoff = train_period_cutoff(race_ids, test_size, period)
+    is_train = period_keys(race_ids, period) <= cutoff
+    return np.flatnonzero(is_train), np.flatnonzero(~is_train)
+
+
+class WalkForwardSplit:
+    """ 期間を1つずつずらしながら「過去の期間で学習して次の期間を予想する」分け方を作る(ローリング方式のバックテスト)
+
+        scikit-learn の交差検証の分け方と同じインターフェースで、groups にレースIDを渡す
+        (cross_val_score(model, x, y, groups=race_ids, cv=WalkForwardSplit()) のように使える)
+    """
+
+    def __init__(self, n_splits: int = 5, period: str = 'year', test_size: int = 1,
+                 train_size: Optional[int] = None, gap: int = 0) -> None:
+        """
+        Args:
+            n_splits (int): 分割数(最後の n_splits × test_size 期間がテストデータになる)
+            period (str): 期間の単位(period_keys を参照)
+            test_size (int): 1回のテストデータにする期間数
+            train_size (Optional[int]): 訓練データにする直前の期間数(省略時はそれより前の全期間)
+            gap (int): 訓練データとテストデータの間に空ける期間数
+        """
+        if n_splits < 1 or test_size < 1 or gap < 0 or (train_size is not None and train_size < 1):
+            raise ValueError("invalid split sizes.")
+        if period not in PERIODS:
+            raise ValueError(f"period must be one of {PERIODS}.")
+
+        self.n_splits = n_splits
+        self.period = period
+        self.test_size = test_size
+        self.train_size = train_size
+        self.gap = gap
+
+    def get_n_splits(self, X: Any = None, y: Any = None, groups: Any = None) -> int:
+        return self.n_splits
+
+    def split(self, X: Any = None, y: Any = None,
+              groups: Optional[np.ndarray] = None) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Args:
+            X, y: scikit-learn との互換性のための引数(使わない)
+            groups (np.ndarray): 各行のレースID
+
+        Raises:
+            ValueError: 期間が足りない場合
+
+        Returns:
+            Iterator[Tuple[np.ndarray, np.ndarray]]: 訓練データとテストデータの行番号(それぞれ昇順)
+        """
+        if groups is None:
+            raise ValueError("groups (race IDs of each row) is required.")
+
+        keys = period_keys(groups, self.period)
+        # 期間順に並べた行番号を一度だけ作り、各分割ではその連続した範囲を切り出す
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        unique_keys = np.unique(sorted_keys)
+        starts = np.searchsorted(sorted_keys, unique_keys, side='left')
+        ends = np.searchsorted(sorted_keys, unique_keys, side='right')
+
+        period_count = len(unique_keys)
+        first_test_period = period_count - self.n_splits * self.test_size
+        if first_test_period - self.gap < 1:
+            raise ValueError(f"{period_count} periods are not enough for {self.n_splits} splits.")
+
+        for split_index in range(self.n_splits):
+            test_start = first_test_period + split_index * self.test_size
+            test_end = test_start + self.test_size
+            train_end = test_start - self.gap
+            train_start = 0 if self.train_size is None else max(train_end - self.train_size, 0)
+
+            train_indices = np.sort(order[starts[train_start]:ends[train_end - 1]])
+            test_indices = np.sort(order[starts[test_start]:ends[test_end - 1]])
+            yield train_indices, test_indices
+
+
+def _race_counts_by_period(race_ids: np.ndarray, keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """ 期間ごとのレース数(行数ではなく) """
+    _, first_rows = np.unique(race_ids, return_index=True)
+    return np.unique(keys[first_rows], return_counts=True)
@@ -1,8 +1,77 @@
 from enum import Enum
+from typing import Dict, Generic, Iterable, List, Optional, Type, TypeVar
 from pydantic import Field
 from pydantic.dataclasses import dataclass
 import datetime
 
+import numpy as np
+import pandas as pd
+
+E = TypeVar('E', bound=Enum)
+
+
+class CodeTable(Generic[E]):
+    """ netkeiba のページ上の表記(「東京」「芝」「牡」など)と Enum・整数コード(Enum の値)の対応表
+
+        モジュールの読み込み時に一度だけ作り、スクレイピング時は1行ごとに辞書を引くだけにする
+        列全体(numpy 配列・pandas の Series)をまとめてコードに変換することもできる
+    """
+
+    def __init__(self, enum: Type[E], names_indexed_by_mark: Dict[str, str]) -> None:
+        """
+        Args:
+            enum (Type[E]): 対応する Enum
+            names_indexed_by_mark (Dict[str, str]): 表記 → Enum のメンバー名
+        """
+        self.enum = enum
+        self.members_indexed_by_mark: Dict[str, E] = {
+            mark: enum[name] for mark, name in names_indexed_by_mark.items()}
+        self.codes_indexed_by_mark: Dict[str, int] = {
+            mark: member.value for mark, member in self.members_indexed_by_mark.items()}
+        # まとめて変換する場合は表記の位置 → コードの配列で引く
+        self._marks = pd.Index(list(self.codes_indexed_by_mark))
+        self._codes = np.array(list(self.codes_indexed_by_mark.values()), dtype=np.int8)
+
+    def member(self, mark: str) -> E:
+        """
+        Raises:
+            KeyError: 未知の表記の場合
+        """
+        return self.members_indexed_by_mark[mark]
+
+    def code(self, mark: str) -> int:
+        """
+        Raises:
+            KeyError: 未知の表記の場合
+        """
+        return self.codes_indexed_by_mark[mark]
+
+    def codes(self, marks: Iterable[str], missing: Optional[int] = None) -> np.ndarray:
+        """ 表記の列をまとめてコードに変換する
+
+        Args:
+            marks (Iterable[str]): 表記の配列
+            missing (Optional[int]): 未知の表記の場合のコード(省略時は例外を送出する)
+
+        Returns:
+            np.ndarray: int8 のコード
+
+        Raises:
+            KeyError: missing を省略していて未知の表記がある場合
+        """
+        marks = marks if isinstance(marks, (np.ndarray, pd.Series, pd.Index)) else list(marks)
+        positions = self._marks.get_indexer(marks)
+        unknown = positions < 0
+        if unknown.any():
+            if missing is None:
+                raise KeyError(f"unknown marks: {sorted(set(np.asarray(marks, dtype=object)[unknown].tolist()))}")
+            return np.where(unknown, missing, self._codes[positions]).astype(np.int8)
+        return self._codes[positions]
+
+    def members(self, codes: Iterable[int]) -> List[E]:
+        """ コードの列を Enum に戻す """
+        return [self.enum(code) for code in np.asarray(codes).tolist()]
+
 
 class RaceTrac(Enum):
     """競馬場に対応するモデル
@@ -23,6 +92,20 @@ class RaceTrac(Enum):
     KOKURA = 10
 
 
+RACE_TRACK_CODES = CodeTable(RaceTrac, {
+    '札幌': 'SAPPORO',
+    '函館': 'HAKODATE',
+    '福島': 'FUKUSHIMA',
+    '新潟': 'NIGATA',
+    '東京': 'TOKYO',
+    '中山': 'NAKAYAMA',
+    '中京': 'CHUKYO',
+    '京都': 'KYOTO',
+    '阪神': 'HANSHIN',
+    '小倉': 'KOKURA',
+})
+
+
 class RaceTracFactory:
     @staticmethod
     def create(race_track_name: str) -> RaceTrac:
@@ -34,19 +117,7 @@ class RaceTracFactory:
         Returns:
             RaceTrac: 
         """
-        NAMES_INDEXED_BY_MARK_STR = {
-            '札幌': 'SAPPORO',
-            '函館': 'HAKODATE',
-            '福島': 'FUKUSHIMA',
-            '新潟': 'NIGATA',
-            '東京': 'TOKYO',
-            '中山': 'NAKAYAMA',
-            '中京': 'CHUKYO',
-            '京都': 'KYOTO',
-            '阪神': 'HANSHIN',
-            '小倉': 'KOKURA',
-        }
-        return RaceTrac[NAMES_INDEXED_BY_MARK_STR[race_track_name]]
+        return RACE_TRACK_CODES.member(race_track_name)
 
 
 @dataclass
@@ -82,6 +153,16 @@ class Weather(Enum):
     SNOW = 6
 
 
+WEATHER_CODES = CodeTable(Weather, {
+    '曇': 'CLOUD',
+    '晴': 'FINE',
+    '雨': 'RAIN',
+    '小雨': 'LIGHT_RAIN',
+    '小雪': 'LIGHT_SNOW',
+    '雪': 'SNOW',
+})
+
+
 class WeatherFactory:
     @staticmethod
     def create(weather_name: str) -> Weather:
@@ -93,15 +174,7 @@ class WeatherFactory:
         Returns:
             Weather: 
         """
-        NAMES_INDEXED_BY_MARK_STR = {
-            '曇': 'CLOUD',
-            '晴': 'FINE',
-            '雨': 'RAIN',
-            '小雨': 'LIGHT_RAIN',
-            '小雪': 'LIGHT_SNOW',
-            '雪': 'SNOW',
-        }
-        return Weather[NAMES_INDEXED_BY_MARK_STR[weather_name]]
+        return WEATHER_CODES.member(weather_name)
 
 
 class TrackDirection(Enum):
@@ -109,6 +182,12 @@ class TrackDirection(Enum):
     RIGHT = 2
 
 
+TRACK_DIRECTION_CODES = CodeTable(TrackDirection, {
+    '左': 'LEFT',
+    '右': 'RIGHT',
+})
+
+
 class TrackDirectionFactory:
     @staticmethod
     def create(track_direction_name: str) -> TrackDirection:
@@ -120,11 +199,7 @@ class TrackDirectionFactory:
         Returns:
             TrackDirection: 
         """
-        NAMES_INDEXED_BY_MARK_STR = {
-            '左': 'LEFT',
-            '右': 'RIGHT',
-        }
-        return TrackDirection[NAMES_INDEXED_BY_MARK_STR[track_direction_name]]
+        return TRACK_DIRECTION_CODES.member(track_direction_name)
 
 
 class TrackKind(Enum):
@@ -133,6 +208,15 @@ class TrackKind(Enum):
     JUMP = 3
 
 
+TRACK_KIND_CODES = CodeTable(TrackKind, {
+    '芝': 'GRASS',
+    'ダート': 'DIRT',
+    'ダ': 'DIRT',
+    '障害': 'JUMP',
+    '障': 'JUMP',
+})
+
+
 class TrackKindFactory:
     @staticmethod
     def create(track_kind_name: str) -> TrackKind:
@@ -144,14 +228,7 @@ class TrackKindFactory:
         Returns:
             TrackKind: 
         """
-        NAMES_INDEXED_BY_MARK_STR = {
-            '芝': 'GRASS',
-            'ダート': 'DIRT',
-            'ダ': 'DIRT',
-            '障害': 'JUMP',
-            '障': 'JUMP',
-        }
-        return TrackKind[NAMES_INDEXED_BY_MARK_STR[track_kind_name]]
+        return TRACK_KIND_CODES.member(track_kind_name)
 
 
 class TrackSurface(Enum):
@@ -161,6 +238,14 @@ class TrackSurface(Enum):
     SOFT = 4  # 同じくダートだと "Sloppy" らしいが芝の用語だけを使う
 
 
+TRACK_SURFACE_CODES = CodeTable(TrackSurface, {
+    '良': 'GOOD_TO_FIRM',
+    '稍重': 'GOOD',
+    '重': 'YIELDING',
+    '不良': 'SOFT',
+})
+
+
 class TrackSurfaceFactory:
     @staticmethod
     def create(track_surface_name: str) -> TrackSurface:
@@ -172,13 +257,7 @@ class TrackSurfaceFactory:
         Returns:
             TrackSurface: 
         """
-        NAMES_INDEXED_BY_MARK_STR = {
-            '良': 'GOOD_TO_FIRM',
-            '稍重': 'GOOD',
-            '重': 'YIELDING',
-            '不良': 'SOFT',
-        }
-        return TrackSurface[NAMES_INDEXED_BY_MARK_STR[track_surface_name]]
+        return TRACK_SURFACE_CODES.member(track_surface_name)
 
 
 class HorseGender(Enum):
@@ -187,6 +266,13 @@ class HorseGender(Enum):
     CASTRATED = 3
 
 
+HORSE_GENDER_CODES = CodeTable(HorseGender, {
+    '牡': 'MALE',
+    '牝': 'FEMALE',
+    'セ': 'CASTRATED',
+})
+
+
 class HorseGenderFactory:
     @staticmethod
     def create(gender_string: str) -> HorseGender:
@@ -199,9 +285,4 @@ class HorseGenderFactory:
         Returns:
             HorseGender
         """
-        NAMES_INDEXED_BY_MARK_STR = {
-            '牡': 'MALE',
-            '牝': 'FEMALE',
-            'セ': 'CASTRATED',
-        }
-        return HorseGender[NAMES_INDEXED_BY_MARK_STR[gender_string]]
+        return HORSE_GENDER_CODES.member(gender_string)
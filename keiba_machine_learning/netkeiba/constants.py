@@ -5,3 +5,6 @@ DATABASE_PAGE_BASE_URL = "https://db.netkeiba.com"
 ENCODING_OF_WEB_PAGE = "EUC-JP"
 
 RACE_DATA_DIR = os.path.join(DATA_DIR, "netkeiba", "race")
+RACE_ARCHIVE_DIR = os.path.join(DATA_DIR, "netkeiba", "race_archive")
+RACE_MANIFEST_FILE_PATH = os.path.join(DATA_DIR, "netkeiba", "race_manifest.sqlite3")
+RACE_RESULTS_DATASET_DIR = os.path.join(DATA_DIR, "netkeiba", "race_results")
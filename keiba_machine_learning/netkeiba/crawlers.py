@@ -0,0 +1,153 @@
+"""開催カレンダーに沿ってレースページを探索しながらダウンロードするモジュール
+
+    レースIDは 年 × 競馬場 × 回 × 日目 × レース番号 の組み合わせなので総当たりすると1年あたり 8,400 件になるが、
+    実際に開催されているのはその一部でしかない
+    (netkeiba はデータが存在しないページでも 200 で空のページを返すので、取得してみないと判別できない)
+
+    開催は「回」「日目」ともに1から連番で行われるので、以下のように探索を打ち切る
+
+    - 各(競馬場, 回, 日目)についてまず1レース目だけを取得する
+    - 1レース目が空ならその日は開催がないとみなして残りのレースは取得しない
+    - 開催がない日があればそれ以降の日目は探索しない
+    - 1日目から開催がない回があればそれ以降の回は探索しない
+"""
+import asyncio
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, List, Optional
+
+from keiba_machine_learning.models import RaceTrac
+from keiba_machine_learning.netkeiba.downloaders import DownloadFailed, DownloadSession, RacePageDownloader
+from keiba_machine_learning.netkeiba.manifests import PageStatus
+from keiba_machine_learning.netkeiba.models import Race
+from keiba_machine_learning.netkeiba.scrapers import has_race_result
+
+
+@dataclass
+class CrawlResult:
+    found_races: List[Race] = field(default_factory=list)  # レース結果が存在したレース
+    failed_races: List[Race] = field(default_factory=list)  # リトライしても取得できなかったレース
+    request_count: int = 0
+
+
+class RaceCalendarCrawler:
+    """ 開催がない日・回を見つけた時点で探索を打ち切りながらレースページをダウンロードする
+
+        レース結果が存在しないページは保存しない
+        ダウンローダーにマニフェストが指定されていれば、取得済みかどうかはマニフェストで判断する
+
+    Examples:
+        crawler = RaceCalendarCrawler(RacePageDownloader(requests_per_second=2.0))
+        result = crawler.run(2019)
+    """
+
+    def __init__(self, downloader: RacePageDownloader) -> None:
+        self.downloader = downloader
+
+    def run(self, year: int,
+            race_tracks: Iterable[RaceTrac] = RaceTrac,
+            on_done: Optional[Callable[[Race], None]] = None) -> CrawlResult:
+        """ crawl の同期版 """
+        return asyncio.run(self.crawl(year, race_tracks=race_tracks, on_done=on_done))
+
+    async def crawl(self, year: int,
+                    race_tracks: Iterable[RaceTrac] = RaceTrac,
+                    on_done: Optional[Callable[[Race], None]] = None) -> CrawlResult:
+        """
+        Args:
+            year (int): 対象の年
+            race_tracks (Iterable[RaceTrac]): 対象の競馬場(競馬場ごとに並行に探索する)
+            on_done (Optional[Callable[[Race], None]]): 1レース処理する度に呼ばれる(進捗表示用)
+
+        Returns:
+            CrawlResult
+        """
+        result = CrawlResult()
+        async with self.downloader.session() as session:
+            await asyncio.gather(*[self._crawl_race_track(session, result, year, race_track, on_done)
+                                   for race_track in race_tracks])
+
+        result.found_races.sort(key=lambda race: race.id)
+        result.failed_races.sort(key=lambda race: race.id)
+        return result
+
+    async def _crawl_race_track(self, session: DownloadSession, result: CrawlResult,
+                                year: int, race_track: RaceTrac,
+                                on_done: Optional[Callable[[Race], None]]) -> None:
+        for series_number in range(1, Race.MAX_SERIES_NUMBER + 1):
+            held_day_count = await self._crawl_series(session, result, year, race_track, series_number, on_done)
+            if held_day_count == 0:
+                # 1日目から開催がない回があったらそれ以降の回も開催はない
+                return
+
+    async def _crawl_series(self, session: DownloadSession, result: CrawlResult,
+                            year: int, race_track: RaceTrac, series_number: int,
+                            on_done: Optional[Callable[[Race], None]]) -> int:
+        """
+        Returns:
+            int: 開催がないと判明するまでに探索した日数
+        """
+        for day_number in range(1, Race.MAX_DAY_NUMBER + 1):
+            races = [Race(year=year, race_track=race_track, series_number=series_number,
+                          day_number=day_number, race_number=race_number)
+                     for race_number in range(1, Race.MAX_RACE_NUMBER + 1)]
+
+            exists = await self._fetch(session, result, races[0], on_done)
+            if exists is False:
+                return day_number - 1
+            if exists is None:
+                # 取得に失敗した日は開催の有無が判断できないので、打ち切らずに次の日へ進む
+                continue
+
+            await asyncio.gather(*[self._fetch(session, result, race, on_done) for race in races[1:]])
+
+        return Race.MAX_DAY_NUMBER
+
+    async def _fetch(self, session: DownloadSession, result: CrawlResult,
+                     race: Race, on_done: Optional[Callable[[Race], None]]) -> Optional[bool]:
+        """ レースページを取得し、レース結果が存在すれば保存する
+
+        Returns:
+            Optional[bool]: レース結果が存在すれば True, 存在しなければ False, 取得に失敗したら None
+        """
+        try:
+            exists = self._find_saved(race)
+            if exists is None:
+                result.request_count += 1
+                exists = await session.download(race)
+        except DownloadFailed:
+            result.failed_races.append(race)
+            return None
+        finally:
+            if on_done is not None:
+                on_done(race)
+
+        if exists:
+            result.found_races.append(race)
+        return exists
+
+    def _find_saved(self, race: Race) -> Optional[bool]:
+        """ 取得済みのレースであれば、レース結果が存在するかどうかを返す
+
+            マニフェストがあればそれに従い(データが存在しないとわかっているレースは保存先を見ない。
+            ただし記録が古くなっている場合(CrawlManifest.is_expired)は未取得として扱う)、
+            なければ保存済みのページの内容から判定する
+
+        Returns:
+            Optional[bool]: レース結果が存在すれば True, 存在しなければ False, 未取得なら None
+        """
+        manifest = self.downloader.manifest
+        if manifest is not None:
+            entry = manifest.get(race.id)
+            if entry is None or entry.status == PageStatus.FAILED:
+                return None
+            if entry.status == PageStatus.EMPTY:
+                return None if manifest.is_expired(entry) else False
+            if entry.status == PageStatus.INCOMPATIBLE or manifest.verify(race, store=self.downloader.store):
+                # 対象外のレースでも開催はされているので「存在する」として探索を続ける
+                return True
+            return None
+
+        store = self.downloader.store
+        if race.id not in store:
+            return None
+        return has_race_result(store.read(race.id))
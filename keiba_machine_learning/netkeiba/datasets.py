@@ -0,0 +1,460 @@
+"""スクレイピング結果のデータセットの管理
+
+    データセットは年・競馬場ごとに分けた Parquet ファイルとして保存する
+    ({directory}/year={year}/race_track={race_track}/part-0.parquet)
+
+    - 列ごとに型を決めている(列挙型は int8、馬名・騎手は辞書エンコードした文字列(pandas では category)、オッズ・斤量などは float32)
+    - load_race_results で必要な列・年・競馬場だけを読み込める
+
+    また、毎回全ページをスクレイピングし直すと時間がかかるので、
+    「どのレースをどの状態のページからスクレイピングしたか」を {directory}/_state.json に記録しておき、
+    追加・変更されたページだけをスクレイピングして、そのレースを含むファイルだけを書き直す
+
+    Examples:
+        plan = plan_update(race_ids, store)
+        chunks = iter_scraped_chunks(plan.scraping_race_ids, store=store)
+        apply_update(plan, (chunk.columns for chunk in chunks))
+
+        df = load_race_results(columns=['race_id', 'horse_id', 'order_of_placing'],
+                               filters=[('year', '>=', 2015), ('race_track', '=', RaceTrac.TOKYO.value)])
+"""
+import hashlib
+import json
+import os
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from keiba_machine_learning.netkeiba.constants import RACE_RESULTS_DATASET_DIR
+from keiba_machine_learning.netkeiba.instrumentation import stage
+from keiba_machine_learning.netkeiba.pipelines import COLUMNS
+from keiba_machine_learning.netkeiba.race_ids import race_track_of, year_of
+from keiba_machine_learning.netkeiba.stores import PageStore, get_page_store, write_atomically
+
+# 保存する列とその型(列の順番は pipelines.COLUMNS と同じ)
+SCHEMA = pa.schema([
+    ('race_id', pa.int64()),
+    ('race_track', pa.int8()),
+    ('track_kind', pa.int8()),
+    ('track_direction', pa.int8()),
+    ('race_distance_by_meter', pa.int16()),
+    ('track_surface', pa.int8()),
+    ('weather', pa.int8()),
+    ('race_number', pa.int8()),
+    ('starts_at', pa.timestamp('s')),
+    ('order_of_placing', pa.int8()),
+    ('bracket_number', pa.int8()),
+    ('horse_number', pa.int8()),
+    ('horse_id', pa.int64()),
+    ('horse_name', pa.dictionary(pa.int32(), pa.string())),
+    ('horse_age', pa.int8()),
+    ('horse_gender', pa.int8()),
+    ('impost', pa.float32()),
+    ('jockey_id', pa.dictionary(pa.int32(), pa.string())),
+    ('jockey_name', pa.dictionary(pa.int32(), pa.string())),
+    ('race_time', pa.float32()),
+    ('win_betting_ratio', pa.float32()),
+    ('favorite_order', pa.int8()),
+    ('horse_weight', pa.int16()),
+    ('weight_change', pa.int16()),
+])
+
+# ディレクトリ名で表す列(race_track はファイルには含めない)
+PARTITIONING = ds.partitioning(pa.schema([('year', pa.int16()), ('race_track', pa.int8())]), flavor='hive')
+FILE_SCHEMA = SCHEMA.remove(SCHEMA.get_field_index('race_track'))
+
+STATE_FILE_NAME = '_state.json'  # _ で始まるファイルは pyarrow がデータとして読み込まない
+
+# スクレイピング結果の値が変わる変更をしたら上げる(ページが変わっていなくても作り直すようにする)
+# 2: starts_at をページの開催日・発走時刻から読み取るようにした
+SCRAPER_VERSION = 2
+
+
+class UpdatePlan(NamedTuple):
+    directory: str  # データセットの保存先
+    full: bool  # 既存のデータセットを使わずに作り直すかどうか
+    scraping_race_ids: List[int]  # スクレイピングし直すレース(昇順)
+    removed_race_ids: List[int]  # 保存先から消えたのでデータセットからも取り除くレース
+    fingerprints: Dict[int, str]  # 更新後のデータセットに対応する各ページの状態
+
+
+def partition_path(directory: str, year: int, race_track: int) -> str:
+    # 文字列として並べたときにレースID順になるように競馬場は2桁にする
+    return os.path.join(directory, f'year={year}', f'race_track={race_track:02d}', 'part-0.parquet')
+
+
+def partitions(directory: str = RACE_RESULTS_DATASET_DIR) -> List[Tuple[int, int]]:
+    """
+    Returns:
+        List[Tuple[int, int]]: 保存されている(年, 競馬場)の一覧
+    """
+    result = []
+    if not os.path.isdir(directory):
+        return result
+    for year_directory in os.listdir(directory):
+        if not year_directory.startswith('year='):
+            continue
+        for race_track_directory in os.listdir(os.path.join(directory, year_directory)):
+            if not race_track_directory.startswith('race_track='):
+                continue
+            partition = (int(year_directory.split('=')[1]), int(race_track_directory.split('=')[1]))
+            if os.path.exists(partition_path(directory, *partition)):
+                result.append(partition)
+    return sorted(result)
+
+
+def dataset_version(directory: str = RACE_RESULTS_DATASET_DIR) -> str:
+    """ データセットのファイル構成(年・競馬場、サイズ、更新日時)から作ったハッシュ値
+
+        ファイルが書き直されると変わるので、データセットから作ったもののキャッシュのキーに使える
+    """
+    hash = hashlib.sha256()
+    for year, race_track in partitions(directory):
+        stat = os.stat(partition_path(directory, year, race_track))
+        hash.update(f'{year}/{race_track}:{stat.st_size}:{stat.st_mtime_ns}\n'.encode())
+    return hash.hexdigest()
+
+
+def to_table(columns: Dict[str, np.ndarray]) -> pa.Table:
+    """ スクレイピング結果の列を SCHEMA の型に変換する(値が型に収まらなければ例外を送出する) """
+    return pa.table([pa.array(columns[field.name]).cast(field.type) for field in SCHEMA], schema=SCHEMA)
+
+
+def read_partition(directory: str, year: int, race_track: int) -> Optional[pa.Table]:
+    """
+    Returns:
+        Optional[pa.Table]: race_track 列を含まない FILE_SCHEMA の表(ファイルがなければ None)
+    """
+    file_path = partition_path(directory, year, race_track)
+    if not os.path.exists(file_path):
+        return None
+    return pq.read_table(file_path).cast(FILE_SCHEMA)
+
+
+def remove_partition(directory: str, year: int, race_track: int) -> None:
+    """ 1つの(年, 競馬場)のファイルを削除する(空になった race_track=, year= のディレクトリも削除する) """
+    file_path = partition_path(directory, year, race_track)
+    if not os.path.exists(file_path):
+        return
+    os.remove(file_path)
+    for empty_directory in (os.path.dirname(file_path), os.path.dirname(os.path.dirname(file_path))):
+        try:
+            os.rmdir(empty_directory)
+        except OSError:
+            break
+
+
+class DatasetWriter:
+    """ スクレイピング結果の列を受け取り、batch_size 行溜まるごとに(年, 競馬場)のファイルへ row group として書き出す
+
+        レースID順に渡す必要がある(1つの(年, 競馬場)を書き終えてから次に進む)
+        メモリに載るのは溜めている行と書き直し中の1ファイル分の既存の行だけなので、何年分渡しても使用量は増えない
+
+    Examples:
+        with DatasetWriter(directory, stale_race_ids=plan.scraping_race_ids) as writer:
+            for chunk in iter_scraped_chunks(plan.scraping_race_ids):
+                writer.write(chunk.columns)
+    """
+
+    def __init__(self, directory: str = RACE_RESULTS_DATASET_DIR,
+                 stale_race_ids: Sequence[int] = (),
+                 full: bool = False,
+                 batch_size: int = 50_000) -> None:
+        """
+        Args:
+            directory (str): データセットの保存先
+            stale_race_ids (Sequence[int]): 既存のファイルから取り除くレース(スクレイピングし直したレース・消えたレース)
+            full (bool): True の場合は既存のファイルを引き継がない(書き込まれなかった(年, 競馬場)のファイルは削除する)
+            batch_size (int): 1つの row group にまとめる行数
+        """
+        if batch_size < 1:
+            raise ValueError("batch_size must be positive.")
+
+        self.directory = directory
+        self.full = full
+        self.batch_size = batch_size
+        self._stale_race_ids = pa.array(sorted(stale_race_ids), pa.int64())
+        # 新しい行がなくても書き直す必要がある(年, 競馬場)
+        self._targets = {(year_of(race_id), race_track_of(race_id)) for race_id in stale_race_ids}
+        if full:
+            self._targets |= set(partitions(directory))
+
+        self.written_partitions: List[Tuple[int, int]] = []
+        self._last_race_id = 0
+        self._partition: Optional[Tuple[int, int]] = None
+        self._pending: List[pa.Table] = []
+        self._pending_row_count = 0
+        self._existing: Optional[pa.Table] = None
+        self._parquet_writer: Optional[pq.ParquetWriter] = None
+
+    def __enter__(self) -> 'DatasetWriter':
+        return self
+
+    def __exit__(self, exception_type, *args) -> None:
+        if exception_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write(self, columns: Dict[str, np.ndarray]) -> None:
+        """
+        Args:
+            columns (Dict[str, np.ndarray]): スクレイピング結果の列(ScrapedChunk.columns)
+
+        Raises:
+            ValueError: レースID順になっていない場合
+        """
+        with stage('dataset_write'):
+            self._write(columns)
+
+    def close(self) -> None:
+        """ 書き込み中のファイルを確定させ、新しい行がなかった(年, 競馬場)も書き直す """
+        with stage('dataset_write'):
+            self._finish_partition()
+            for partition in sorted(self._targets - set(self.written_partitions)):
+                self._start_partition(partition)
+                self._finish_partition()
+        self.written_partitions.sort()
+
+    def _write(self, columns: Dict[str, np.ndarray]) -> None:
+        table = to_table(columns)
+        race_ids = table['race_id'].to_numpy()
+        if len(race_ids) == 0:
+            return
+        if race_ids[0] < self._last_race_id or np.any(np.diff(race_ids) < 0):
+            raise ValueError("columns must be written in order of race_id.")
+        self._last_race_id = int(race_ids[-1])
+
+        # レースID順なので同じ(年, 競馬場)の行は連続している
+        partition_keys = year_of(race_ids) * 100 + race_track_of(race_ids)
+        boundaries = [0, *(np.flatnonzero(np.diff(partition_keys)) + 1).tolist(), len(race_ids)]
+        for start, end in zip(boundaries[:-1], boundaries[1:]):
+            partition = (int(year_of(race_ids[start])), int(race_track_of(race_ids[start])))
+            if partition != self._partition:
+                self._finish_partition()
+                self._start_partition(partition)
+
+            self._pending.append(table.slice(start, end - start).drop_columns(['race_track']))
+            self._pending_row_count += end - start
+            if self._pending_row_count >= self.batch_size:
+                self._flush()
+
+    def abort(self) -> None:
+        """ 書き込み中のファイルを破棄する(既存のファイルはそのまま残る) """
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+            os.remove(self._temporary_file_path())
+        self._parquet_writer = None
+        self._partition = None
+
+    def _start_partition(self, partition: Tuple[int, int]) -> None:
+        self._partition = partition
+        self.written_partitions.append(partition)
+        self._existing = None if self.full else read_partition(self.directory, *partition)
+        if self._existing is not None:
+            self._existing = self._existing.filter(
+                pc.invert(pc.is_in(self._existing['race_id'], value_set=self._stale_race_ids)))
+
+    def _flush(self, last: bool = False) -> None:
+        """ 溜めている行を、それまでのレースIDの既存の行と合わせて書き出す """
+        tables = self._pending
+        if self._existing is not None and self._existing.num_rows > 0:
+            if last:
+                tables = [self._existing, *tables]
+                self._existing = None
+            elif tables:
+                mask = pc.less_equal(self._existing['race_id'], tables[-1]['race_id'][-1])
+                tables = [self._existing.filter(mask), *tables]
+                self._existing = self._existing.filter(pc.invert(mask))
+
+        self._pending = []
+        self._pending_row_count = 0
+        if not tables:
+            return
+        # sort_by は安定ソートなので、1レース内の行の順番(結果表の順番)は変わらない
+        table = pa.concat_tables(tables).sort_by('race_id')
+        if table.num_rows == 0:
+            return
+
+        if self._parquet_writer is None:
+            os.makedirs(os.path.dirname(self._temporary_file_path()), exist_ok=True)
+            self._parquet_writer = pq.ParquetWriter(self._temporary_file_path(), FILE_SCHEMA)
+        self._parquet_writer.write_table(table.cast(FILE_SCHEMA), row_group_size=max(self.batch_size, table.num_rows))
+
+    def _finish_partition(self) -> None:
+        if self._partition is None:
+            return
+
+        self._flush(last=True)
+        if self._parquet_writer is None:
+            # 行が1つもなくなった
+            remove_partition(self.directory, *self._partition)
+        else:
+            self._parquet_writer.close()
+            self._parquet_writer = None
+            os.replace(self._temporary_file_path(), partition_path(self.directory, *self._partition))
+        self._partition = None
+        self._existing = None
+
+    def _temporary_file_path(self) -> str:
+        assert self._partition is not None
+        file_path = partition_path(self.directory, *self._partition)
+        return os.path.join(os.path.dirname(file_path), '.part-0.parquet.tmp')
+
+
+def load_race_results(columns: Optional[Sequence[str]] = None,
+                      filters: Optional[List[Tuple[str, str, Any]]] = None,
+                      directory: str = RACE_RESULTS_DATASET_DIR) -> pd.DataFrame:
+    """ データセットを読み込む
+
+        条件に合わない年・競馬場のファイルは開かない
+
+    Args:
+        columns (Optional[Sequence[str]]): 読み込む列(省略時は全て)。year も指定できる
+        filters (Optional[List[Tuple[str, str, Any]]]): pyarrow の形式の条件(例: [('year', '>=', 2015)])。全てを満たす行だけを読み込む
+        directory (str): データセットの保存先
+
+    Returns:
+        pd.DataFrame: レースID順に並んだもの
+    """
+    dataset = ds.dataset(directory, format='parquet', partitioning=PARTITIONING)
+    table = dataset.to_table(columns=list(columns) if columns is not None else COLUMNS,
+                             filter=None if filters is None else pq.filters_to_expression(filters))
+    return table.to_pandas()
+
+
+def iter_race_results(columns: Optional[Sequence[str]] = None,
+                      filters: Optional[List[Tuple[str, str, Any]]] = None,
+                      directory: str = RACE_RESULTS_DATASET_DIR,
+                      batch_size: int = 100_000,
+                      shuffle_seed: Optional[int] = None) -> Iterator[pd.DataFrame]:
+    """ データセットを batch_size 行ずつ読み込む(全体をメモリに載せずに済む)
+
+        小さいファイルの行はまとめるので、最後以外は batch_size 行以上になる
+
+    Args:
+        batch_size (int): 1回に返す行数の目安
+        shuffle_seed (Optional[int]): 指定するとパーティション(年・競馬場)を読む順番をこのシードでシャッフルする
+
+        その他の引数は load_race_results と同じ
+
+    Returns:
+        Iterator[pd.DataFrame]: パーティションの順(年 → 競馬場。shuffle_seed を指定した場合はシャッフルした順)に並んだもの
+                                (パーティションの中はレースID順。どちらも開催日順ではない)
+    """
+    dataset = ds.dataset(directory, format='parquet', partitioning=PARTITIONING)
+    if shuffle_seed is not None:
+        files = np.random.default_rng(shuffle_seed).permutation(dataset.files).tolist()
+        dataset = ds.dataset(files, format='parquet', partitioning=PARTITIONING, partition_base_dir=directory)
+    batches = dataset.to_batches(columns=list(columns) if columns is not None else COLUMNS,
+                                 filter=None if filters is None else pq.filters_to_expression(filters),
+                                 batch_size=batch_size)
+    pending: List[pa.RecordBatch] = []
+    pending_row_count = 0
+    for batch in batches:
+        pending.append(batch)
+        pending_row_count += batch.num_rows
+        if pending_row_count >= batch_size:
+            yield pa.Table.from_batches(pending).to_pandas()
+            pending = []
+            pending_row_count = 0
+    if pending_row_count > 0:
+        yield pa.Table.from_batches(pending).to_pandas()
+
+
+def load_fingerprints(directory: str = RACE_RESULTS_DATASET_DIR) -> Optional[Dict[int, str]]:
+    """ データセットを作った時点の各ページの状態を読み込む
+
+        記録がない場合や、記録したときと列・スクレイピングの処理が変わっている場合は None を返す(作り直しが必要)
+
+    Returns:
+        Optional[Dict[int, str]]: レースID → PageStore.fingerprint の値
+    """
+    try:
+        with open(os.path.join(directory, STATE_FILE_NAME), mode='r') as file:
+            state = json.load(file)
+    except FileNotFoundError:
+        return None
+
+    if state.get('schema') != SCHEMA.to_string() or state.get('scraper_version') != SCRAPER_VERSION:
+        return None
+    return {int(race_id): fingerprint for race_id, fingerprint in state['fingerprints'].items()}
+
+
+def save_fingerprints(fingerprints: Dict[int, str], directory: str = RACE_RESULTS_DATASET_DIR) -> None:
+    state = {
+        'schema': SCHEMA.to_string(),
+        'scraper_version': SCRAPER_VERSION,
+        'fingerprints': {str(race_id): fingerprints[race_id] for race_id in sorted(fingerprints)},
+    }
+    os.makedirs(directory, exist_ok=True)
+    write_atomically(os.path.join(directory, STATE_FILE_NAME), json.dumps(state).encode())
+
+
+def plan_update(race_ids: Sequence[int],
+                store: Optional[PageStore] = None,
+                directory: str = RACE_RESULTS_DATASET_DIR,
+                full: bool = False) -> UpdatePlan:
+    """ 既存のデータセットと保存先のページを比べて、スクレイピングし直すレースを決める
+
+        保存先に存在しないレースは対象から外す
+
+    Args:
+        race_ids (Sequence[int]): データセットに含めるレース
+        store (Optional[PageStore]): 読み込み元(省略時は get_page_store で取得できるもの)
+        directory (str): データセットの保存先
+        full (bool): True の場合は既存のデータセットを使わずに全てスクレイピングし直す
+
+    Returns:
+        UpdatePlan
+    """
+    store = store if store is not None else get_page_store()
+
+    fingerprints: Dict[int, str] = {}
+    for race_id in race_ids:
+        fingerprint = store.fingerprint(race_id)
+        if fingerprint is not None:
+            fingerprints[race_id] = fingerprint
+
+    previous_fingerprints = None if full else load_fingerprints(directory)
+    if previous_fingerprints is None:
+        return UpdatePlan(directory=directory, full=True, scraping_race_ids=sorted(fingerprints),
+                          removed_race_ids=[], fingerprints=fingerprints)
+
+    return UpdatePlan(
+        directory=directory,
+        full=False,
+        scraping_race_ids=sorted(race_id for race_id, fingerprint in fingerprints.items()
+                                 if previous_fingerprints.get(race_id) != fingerprint),
+        removed_race_ids=sorted(set(previous_fingerprints) - set(fingerprints)),
+        fingerprints=fingerprints,
+    )
+
+
+def apply_update(plan: UpdatePlan, column_batches: Iterable[Dict[str, np.ndarray]],
+                 batch_size: int = 50_000) -> List[Tuple[int, int]]:
+    """ スクレイピングし直したレースを含む(年, 競馬場)のファイルだけを書き直す
+
+        データセット → 状態の記録 の順に保存するので、途中で中断しても次回に同じレースがスクレイピングし直されるだけで済む
+
+    Args:
+        plan (UpdatePlan): plan_update の結果
+        column_batches (Iterable[Dict[str, np.ndarray]]): plan.scraping_race_ids をレースID順にスクレイピングした結果の列
+            (iter_scraped_chunks の結果を順に渡せば、全てをメモリに載せずに済む)
+        batch_size (int): 1つの row group にまとめる行数
+
+    Returns:
+        List[Tuple[int, int]]: 書き直した(年, 競馬場)
+    """
+    with DatasetWriter(plan.directory, stale_race_ids=plan.scraping_race_ids + plan.removed_race_ids,
+                       full=plan.full, batch_size=batch_size) as writer:
+        for columns in column_batches:
+            writer.write(columns)
+
+    save_fingerprints(plan.fingerprints, plan.directory)
+    return writer.written_partitions
@@ -0,0 +1,307 @@
+"""netkeibaのレースページを並行にダウンロードするモジュール
+
+    1件ずつ取得して固定でsleepするとレイテンシがそのままスループットの上限になってしまうので、
+    以下の構成で「相手サーバーに対する礼儀(秒間リクエスト数)」だけが律速になるようにしている
+
+    - 接続数に上限のあるコネクションプール(keep-alive で使い回す)
+    - 全体で共有するトークンバケットによる秒間リクエスト数の制限
+    - バックオフ付きのリトライ
+    - 保存先(PageStore)へのアトミックな保存(ディレクトリ形式なら一時ファイルに書いてから rename する)
+
+    レース結果が存在しないページは保存せず、マニフェストが指定されていればそこに記録する
+"""
+import asyncio
+import http.client
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from keiba_machine_learning.netkeiba.constants import DATABASE_PAGE_BASE_URL
+from keiba_machine_learning.netkeiba.instrumentation import get_metrics
+from keiba_machine_learning.netkeiba.manifests import CrawlManifest, PageStatus
+from keiba_machine_learning.netkeiba.models import Race
+from keiba_machine_learning.netkeiba.scrapers import has_race_result
+from keiba_machine_learning.netkeiba.stores import PageStore, get_page_store
+
+# この HTTP ステータスコードの場合は時間を置けば取得できる見込みがあるのでリトライする
+RETRYABLE_STATUS_CODES = frozenset([429, 500, 502, 503, 504])
+
+
+class DownloadFailed(Exception):
+    pass
+
+
+class TokenBucket:
+    """ 秒間リクエスト数を制限するトークンバケット
+
+        トークンは rate 個/秒で補充され、capacity 個まで貯まる
+        capacity を 1 にすると固定間隔でリクエストを送るのと同じ挙動になる
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0) -> None:
+        if rate <= 0:
+            raise ValueError("rate must be positive.")
+        if capacity < 1:
+            raise ValueError("capacity must be greater than or equal to 1.")
+
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """ トークンを1つ消費する(足りない場合は補充されるまで待つ) """
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity,
+                                   self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class ConnectionPool:
+    """ ホストごとに HTTP(S) コネクションを保持して使い回すプール
+
+        request はブロッキングなのでスレッドから呼び出すこと
+        同時に使用されるコネクション数は呼び出し側のスレッド数で制限する
+    """
+
+    def __init__(self, timeout: float = 30.0) -> None:
+        self.timeout = timeout
+        self._idle_connections: Dict[Tuple[str, str], List[http.client.HTTPConnection]] = {}
+        self._lock = threading.Lock()
+
+    def request(self, url: str) -> Tuple[int, bytes]:
+        """
+        Args:
+            url (str): 取得するページのURL
+
+        Returns:
+            Tuple[int, bytes]: HTTPステータスコードとレスポンスボディ
+        """
+        parsed_url = urllib.parse.urlsplit(url)
+        key = (parsed_url.scheme, parsed_url.netloc)
+        path = parsed_url.path or '/'
+        if parsed_url.query:
+            path = f'{path}?{parsed_url.query}'
+
+        connection = self._checkout(key)
+        try:
+            connection.request('GET', path)
+            response = connection.getresponse()
+            body = response.read()
+        except Exception:
+            connection.close()
+            raise
+
+        if response.will_close:
+            connection.close()
+        else:
+            self._checkin(key, connection)
+
+        return response.status, body
+
+    def close(self) -> None:
+        with self._lock:
+            for connections in self._idle_connections.values():
+                for connection in connections:
+                    connection.close()
+            self._idle_connections.clear()
+
+    def _checkout(self, key: Tuple[str, str]) -> http.client.HTTPConnection:
+        with self._lock:
+            connections = self._idle_connections.get(key)
+            if connections:
+                return connections.pop()
+
+        scheme, netloc = key
+        if scheme == 'https':
+            return http.client.HTTPSConnection(netloc, timeout=self.timeout)
+        return http.client.HTTPConnection(netloc, timeout=self.timeout)
+
+    def _checkin(self, key: Tuple[str, str], connection: http.client.HTTPConnection) -> None:
+        with self._lock:
+            self._idle_connections.setdefault(key, []).append(connection)
+
+
+class RacePageDownloader:
+    """ レースページを並行にダウンロードして PageStore に保存する
+
+    Examples:
+        downloader = RacePageDownloader(requests_per_second=2.0, max_connections=4)
+        failed_races = downloader.run(races)
+    """
+
+    def __init__(self,
+                 requests_per_second: float = 1.0,
+                 max_connections: int = 4,
+                 max_retries: int = 3,
+                 backoff_seconds: float = 1.0,
+                 timeout: float = 30.0,
+                 base_url: Optional[str] = None,
+                 manifest: Optional[CrawlManifest] = None,
+                 store: Optional[PageStore] = None) -> None:
+        """
+        Args:
+            requests_per_second (float): 全体での秒間リクエスト数の上限
+            max_connections (int): 同時接続数の上限
+            max_retries (int): 1ページあたりのリトライ回数の上限
+            backoff_seconds (float): リトライ時の待ち時間の初期値(リトライの度に倍になる)
+            timeout (float): 1リクエストあたりのタイムアウト秒数
+            base_url (Optional[str]): 取得先を netkeiba 以外(ローカルのスタブサーバーなど)に差し替える場合に指定する
+            manifest (Optional[CrawlManifest]): 取得結果を記録するマニフェスト
+            store (Optional[PageStore]): 保存先(省略時は get_page_store で取得できるもの)
+        """
+        if max_connections < 1:
+            raise ValueError("max_connections must be positive.")
+
+        self.requests_per_second = requests_per_second
+        self.max_connections = max_connections
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.timeout = timeout
+        self.base_url = base_url
+        self.manifest = manifest
+        self.store = store if store is not None else get_page_store()
+
+    def run(self, races: Iterable[Race], on_done: Optional[Callable[[Race], None]] = None) -> List[Race]:
+        """ download_all の同期版 """
+        return asyncio.run(self.download_all(races, on_done=on_done))
+
+    async def download_all(self, races: Iterable[Race], on_done: Optional[Callable[[Race], None]] = None) -> List[Race]:
+        """
+        Args:
+            races (Iterable[Race]): ダウンロード対象のレース
+            on_done (Optional[Callable[[Race], None]]): 1レース処理する度に呼ばれる(進捗表示用)
+
+        Returns:
+            List[Race]: リトライしても取得できなかったレース
+        """
+        async with self.session() as session:
+            async def download(race: Race) -> Optional[Race]:
+                try:
+                    await session.download(race)
+                    return None
+                except DownloadFailed:
+                    return race
+                finally:
+                    if on_done is not None:
+                        on_done(race)
+
+            results = await asyncio.gather(*[download(race) for race in races])
+
+        return [race for race in results if race is not None]
+
+    def session(self) -> 'DownloadSession':
+        return DownloadSession(self)
+
+    def url_of(self, race: Race) -> str:
+        if self.base_url is None:
+            return race.url
+        return race.url.replace(DATABASE_PAGE_BASE_URL, self.base_url, 1)
+
+
+class DownloadSession:
+    """ トークンバケット・コネクションプール・スレッドプールの生存期間を管理する
+
+        asyncio のイベントループに紐づくオブジェクトを持つので、ループの中で async with して使う
+    """
+
+    def __init__(self, downloader: RacePageDownloader) -> None:
+        self.downloader = downloader
+        self._bucket = TokenBucket(downloader.requests_per_second)
+        self._semaphore = asyncio.Semaphore(downloader.max_connections)
+        self._pool = ConnectionPool(timeout=downloader.timeout)
+        self._executor = ThreadPoolExecutor(max_workers=downloader.max_connections)
+
+    async def __aenter__(self) -> 'DownloadSession':
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        self._executor.shutdown(wait=True)
+        self._pool.close()
+
+    async def fetch(self, url: str) -> bytes:
+        """
+        Args:
+            url (str): 取得するページのURL
+
+        Raises:
+            DownloadFailed: リトライしても取得できなかった場合
+
+        Returns:
+            bytes: レスポンスボディ
+        """
+        loop = asyncio.get_running_loop()
+        metrics = get_metrics()
+        backoff_seconds = self.downloader.backoff_seconds
+        error: Exception = DownloadFailed(f"{url} could not be downloaded.")
+
+        for attempt in range(self.downloader.max_retries + 1):
+            # トークンを空き接続ができてから取得しないと、待たされている間に貯めたトークンでまとめてリクエストが飛んでしまう
+            async with self._semaphore:
+                await self._bucket.acquire()
+                started_at = time.perf_counter() if metrics is not None else 0.0
+                try:
+                    status, body = await loop.run_in_executor(self._executor, self._pool.request, url)
+                except (OSError, http.client.HTTPException) as e:
+                    error = e
+                    if metrics is not None:
+                        metrics.record_fetch(time.perf_counter() - started_at, 0, succeeded=False)
+                else:
+                    if metrics is not None:
+                        metrics.record_fetch(time.perf_counter() - started_at, len(body), succeeded=status == 200)
+                    if status == 200:
+                        return body
+                    if status not in RETRYABLE_STATUS_CODES:
+                        raise DownloadFailed(f"{url} responded with {status}.")
+                    error = DownloadFailed(f"{url} responded with {status}.")
+
+            if attempt < self.downloader.max_retries:
+                await asyncio.sleep(backoff_seconds)
+                backoff_seconds *= 2
+
+        raise DownloadFailed(f"{url} could not be downloaded.") from error
+
+    async def download(self, race: Race) -> bool:
+        """ レースページを取得し、レース結果が存在すれば保存する
+
+        Raises:
+            DownloadFailed: リトライしても取得できなかった場合
+
+        Returns:
+            bool: レース結果が存在すれば True
+        """
+        manifest = self.downloader.manifest
+        metrics = get_metrics()
+        try:
+            content = await self.fetch(self.downloader.url_of(race))
+        except DownloadFailed:
+            if manifest is not None:
+                manifest.record(race.id, PageStatus.FAILED)
+            if metrics is not None:
+                metrics.increment('fetch_failures')
+            raise
+
+        if not has_race_result(content):
+            if manifest is not None:
+                manifest.record(race.id, PageStatus.EMPTY)
+            if metrics is not None:
+                metrics.increment('pages_empty')
+            return False
+
+        self.downloader.store.write(race.id, content)
+        if metrics is not None:
+            metrics.increment('pages_saved')
+        if manifest is not None:
+            manifest.record(race.id, PageStatus.OK, content)
+        return True
@@ -0,0 +1,251 @@
+"""ダウンロード・スクレイピング・データセットの書き出しの各段階の計測
+
+    夜間のバッチが遅くなったときに、ネットワーク・HTMLのパース・pyarrow(pandas)のどこが原因かを切り分けるためのもの
+    set_metrics で PipelineMetrics を設定すると、downloaders・pipelines・datasets が以下を記録する
+
+    - 取得(HTTPリクエスト)1回ごとのレイテンシ・取得したバイト数・エラー数・リトライしても取得できなかったページ数
+    - 1ページあたりのパース時間・DataNotFound / IncompatibleDataDetected / それ以外の理由で失敗したページ数
+      (そのうちパースせずに判定できたページ数)
+    - 出力した行数・データセットの書き出しにかかった時間
+    - ピーク時のメモリ使用量(複数プロセスで処理した場合は各プロセスのうち最大のもの)
+
+    設定しない場合(デフォルト)は各処理の最初に get_metrics() が None であることを確認するだけなので、ほとんどコストはかからない
+
+    結果は Prometheus のテキスト形式(node_exporter の textfile collector などで取り込める)か JSON で書き出せる
+
+    Examples:
+        metrics = PipelineMetrics()
+        set_metrics(metrics)
+        scrape_race_pages(race_ids, processes=8)
+        metrics.save('metrics.prom')  # 拡張子が .json なら JSON で保存する
+"""
+import bisect
+import json
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+from typing import ContextManager, Dict, Iterator, Optional, Sequence
+
+from prometheus_client import CollectorRegistry, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, HistogramMetricFamily
+
+from keiba_machine_learning.netkeiba.scrapers import DataNotFound, IncompatibleDataDetected
+from keiba_machine_learning.netkeiba.stores import write_atomically
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None  # type: ignore
+
+# Prometheus のメトリクス名の接頭辞
+METRIC_NAME_PREFIX = 'keiba'
+
+# カウンター(名前 → 説明)
+COUNTERS: Dict[str, str] = {
+    'fetch_requests': 'HTTP requests sent (including retries).',
+    'fetch_errors': 'HTTP requests failed by connection errors or non-200 responses.',
+    'fetch_failures': 'Pages that could not be downloaded after retries.',
+    'fetched_bytes': 'Bytes of response bodies downloaded.',
+    'pages_saved': 'Downloaded pages with race results.',
+    'pages_empty': 'Downloaded pages without race results.',
+    'pages_parsed': 'Pages scraped successfully.',
+    'pages_not_found': 'Pages skipped by DataNotFound.',
+    'pages_incompatible': 'Pages skipped by IncompatibleDataDetected.',
+    'parse_failures': 'Pages that could not be scraped for other reasons.',
+    'pages_prefiltered': 'Pages skipped by the byte-level classifier without parsing.',
+    'rows_emitted': 'Rows (one per horse) emitted by scraping.',
+}
+
+# ヒストグラム(名前 → (説明, バケットの上限))
+HISTOGRAMS: Dict[str, tuple] = {
+    'fetch_seconds': ('Latency of each HTTP request.',
+                      (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)),
+    'parse_seconds': ('Time to scrape each page.',
+                      (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)),
+}
+
+
+class Histogram:
+    """ 上限を決めたバケットごとに観測値の数を数える(Prometheus のヒストグラムと同じく、上限ちょうどの値はそのバケットに入る) """
+
+    def __init__(self, buckets: Sequence[float]) -> None:
+        self.buckets = tuple(sorted(buckets))
+        self.bucket_counts = [0] * (len(self.buckets) + 1)  # 最後は上限なし(+Inf)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def merge(self, other: 'Histogram') -> None:
+        if other.buckets != self.buckets:
+            raise ValueError("histograms with different buckets can't be merged.")
+        self.bucket_counts = [count + other_count for count, other_count in zip(self.bucket_counts, other.bucket_counts)]
+        self.count += other.count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def cumulative_counts(self) -> Dict[str, int]:
+        """ バケットの上限 → その値以下の観測値の数 """
+        bounds = [str(bound) for bound in self.buckets] + ['+Inf']
+        counts, total = [], 0
+        for count in self.bucket_counts:
+            total += count
+            counts.append(total)
+        return dict(zip(bounds, counts))
+
+
+class PipelineMetrics:
+    """ 各段階のカウンター・ヒストグラム・所要時間・ピーク時のメモリ使用量を保持する
+
+        記録はイベントループ(ダウンロード)・メインスレッド(スクレイピング)から行うのでロックは取らない
+        別プロセスで記録したものは merge で合算する
+    """
+
+    def __init__(self) -> None:
+        self.counters: Dict[str, int] = {name: 0 for name in COUNTERS}
+        self.histograms: Dict[str, Histogram] = {name: Histogram(buckets) for name, (_, buckets) in HISTOGRAMS.items()}
+        self.stage_seconds: Dict[str, float] = {}
+        self.peak_memory_bytes = 0
+        self.started_at = time.perf_counter()
+
+    def increment(self, name: str, value: int = 1) -> None:
+        self.counters[name] += value
+
+    def observe(self, name: str, value: float) -> None:
+        self.histograms[name].observe(value)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """ with ブロックの所要時間を段階ごとに加算する """
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + time.perf_counter() - started_at
+
+    def record_fetch(self, seconds: float, size: int, succeeded: bool) -> None:
+        """ HTTPリクエスト1回分を記録する """
+        self.counters['fetch_requests'] += 1
+        self.counters['fetched_bytes'] += size
+        if not succeeded:
+            self.counters['fetch_errors'] += 1
+        self.histograms['fetch_seconds'].observe(seconds)
+
+    def record_parse(self, seconds: float, skipped_by: Optional[Exception] = None) -> None:
+        """ ページ1つ分のスクレイピングを記録する
+
+        Args:
+            seconds (float): パースにかかった時間
+            skipped_by (Optional[Exception]): スクレイピングできなかった理由(DataNotFound か IncompatibleDataDetected)
+        """
+        if skipped_by is None:
+            self.counters['pages_parsed'] += 1
+        elif isinstance(skipped_by, DataNotFound):
+            self.counters['pages_not_found'] += 1
+        elif isinstance(skipped_by, IncompatibleDataDetected):
+            self.counters['pages_incompatible'] += 1
+        self.histograms['parse_seconds'].observe(seconds)
+
+    def record_peak_memory(self) -> None:
+        """ このプロセスのこれまでのピーク時のメモリ使用量(最大常駐セットサイズ)を反映する """
+        if resource is None:
+            return
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux は KB、macOS はバイト単位
+        self.peak_memory_bytes = max(self.peak_memory_bytes, max_rss if sys.platform == 'darwin' else max_rss * 1024)
+
+    def merge(self, other: 'PipelineMetrics') -> None:
+        """ 別プロセスで記録したものを合算する(メモリ使用量は大きい方を使う) """
+        for name, value in other.counters.items():
+            self.counters[name] = self.counters.get(name, 0) + value
+        for name, histogram in other.histograms.items():
+            self.histograms[name].merge(histogram)
+        for name, seconds in other.stage_seconds.items():
+            self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + seconds
+        self.peak_memory_bytes = max(self.peak_memory_bytes, other.peak_memory_bytes)
+
+    def to_json(self) -> dict:
+        self.record_peak_memory()
+        return {
+            'elapsed_seconds': time.perf_counter() - self.started_at,
+            'counters': dict(self.counters),
+            'histograms': {name: {
+                'count': histogram.count,
+                'sum': histogram.sum,
+                'mean': histogram.sum / histogram.count if histogram.count else None,
+                'max': histogram.max,
+                'buckets': histogram.cumulative_counts(),
+            } for name, histogram in self.histograms.items()},
+            'stage_seconds': dict(self.stage_seconds),
+            'peak_memory_bytes': self.peak_memory_bytes,
+        }
+
+    def to_prometheus(self) -> bytes:
+        """ Prometheus のテキスト形式 """
+        self.record_peak_memory()
+        registry = CollectorRegistry(auto_describe=False)
+        registry.register(_Collector(self))
+        return generate_latest(registry)
+
+    def save(self, file_path: str) -> None:
+        """ 拡張子が .json なら JSON、それ以外は Prometheus のテキスト形式で保存する
+
+            textfile collector が書き込み途中のファイルを読まないようにアトミックに保存する
+        """
+        if file_path.endswith('.json'):
+            content = json.dumps(self.to_json(), indent=2).encode()
+        else:
+            content = self.to_prometheus()
+        write_atomically(file_path, content)
+
+
+class _Collector:
+    """ PipelineMetrics の値を prometheus_client の形式にする """
+
+    def __init__(self, metrics: PipelineMetrics) -> None:
+        self.metrics = metrics
+
+    def collect(self) -> Iterator:
+        for name, documentation in COUNTERS.items():
+            yield CounterMetricFamily(f'{METRIC_NAME_PREFIX}_{name}', documentation,
+                                      value=self.metrics.counters.get(name, 0))
+
+        for name, (documentation, _) in HISTOGRAMS.items():
+            histogram = self.metrics.histograms[name]
+            yield HistogramMetricFamily(f'{METRIC_NAME_PREFIX}_{name}', documentation,
+                                        buckets=list(histogram.cumulative_counts().items()),
+                                        sum_value=histogram.sum)
+
+        stage_seconds = CounterMetricFamily(f'{METRIC_NAME_PREFIX}_stage_seconds',
+                                            'Wall time spent in each stage.', labels=['stage'])
+        for stage_name, seconds in sorted(self.metrics.stage_seconds.items()):
+            stage_seconds.add_metric([stage_name], seconds)
+        yield stage_seconds
+
+        yield GaugeMetricFamily(f'{METRIC_NAME_PREFIX}_peak_memory_bytes', 'Peak resident set size.',
+                                value=self.metrics.peak_memory_bytes)
+
+
+_metrics: Optional[PipelineMetrics] = None
+
+
+def get_metrics() -> Optional[PipelineMetrics]:
+    """ 記録先を返す(計測しない場合は None) """
+    return _metrics
+
+
+def set_metrics(metrics: Optional[PipelineMetrics]) -> None:
+    """ 記録先を設定する(None を渡すと計測しない) """
+    global _metrics
+    _metrics = metrics
+
+
+def stage(name: str) -> ContextManager:
+    """ 記録先が設定されていれば with ブロックの所要時間を段階 name の時間として加算する """
+    metrics = _metrics
+    return metrics.stage(name) if metrics is not None else nullcontext()
@@ -0,0 +1,208 @@
+"""ダウンロードしたレースページの状態を記録するマニフェスト
+
+    ファイルの有無だけで再開の判断をすると以下の問題があるので、レースIDごとに状態を SQLite に記録する
+
+    - データが存在しないページもファイルとして保存し続けないといけない
+    - クラッシュして途中までしか書き込まれなかったファイルも取得済みとみなされてしまう
+    - スクレイピング時にデータが存在しないページも含めて全ファイルを走査しないといけない
+
+    データが存在しない(EMPTY)ページは、まだ開催されていない・結果が掲載されていないだけのこともあるので、
+    その年が終わる前に取得したものは取得日時から empty_ttl 経過すると再取得の対象にする
+    (年が明けてから取得して EMPTY だったものは開催がなかったとみなし、再取得しない)
+"""
+import hashlib
+import os
+import sqlite3
+from datetime import datetime, timedelta
+from enum import Enum
+from typing import Iterable, List, NamedTuple, Optional
+
+from keiba_machine_learning.netkeiba.constants import RACE_MANIFEST_FILE_PATH
+from keiba_machine_learning.netkeiba.models import Race
+from keiba_machine_learning.netkeiba.race_ids import year_of
+from keiba_machine_learning.netkeiba.scrapers import has_race_result
+from keiba_machine_learning.netkeiba.stores import PageStore, get_page_store
+
+# EMPTY のページを再取得するまでの時間
+DEFAULT_EMPTY_TTL = timedelta(days=1)
+
+
+class PageStatus(Enum):
+    OK = 1  # レース結果が存在する
+    EMPTY = 2  # レースが開催されておらずデータが存在しない(ファイルは保存しない)
+    INCOMPATIBLE = 3  # 障害競走など対象外のレース
+    FAILED = 4  # 取得に失敗した
+
+
+class ManifestEntry(NamedTuple):
+    race_id: int
+    status: PageStatus
+    byte_size: Optional[int]
+    content_hash: Optional[str]
+    fetched_at: datetime
+
+
+class CrawlManifest:
+    """ レースIDをキーにしてページの状態・サイズ・ハッシュ値・取得日時を保持する
+
+    Examples:
+        with CrawlManifest() as manifest:
+            races = [race for race in races if manifest.needs_fetch(race)]
+    """
+
+    def __init__(self, file_path: str = RACE_MANIFEST_FILE_PATH,
+                 empty_ttl: Optional[timedelta] = DEFAULT_EMPTY_TTL) -> None:
+        """
+        Args:
+            file_path (str): SQLite のファイル
+            empty_ttl (Optional[timedelta]): その年が終わる前に取得した EMPTY のページを再取得するまでの時間
+                                             (None の場合は再取得しない)
+        """
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        self.file_path = file_path
+        self.empty_ttl = empty_ttl
+        self._connection = sqlite3.connect(file_path)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute('''
+            CREATE TABLE IF NOT EXISTS race_pages (
+                race_id INTEGER PRIMARY KEY,
+                status TEXT NOT NULL,
+                byte_size INTEGER,
+                content_hash TEXT,
+                fetched_at TEXT NOT NULL
+            )
+        ''')
+        self._connection.commit()
+
+    def __enter__(self) -> 'CrawlManifest':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def record(self, race_id: int, status: PageStatus, content: Optional[bytes] = None) -> None:
+        """ ページを取得した結果を記録する
+
+        Args:
+            race_id (int): レースID
+            status (PageStatus): ページの状態
+            content (Optional[bytes]): 保存したページの内容(保存していない場合は None)
+        """
+        byte_size = None if content is None else len(content)
+        content_hash = None if content is None else hashlib.sha256(content).hexdigest()
+        with self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO race_pages VALUES (?, ?, ?, ?, ?)',
+                (race_id, status.name, byte_size, content_hash, datetime.now().isoformat()))
+
+    def update_status(self, race_id: int, status: PageStatus) -> None:
+        """ サイズ等はそのままで状態だけを更新する
+
+            スクレイピングしてみて初めて対象外のレースだとわかった場合などに使う
+        """
+        with self._connection:
+            self._connection.execute(
+                'UPDATE race_pages SET status = ? WHERE race_id = ?', (status.name, race_id))
+
+    def get(self, race_id: int) -> Optional[ManifestEntry]:
+        row = self._connection.execute(
+            'SELECT * FROM race_pages WHERE race_id = ?', (race_id,)).fetchone()
+        if row is None:
+            return None
+        return self._to_entry(row)
+
+    def entries(self, status: Optional[PageStatus] = None) -> List[ManifestEntry]:
+        if status is None:
+            rows = self._connection.execute('SELECT * FROM race_pages ORDER BY race_id')
+        else:
+            rows = self._connection.execute(
+                'SELECT * FROM race_pages WHERE status = ? ORDER BY race_id', (status.name,))
+        return [self._to_entry(row) for row in rows]
+
+    def race_ids(self, status: PageStatus = PageStatus.OK) -> List[int]:
+        """
+        Args:
+            status (PageStatus): 対象とするページの状態
+
+        Returns:
+            List[int]: 指定された状態のレースIDの一覧(昇順)
+        """
+        rows = self._connection.execute(
+            'SELECT race_id FROM race_pages WHERE status = ? ORDER BY race_id', (status.name,))
+        return [race_id for race_id, in rows]
+
+    def verify(self, race: Race, check_hash: bool = False, store: Optional[PageStore] = None) -> bool:
+        """ 保存済みのページが記録した内容と一致するかどうかを検証する
+
+        Args:
+            race (Race): 対象のレース
+            check_hash (bool): True の場合はページを読み込んでハッシュ値まで比較する(デフォルトはサイズのみ比較)
+            store (Optional[PageStore]): 保存先(省略時は get_page_store で取得できるもの)
+
+        Returns:
+            bool: 記録と一致していれば True
+        """
+        entry = self.get(race.id)
+        if entry is None or entry.byte_size is None:
+            return False
+
+        store = store if store is not None else get_page_store()
+        if store.size(race.id) != entry.byte_size:
+            return False
+        if not check_hash:
+            return True
+        return hashlib.sha256(store.read(race.id)).hexdigest() == entry.content_hash
+
+    def is_expired(self, entry: ManifestEntry, now: Optional[datetime] = None) -> bool:
+        """ EMPTY の記録が古くなっていて再取得すべきかどうか
+
+            その年が終わる前に取得したもので、取得日時から empty_ttl 以上経過していれば True
+        """
+        if entry.status != PageStatus.EMPTY or self.empty_ttl is None:
+            return False
+        if entry.fetched_at.year > year_of(entry.race_id):
+            return False
+        now = now if now is not None else datetime.now()
+        return now - entry.fetched_at >= self.empty_ttl
+
+    def needs_fetch(self, race: Race, check_hash: bool = False, store: Optional[PageStore] = None) -> bool:
+        """ 取得(あるいは再取得)する必要があるかどうかを判定する
+
+            データが存在しない・対象外とわかっているレースは保存先に触れずに False を返す
+            (EMPTY でも is_expired であれば True)
+        """
+        entry = self.get(race.id)
+        if entry is None or entry.status == PageStatus.FAILED:
+            return True
+        if entry.status == PageStatus.EMPTY:
+            return self.is_expired(entry)
+        if entry.status == PageStatus.INCOMPATIBLE:
+            return False
+        return not self.verify(race, check_hash=check_hash, store=store)
+
+    def register_files(self, races: Iterable[Race], store: Optional[PageStore] = None) -> None:
+        """ マニフェスト導入前に保存されたページを記録する
+
+            レース結果の表があるかどうかでOKかEMPTYかを判定する(EMPTY のページは削除してよい)
+        """
+        store = store if store is not None else get_page_store()
+        for race in races:
+            try:
+                content = store.read(race.id)
+            except KeyError:
+                continue
+
+            if has_race_result(content):
+                self.record(race.id, PageStatus.OK, content)
+            else:
+                self.record(race.id, PageStatus.EMPTY)
+
+    @staticmethod
+    def _to_entry(row: tuple) -> ManifestEntry:
+        race_id, status, byte_size, content_hash, fetched_at = row
+        return ManifestEntry(race_id, PageStatus[status], byte_size, content_hash,
+                             datetime.fromisoformat(fetched_at))
@@ -1,16 +1,34 @@
 import os
-from typing import IO
-from keiba_machine_learning.models import Race as Base
-from keiba_machine_learning.netkeiba.constants import DATABASE_PAGE_BASE_URL, RACE_DATA_DIR, ENCODING_OF_WEB_PAGE
+from typing import IO, Iterable, List, NamedTuple
+
+import numpy as np
+
+from keiba_machine_learning.models import Race as Base, RaceTrac
+from keiba_machine_learning.netkeiba import race_ids
+from keiba_machine_learning.netkeiba.constants import DATABASE_PAGE_BASE_URL, RACE_DATA_DIR
+from keiba_machine_learning.netkeiba.stores import get_page_store
 
 
 class Race(Base):
+    @classmethod
+    def from_id(cls, race_id: int) -> 'Race':
+        """ レースIDから作る
+
+        Raises:
+            pydantic.ValidationError: 範囲外の要素がある場合
+        """
+        year, race_track, series_number, day_number, race_number = race_ids.decode(int(race_id))
+        return cls(year=year, race_track=RaceTrac(race_track), series_number=series_number,
+                   day_number=day_number, race_number=race_number)
+
     def __hash__(self) -> int:
-        return int(f'{self.year}{self.race_track.value:02d}{self.series_number:02d}{self.day_number:02d}{self.race_number:02d}')
+        return self.id
 
     @property
     def id(self) -> int:
-        return self.__hash__()
+        # 各要素は作成時に検証済み
+        return race_ids.encode_one(self.year, self.race_track.value, self.series_number,
+                                   self.day_number, self.race_number)
 
     @property
     def url(self) -> str:
@@ -21,13 +39,111 @@ class Race(Base):
         Returns:
             str: netkeibaでのレース結果ページのURL
         """
-        return '/'.join([str(url_parts)
-                         for url_parts in [DATABASE_PAGE_BASE_URL, "race", self.id]])
+        return _url_of(self.id)
+
+    @property
+    def file_path(self) -> str:
+        """
+        ディレクトリ形式(DirectoryPageStore)で保存する場合のファイルのパスを返す
+        アーカイブ形式で保存している場合はファイルとしては存在しないので、読み込みには file を使うこと
+
+        Returns:
+            str: RACE_DATA_DIR 配下の {id}.html のパス
+        """
+        return _file_path_of(self.id)
+
+    @property
+    def file(self) -> IO:
+        """
+        Returns:
+            IO: 保存先(get_page_store で取得できるもの)からページをテキストモードで開いたもの
+        """
+        return get_page_store().open(self.id)
+
+
+class RaceKey(NamedTuple):
+    """ Race と同じ属性・id・url・file_path を持つ軽量なレース
+
+        作成時に検証しないので Race よりずっと速く作れる
+        大量に作る場合(全レースの列挙・データセットとの突き合わせなど)はこちらを使い、
+        まとめて from_ids や validate_race_keys で検証する
+    """
+    race_track: RaceTrac
+    year: int
+    series_number: int
+    day_number: int
+    race_number: int
+
+    @staticmethod
+    def from_id(race_id: int) -> 'RaceKey':
+        year, race_track, series_number, day_number, race_number = race_ids.decode(int(race_id))
+        return RaceKey(_RACE_TRACKS[race_track], year, series_number, day_number, race_number)
+
+    @staticmethod
+    def from_ids(ids: Iterable[int], validate: bool = True) -> List['RaceKey']:
+        """ レースIDの配列からまとめて作る
+
+        Raises:
+            ValueError: validate が True で範囲外のレースIDがある場合
+        """
+        ids = np.asarray(list(ids) if not isinstance(ids, np.ndarray) else ids, dtype=np.int64)
+        if validate:
+            race_ids.validate(ids)
+        components = race_ids.decode(ids)
+        return [RaceKey(_RACE_TRACKS[race_track], year, series_number, day_number, race_number)
+                for year, race_track, series_number, day_number, race_number
+                in zip(*(component.tolist() for component in components))]
+
+    @staticmethod
+    def from_race(race: Race) -> 'RaceKey':
+        return RaceKey(race.race_track, race.year, race.series_number, race.day_number, race.race_number)
+
+    def to_race(self) -> Race:
+        """
+        Raises:
+            pydantic.ValidationError: 範囲外の要素がある場合
+        """
+        return Race(**self._asdict())
+
+    @property
+    def id(self) -> int:
+        return race_ids.encode_one(self.year, self.race_track.value, self.series_number,
+                                   self.day_number, self.race_number)
+
+    @property
+    def url(self) -> str:
+        return _url_of(self.id)
 
     @property
     def file_path(self) -> str:
-        return os.path.join(RACE_DATA_DIR, f'{self.id}.html')
+        return _file_path_of(self.id)
 
     @property
     def file(self) -> IO:
-        return open(self.file_path, mode='r', encoding=ENCODING_OF_WEB_PAGE)
+        return get_page_store().open(self.id)
+
+
+def validate_race_keys(race_keys: Iterable[RaceKey]) -> None:
+    """ Race と同じ範囲に収まっているかをまとめて検証する
+
+    Raises:
+        ValueError: 範囲外のものがある場合
+    """
+    race_keys = list(race_keys)
+    if not race_keys:
+        return
+    race_tracks, years, series_numbers, day_numbers, race_numbers = zip(*race_keys)
+    race_ids.validate(race_ids.encode(np.array(years), np.array([race_track.value for race_track in race_tracks]),
+                                      np.array(series_numbers), np.array(day_numbers), np.array(race_numbers),
+                                      validate=False))
+
+
+_RACE_TRACKS = {race_track.value: race_track for race_track in RaceTrac}
+
+
+def _url_of(race_id: int) -> str:
+    return '/'.join([str(url_parts) for url_parts in [DATABASE_PAGE_BASE_URL, "race", race_id]])
+
+
+def _file_path_of(race_id: int) -> str:
+    return os.path.join(RACE_DATA_DIR, f'{race_id}.html')
@@ -0,0 +1,343 @@
+"""保存済みのレースページをスクレイピングして表形式のデータにする処理
+
+    レースIDをチャンクに分けて処理し、チャンクごとに列指向の結果(列名 → numpy配列)を返す
+    processes に2以上を指定するとチャンクを複数のプロセスに分散して処理する
+    (デフォルトはデバッグしやすいように1プロセスで処理する)
+
+    Examples:
+        for chunk in iter_scraped_chunks(race_ids, processes=8, chunk_size=200):
+            writer.write(chunk.columns)
+
+        result = scrape_race_pages(race_ids, processes=8, chunk_size=200)
+        df = pd.DataFrame(result.columns)
+"""
+import io
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from keiba_machine_learning.netkeiba.constants import ENCODING_OF_WEB_PAGE
+from keiba_machine_learning.netkeiba.instrumentation import PipelineMetrics, get_metrics, set_metrics
+from keiba_machine_learning.netkeiba.scrapers import (ParserBackend, PageVerdict, RacePageScraper, DataNotFound,
+                                                      IncompatibleDataDetected, classify_page)
+from keiba_machine_learning.netkeiba.stores import PageStore, get_page_store
+from keiba_machine_learning.types import RacePage
+
+# 出力する列とその型
+COLUMN_DTYPES: Dict[str, str] = {
+    'race_id': 'int64',
+    'race_track': 'int64',
+    'track_kind': 'int64',
+    'track_direction': 'int64',
+    'race_distance_by_meter': 'int64',
+    'track_surface': 'int64',
+    'weather': 'int64',
+    'race_number': 'int64',
+    'starts_at': 'datetime64[s]',
+    'order_of_placing': 'int64',
+    'bracket_number': 'int64',
+    'horse_number': 'int64',
+    'horse_id': 'int64',
+    'horse_name': 'object',
+    'horse_age': 'int64',
+    'horse_gender': 'int64',
+    'impost': 'float64',
+    'jockey_id': 'object',
+    'jockey_name': 'object',
+    'race_time': 'float64',
+    'win_betting_ratio': 'float64',
+    'favorite_order': 'int64',
+    'horse_weight': 'int64',
+    'weight_change': 'int64',
+}
+COLUMNS = list(COLUMN_DTYPES)
+
+
+class RacePageScrapingFailed(Exception):
+    """ DataNotFound・IncompatibleDataDetected 以外の理由でスクレイピングできなかった場合に送出する
+
+        別プロセスで発生した場合でもどのレースで失敗したかわかるようにレースIDを保持する
+    """
+
+    def __init__(self, race_id: int, reason: str) -> None:
+        super().__init__(race_id, reason)
+        self.race_id = race_id
+        self.reason = reason
+
+    def __str__(self) -> str:
+        return f"race_id: {self.race_id} can't parse. ({self.reason})"
+
+
+class ScrapedChunk(NamedTuple):
+    columns: Dict[str, np.ndarray]  # 列名 → 値の配列(全ての列で同じ長さ)
+    not_found_race_ids: List[int]  # DataNotFound になったレース
+    incompatible_race_ids: List[int]  # IncompatibleDataDetected になったレース
+    page_count: int  # 処理したページ数
+    # 計測中に別プロセスで処理した場合、そのプロセスで記録したもの(iter_scraped_chunks で呼び出し元の記録先に合算済み)
+    metrics: Optional[PipelineMetrics] = None
+
+
+def race_page_to_columns(race_id: int, race_page: RacePage, columns: Dict[str, list]) -> None:
+    """ レースページ1つ分のスクレイピング結果を1頭1行として各列に追加する
+
+    Args:
+        race_id (int): レースID
+        race_page (RacePage): スクレイピング結果
+        columns (Dict[str, list]): 追加先(列名 → 値のリスト)
+    """
+    race_information = race_page['race_information']
+    race_records = race_page['race_records']
+    # レース単位の値(Enum はコード)は1回だけ求めて頭数分並べる
+    race_values = {
+        'race_id': race_id,
+        'race_track': race_information['race_track'].value,
+        'track_kind': race_information['track_kind'].value,
+        'track_direction': race_information['track_direction'].value,
+        'race_distance_by_meter': race_information['race_distance_by_meter'],
+        'track_surface': race_information['track_surface'].value,
+        'weather': race_information['weather'].value,
+        'race_number': race_information['race_number'],
+        'starts_at': race_information['starts_at'],
+    }
+    for column, value in race_values.items():
+        columns[column].extend([value] * len(race_records))
+
+    for race_record in race_records:
+        columns['order_of_placing'].append(race_record['order_of_placing'])
+        columns['bracket_number'].append(race_record['bracket_number'])
+        columns['horse_number'].append(race_record['horse_number'])
+        columns['horse_id'].append(race_record['horse_id'])
+        columns['horse_name'].append(race_record['horse_name'])
+        columns['horse_age'].append(race_record['horse_age'])
+        columns['horse_gender'].append(race_record['horse_gender'].value)
+        columns['impost'].append(race_record['impost'])
+        columns['jockey_id'].append(race_record['jockey_id'])
+        columns['jockey_name'].append(race_record['jockey_name'])
+        columns['race_time'].append(race_record['race_time'])
+        columns['win_betting_ratio'].append(race_record['win_betting_ratio'])
+        columns['favorite_order'].append(race_record['favorite_order'])
+        columns['horse_weight'].append(race_record['horse_weight'])
+        columns['weight_change'].append(race_record['weight_change'])
+
+
+# パースせずに判定できたページをスクレイピングした場合の例外
+_SKIPPED_BY = {PageVerdict.NOT_FOUND: DataNotFound, PageVerdict.INCOMPATIBLE: IncompatibleDataDetected}
+
+
+class ScrapedPage(NamedTuple):
+    race_id: int
+    race_page: Optional[RacePage]  # スクレイピングできなかった場合は None
+    skipped_by: Optional[Exception]  # スクレイピングできなかった理由(DataNotFound か IncompatibleDataDetected)
+
+
+def iter_race_pages(race_ids: Iterable[int],
+                    store: Optional[PageStore] = None,
+                    parser: ParserBackend = ParserBackend.HTML_PARSER,
+                    scoped: bool = False) -> Iterator[ScrapedPage]:
+    """ ページを1つずつ読み込んでスクレイピングした結果を返す(読み込んだページや結果は溜め込まない)
+
+        レース結果がないページ・障害や直線のレースのページは classify_page で判定できるので、パースせずに読み飛ばす
+
+    Args:
+        race_ids (Iterable[int]): 対象のレースID
+        store (Optional[PageStore]): 読み込み元(省略時は get_page_store で取得できるもの)
+        parser (ParserBackend): HTMLのパースに使うライブラリ
+        scoped (bool): レース情報・レース結果の表の部分だけをパースする(scrapers.extract_regions を参照)
+
+    Raises:
+        RacePageScrapingFailed: DataNotFound・IncompatibleDataDetected 以外の理由でスクレイピングできなかった場合
+
+    Returns:
+        Iterator[ScrapedPage]: レースID順の結果
+    """
+    store = store if store is not None else get_page_store()
+    metrics = get_metrics()
+    for race_id, content in store.iter_pages(race_ids):
+        started_at = time.perf_counter() if metrics is not None else 0.0
+        exception_type = _SKIPPED_BY.get(classify_page(content))
+        if exception_type is not None:
+            skipped_by = exception_type()
+            if metrics is not None:
+                metrics.increment('pages_prefiltered')
+                metrics.record_parse(time.perf_counter() - started_at, skipped_by)
+            yield ScrapedPage(race_id, None, skipped_by)
+            continue
+
+        with io.TextIOWrapper(io.BytesIO(content), encoding=ENCODING_OF_WEB_PAGE) as file:
+            try:
+                scraped_page = ScrapedPage(race_id, RacePageScraper.scrape(file, parser=parser, scoped=scoped), None)
+            except (DataNotFound, IncompatibleDataDetected) as e:
+                scraped_page = ScrapedPage(race_id, None, e)
+            except Exception as e:
+                if metrics is not None:
+                    metrics.increment('parse_failures')
+                raise RacePageScrapingFailed(race_id, repr(e)) from e
+
+        if metrics is not None:
+            metrics.record_parse(time.perf_counter() - started_at, scraped_page.skipped_by)
+        yield scraped_page
+
+
+def scrape_chunk(race_ids: Sequence[int], store: PageStore, parser: ParserBackend,
+                 scoped: bool = False) -> ScrapedChunk:
+    """ レースIDのチャンク1つ分をスクレイピングする
+
+    Raises:
+        RacePageScrapingFailed: DataNotFound・IncompatibleDataDetected 以外の理由でスクレイピングできなかった場合
+
+    Returns:
+        ScrapedChunk
+    """
+    columns: Dict[str, list] = {column: [] for column in COLUMNS}
+    not_found_race_ids = []
+    incompatible_race_ids = []
+    page_count = 0
+
+    for scraped_page in iter_race_pages(race_ids, store=store, parser=parser, scoped=scoped):
+        page_count += 1
+        if scraped_page.race_page is not None:
+            race_page_to_columns(scraped_page.race_id, scraped_page.race_page, columns)
+        elif isinstance(scraped_page.skipped_by, DataNotFound):
+            not_found_race_ids.append(scraped_page.race_id)
+        else:
+            incompatible_race_ids.append(scraped_page.race_id)
+
+    metrics = get_metrics()
+    if metrics is not None:
+        metrics.increment('rows_emitted', len(columns['race_id']))
+        metrics.record_peak_memory()
+
+    return ScrapedChunk(
+        columns={column: np.asarray(values, dtype=COLUMN_DTYPES[column]) for column, values in columns.items()},
+        not_found_race_ids=not_found_race_ids,
+        incompatible_race_ids=incompatible_race_ids,
+        page_count=page_count,
+    )
+
+
+def iter_scraped_chunks(race_ids: Sequence[int],
+                        store: Optional[PageStore] = None,
+                        parser: ParserBackend = ParserBackend.HTML_PARSER,
+                        processes: int = 1,
+                        chunk_size: int = 200,
+                        scoped: bool = False) -> Iterator[ScrapedChunk]:
+    """ レースIDをチャンクに分けてスクレイピングし、チャンクごとに結果を返す
+
+    Args:
+        race_ids (Sequence[int]): 対象のレースID
+        store (Optional[PageStore]): 読み込み元(省略時は get_page_store で取得できるもの)
+        parser (ParserBackend): HTMLのパースに使うライブラリ
+        processes (int): プロセス数(1 の場合はこのプロセス内で処理する)
+        chunk_size (int): 1チャンクあたりのレース数
+        scoped (bool): レース情報・レース結果の表の部分だけをパースする(scrapers.extract_regions を参照)
+
+    Raises:
+        RacePageScrapingFailed: DataNotFound・IncompatibleDataDetected 以外の理由でスクレイピングできなかった場合
+
+    Returns:
+        Iterator[ScrapedChunk]: race_ids の順番通りのチャンクごとの結果
+    """
+    if processes < 1:
+        raise ValueError("processes must be positive.")
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be positive.")
+
+    store = store if store is not None else get_page_store()
+    chunks = [race_ids[i:i + chunk_size] for i in range(0, len(race_ids), chunk_size)]
+
+    if processes == 1:
+        for chunk in chunks:
+            yield scrape_chunk(chunk, store, parser, scoped)
+        return
+
+    metrics = get_metrics()
+    with ProcessPoolExecutor(max_workers=processes, initializer=_initialize_worker,
+                             initargs=(store, parser, scoped, metrics is not None)) as executor:
+        try:
+            for chunk in executor.map(_scrape_chunk_in_worker, chunks):
+                if metrics is not None and chunk.metrics is not None:
+                    metrics.merge(chunk.metrics)
+                yield chunk
+        except RacePageScrapingFailed:
+            # 失敗したワーカーの記録は返ってこないので、失敗したことだけここで記録する
+            if metrics is not None:
+                metrics.increment('parse_failures')
+            raise
+
+
+# 各ワーカープロセスで使う読み込み元とパーサー
+# (チャンクごとに渡すとアーカイブのインデックスをチャンクごとに読み込み直すことになるので、プロセスの起動時に1回だけ渡す)
+_worker_store: Optional[PageStore] = None
+_worker_parser: ParserBackend = ParserBackend.HTML_PARSER
+_worker_scoped = False
+_worker_collects_metrics = False
+
+
+def _initialize_worker(store: PageStore, parser: ParserBackend, scoped: bool = False,
+                       collects_metrics: bool = False) -> None:
+    global _worker_store, _worker_parser, _worker_scoped, _worker_collects_metrics
+    _worker_store = store
+    _worker_parser = parser
+    _worker_scoped = scoped
+    _worker_collects_metrics = collects_metrics
+    # fork した場合に呼び出し元の記録先を引き継がないようにする
+    set_metrics(None)
+
+
+def _scrape_chunk_in_worker(race_ids: Sequence[int]) -> ScrapedChunk:
+    assert _worker_store is not None
+    if not _worker_collects_metrics:
+        return scrape_chunk(race_ids, _worker_store, _worker_parser, _worker_scoped)
+
+    # チャンクごとに記録して結果と一緒に返す
+    metrics = PipelineMetrics()
+    set_metrics(metrics)
+    try:
+        chunk = scrape_chunk(race_ids, _worker_store, _worker_parser, _worker_scoped)
+    finally:
+        set_metrics(None)
+    return chunk._replace(metrics=metrics)
+
+
+class ScrapingResult(NamedTuple):
+    columns: Dict[str, np.ndarray]
+    not_found_race_ids: List[int]
+    incompatible_race_ids: List[int]
+
+
+def scrape_race_pages(race_ids: Sequence[int],
+                      store: Optional[PageStore] = None,
+                      parser: ParserBackend = ParserBackend.HTML_PARSER,
+                      processes: int = 1,
+                      chunk_size: int = 200,
+                      on_progress: Optional[Callable[[int], None]] = None,
+                      scoped: bool = False) -> ScrapingResult:
+    """ iter_scraped_chunks の結果を1つにまとめる
+
+        全ての結果をメモリに載せるので、大量のページを処理する場合は iter_scraped_chunks の結果を
+        datasets.DatasetWriter などに順に渡すこと
+
+    Args:
+        on_progress (Optional[Callable[[int], None]]): チャンクを処理する度に処理したページ数を渡して呼ばれる(進捗表示用)
+
+        その他の引数は iter_scraped_chunks と同じ
+
+    Returns:
+        ScrapingResult
+    """
+    chunks = []
+    for chunk in iter_scraped_chunks(race_ids, store=store, parser=parser,
+                                     processes=processes, chunk_size=chunk_size, scoped=scoped):
+        chunks.append(chunk)
+        if on_progress is not None:
+            on_progress(chunk.page_count)
+
+    return ScrapingResult(
+        columns={column: np.concatenate([chunk.columns[column] for chunk in chunks])
+                 if chunks else np.array([], dtype=dtype)
+                 for column, dtype in COLUMN_DTYPES.items()},
+        not_found_race_ids=[race_id for chunk in chunks for race_id in chunk.not_found_race_ids],
+        incompatible_race_ids=[race_id for chunk in chunks for race_id in chunk.incompatible_race_ids],
+    )
@@ -0,0 +1,153 @@
+"""netkeiba のレースIDとその構成要素(年・競馬場・回・日目・レース番号)の相互変換
+
+    レースIDは 年(4桁) 競馬場(2桁) 回(2桁) 日目(2桁) レース番号(2桁) を並べた12桁の整数
+    (例: 201901010101 は 2019年 札幌 1回 1日目 1R)
+
+    いずれの関数も整数1つでも numpy 配列でも使える
+    配列の場合は Race を1つずつ作らずに全要素をまとめて計算するので、何百万件でもすぐに終わる
+
+    Examples:
+        race_ids = encode(2019, race_track=np.array([1, 5]), series_number=1, day_number=1, race_number=1)
+        decode(race_ids).race_track  # array([1, 5])
+        race_track_of(201905010101)  # 5
+"""
+import datetime
+from typing import Any, NamedTuple, Optional
+
+import numpy as np
+
+from keiba_machine_learning.models import Race, RaceTrac
+
+_YEAR_FACTOR = 10 ** 8
+_RACE_TRACK_FACTOR = 10 ** 6
+_SERIES_NUMBER_FACTOR = 10 ** 4
+_DAY_NUMBER_FACTOR = 10 ** 2
+
+_MIN_RACE_TRACK = min(race_track.value for race_track in RaceTrac)
+_MAX_RACE_TRACK = max(race_track.value for race_track in RaceTrac)
+
+
+class RaceIdComponents(NamedTuple):
+    year: Any
+    race_track: Any  # RaceTrac の値
+    series_number: Any
+    day_number: Any
+    race_number: Any
+
+
+def encode(year: Any, race_track: Any, series_number: Any, day_number: Any, race_number: Any,
+           validate: bool = True) -> Any:
+    """ 構成要素からレースIDを作る(配列はブロードキャストされる)
+
+    Args:
+        validate (bool): 各要素が Race と同じ範囲に収まっているか確認する
+
+    Returns:
+        Any: 引数が全て整数なら int、そうでなければ int64 の配列
+
+    Raises:
+        ValueError: validate が True で範囲外の要素がある場合
+    """
+    components = RaceIdComponents(year, race_track, series_number, day_number, race_number)
+    if validate:
+        _raise_if_invalid(components)
+
+    if all(isinstance(component, (int, np.integer)) for component in components):
+        return encode_one(int(year), int(race_track), int(series_number), int(day_number), int(race_number))
+    year, race_track, series_number, day_number, race_number = (
+        np.asarray(component, dtype=np.int64) for component in components)
+    return (year * _YEAR_FACTOR + race_track * _RACE_TRACK_FACTOR
+            + series_number * _SERIES_NUMBER_FACTOR + day_number * _DAY_NUMBER_FACTOR + race_number)
+
+
+def encode_one(year: int, race_track: int, series_number: int, day_number: int, race_number: int) -> int:
+    """ 検証済みの整数の構成要素からレースIDを作る(Race.id などで1件ずつ計算する場合に使う) """
+    return (year * _YEAR_FACTOR + race_track * _RACE_TRACK_FACTOR
+            + series_number * _SERIES_NUMBER_FACTOR + day_number * _DAY_NUMBER_FACTOR + race_number)
+
+
+def decode(race_ids: Any) -> RaceIdComponents:
+    """ レースIDを構成要素に分ける(検証はしないので、必要なら validate を呼ぶこと) """
+    if not isinstance(race_ids, (int, np.integer)):
+        race_ids = np.asarray(race_ids, dtype=np.int64)
+    return RaceIdComponents(year_of(race_ids), race_track_of(race_ids), series_number_of(race_ids),
+                            day_number_of(race_ids), race_number_of(race_ids))
+
+
+def year_of(race_ids: Any) -> Any:
+    """ レースIDの先頭4桁が開催年 """
+    return race_ids // _YEAR_FACTOR
+
+
+def race_track_of(race_ids: Any) -> Any:
+    """ レースIDの5・6桁目が競馬場 """
+    return race_ids // _RACE_TRACK_FACTOR % 100
+
+
+def series_number_of(race_ids: Any) -> Any:
+    return race_ids // _SERIES_NUMBER_FACTOR % 100
+
+
+def day_number_of(race_ids: Any) -> Any:
+    return race_ids // _DAY_NUMBER_FACTOR % 100
+
+
+def race_number_of(race_ids: Any) -> Any:
+    return race_ids % 100
+
+
+def is_valid(race_ids: Any, max_year: Optional[int] = None) -> Any:
+    """ 各レースIDの構成要素が Race と同じ範囲に収まっているか
+
+    Args:
+        race_ids (Any): レースID(整数または配列)
+        max_year (Optional[int]): 年の上限(省略時は今年)
+
+    Returns:
+        Any: 整数なら bool、配列なら bool の配列
+    """
+    valid = _is_valid_components(decode(race_ids), max_year)
+    return bool(valid) if np.ndim(valid) == 0 else valid
+
+
+def validate(race_ids: Any, max_year: Optional[int] = None) -> None:
+    """
+    Raises:
+        ValueError: 範囲外のレースIDがある場合(最初の1つをメッセージに含める)
+    """
+    valid = np.asarray(is_valid(race_ids, max_year))
+    if not valid.all():
+        invalid = np.asarray(race_ids).reshape(-1)[np.flatnonzero(~valid.reshape(-1))]
+        raise ValueError(f"{len(invalid)} invalid race IDs (e.g. {int(invalid[0])}).")
+
+
+def all_race_ids(year: int, validate: bool = True) -> np.ndarray:
+    """ 指定した年に存在しうる全てのレースID(競馬場 × 回 × 日目 × レース番号)を昇順で返す
+
+    Args:
+        year (int): 年
+        validate (bool): 年が Race と同じ範囲(1986年〜今年)に収まっているか確認する
+                         (負荷試験用に実在しない年のレースIDを作る場合は False にする)
+    """
+    race_track, series_number, day_number, race_number = np.meshgrid(
+        np.arange(_MIN_RACE_TRACK, _MAX_RACE_TRACK + 1),
+        np.arange(1, Race.MAX_SERIES_NUMBER + 1),
+        np.arange(1, Race.MAX_DAY_NUMBER + 1),
+        np.arange(1, Race.MAX_RACE_NUMBER + 1),
+        indexing='ij')
+    return encode(year, race_track, series_number, day_number, race_number, validate=validate).reshape(-1)
+
+
+def _is_valid_components(components: RaceIdComponents, max_year: Optional[int]) -> Any:
+    max_year = max_year if max_year is not None else datetime.date.today().year
+    year, race_track, series_number, day_number, race_number = (np.asarray(component) for component in components)
+    return ((year >= Race.OLDEST_READABLE_YEAR) & (year <= max_year)
+            & (race_track >= _MIN_RACE_TRACK) & (race_track <= _MAX_RACE_TRACK)
+            & (series_number >= 1) & (series_number <= Race.MAX_SERIES_NUMBER)
+            & (day_number >= 1) & (day_number <= Race.MAX_DAY_NUMBER)
+            & (race_number >= 1) & (race_number <= Race.MAX_RACE_NUMBER))
+
+
+def _raise_if_invalid(components: RaceIdComponents) -> None:
+    if not np.all(_is_valid_components(components, max_year=None)):
+        raise ValueError("race ID components are out of range.")
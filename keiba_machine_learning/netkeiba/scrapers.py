@@ -1,9 +1,13 @@
+import io
+import mmap
 import re
 from datetime import datetime
-from typing import IO, List
-from bs4 import BeautifulSoup
-from keiba_machine_learning.models import RaceTracFactory, TrackKindFactory, TrackDirectionFactory, TrackSurfaceFactory, WeatherFactory, HorseGenderFactory, TrackSurface
-from keiba_machine_learning.types import RaceInformation, RaceRecord
+from enum import Enum
+from typing import IO, Any, Dict, List, NamedTuple, Optional, Union
+from bs4 import BeautifulSoup, Tag
+from keiba_machine_learning.models import RACE_TRACK_CODES, TRACK_KIND_CODES, TRACK_DIRECTION_CODES, TRACK_SURFACE_CODES, WEATHER_CODES, HORSE_GENDER_CODES, TrackSurface
+from keiba_machine_learning.types import RaceInformation, RacePage, RaceRecord
+from keiba_machine_learning.netkeiba.constants import ENCODING_OF_WEB_PAGE
 
 # NOTE: バージョニングは必要に応じて行う
 # 例えばスクレイピング先がリニューアルされてDOMががらりと変わってしまったらこのスクリプトは使えなくなる
@@ -20,156 +24,462 @@ class IncompatibleDataDetected(Exception):
     pass
 
 
-class RaceInformationScraper:
-    @staticmethod
-    def scrape(file: IO) -> RaceInformation:
-        """
-        Args:
-            file (IO): netkeibaのレース結果ページのHTMLファイル
+RACE_RESULT_TABLE_MARKER = 'summary="レース結果"'.encode(ENCODING_OF_WEB_PAGE)
 
-        Returns:
-            RaceInformation
-        """
-        soup = BeautifulSoup(file, 'html.parser')
 
-        # netkeiba側の仕様でレースデータが存在しないページにアクセスしても404をHTTPステータスコードとしてレスポンスしないので、
-        # データが存在しない掲載されていないファイルが渡ってくることも想定してここでデータがない場合の制御をする
-        race_result_table = soup.find('table', attrs={'summary': 'レース結果'})
-        if race_result_table is None:
-            raise DataNotFound
+def has_race_result(content: bytes) -> bool:
+    """ ページにレース結果の表が含まれているかどうかを DOM を構築せずに判定する
 
-        title_element = soup.select_one(
-            '#main > div > div > div > diary_snap > div > div > dl > dd > h1')
-        text_under_the_title = soup.select_one(
-            '#main > div > div > div > diary_snap > div > div > dl > dd > p > diary_snap_cut > span').get_text()
-        race_number_element = soup.select_one(
-            '#main > div > div > div > diary_snap > div > div > dl > dt')
+    Args:
+        content (bytes): netkeibaのレース結果ページのHTML(EUC-JPのバイト列)
 
-        if s := re.search(r'(\d{4})m', text_under_the_title):
-            race_distance_by_meter = int(s.group(1))
-        else:
-            raise ValueError("can't parse race distance.")
+    Returns:
+        bool: レース結果の表が含まれていれば True (False の場合はスクレイピングすると DataNotFound になる)
+    """
+    return RACE_RESULT_TABLE_MARKER in content
 
-        if s := re.search(r'\d+', race_number_element.get_text()):
-            race_number = int(s.group())
-        else:
-            raise ValueError("can't parse race number.")
 
-        race_track_name = soup.select_one(
-            '#main > div > div > div > ul > li > a.active').get_text()
+class PageVerdict(Enum):
+    """ classify_page の判定結果 """
+    NOT_FOUND = 'not_found'  # スクレイピングすると DataNotFound になる
+    INCOMPATIBLE = 'incompatible'  # スクレイピングすると IncompatibleDataDetected になる
+    PARSE = 'parse'  # スクレイピングしないとわからない(通常のレースのページ)
 
-        track_kind_mark = text_under_the_title[0]
-        if track_kind_mark == '障':
-            raise IncompatibleDataDetected
 
-        track_direction_mark = text_under_the_title[1]
-        if track_direction_mark == '直':
-            raise IncompatibleDataDetected
+# レース情報(レース番号・レース名・コース情報)の部分の目印
+_RACE_DATA_MARKER = b'class="racedata'
+_ACTIVE_RACE_TRACK_MARKER = b'class="active"'
+# レース情報の中でコース情報の span を探す範囲(これより離れていたら想定外の構造とみなしてパースに任せる)
+_MAX_RACE_DATA_LENGTH = 1024
 
-        if s := re.search(r'天候 : (\w+)', text_under_the_title):
-            weather_mark = s.group(1)
-        else:
-            raise ValueError("can't parse weather.")
+
+def classify_page(content: Union[bytes, bytearray, mmap.mmap]) -> PageVerdict:
+    """ スクレイピングしても結果が得られないページを DOM を構築せずに判定する
+
+        保存されているページの多くはレース結果がないページや障害・直線のレースなので、
+        それらをパースせずに読み飛ばすために使う
+        レース結果の表の目印と、コース情報(例: 芝右1800m)の先頭の文字をバイト列のまま調べる
+
+        確実にわかる場合だけ NOT_FOUND・INCOMPATIBLE を返し、構造が想定と違う場合は PARSE を返す
+        (NOT_FOUND・INCOMPATIBLE の場合はスクレイピングした場合と同じ例外になることを tests/test_page_classification.py で確認している)
+
+    Args:
+        content (Union[bytes, bytearray, mmap.mmap]): netkeibaのレース結果ページのHTML(EUC-JPのバイト列。mmap でもよい)
+
+    Returns:
+        PageVerdict
+    """
+    if content.find(RACE_RESULT_TABLE_MARKER) < 0:
+        return PageVerdict.NOT_FOUND
+
+    # スクレイピング時は以下の順に調べる(レース番号・距離が読み取れなければ障害・直線かどうかより先に ValueError になる)
+    race_data_start = content.find(_RACE_DATA_MARKER)
+    if race_data_start < 0 or content.rfind(_ACTIVE_RACE_TRACK_MARKER, 0, race_data_start) < 0:
+        return PageVerdict.PARSE
+    race_data = bytes(content[race_data_start:race_data_start + _MAX_RACE_DATA_LENGTH])
+
+    race_number = re.search(rb'<dt>\s*(\d+)', race_data)
+    course = re.search(rb'<h1>.*?<diary_snap_cut>\s*<span>([^<]*)</span>', race_data, re.DOTALL)
+    if race_number is None or course is None:
+        return PageVerdict.PARSE
+
+    course_text = course.group(1).decode(ENCODING_OF_WEB_PAGE, errors='replace')
+    if re.search(r'(\d{4})m', course_text) is None or len(course_text) < 2:
+        return PageVerdict.PARSE
+    if course_text[0] == '障' or course_text[1] == '直':
+        return PageVerdict.INCOMPATIBLE
+    return PageVerdict.PARSE
+
+
+# 部分的にパースする場合の文書(スクレイピング時のセレクタ・XPath がそのまま使えるように #main から同じ深さに置く)
+_SCOPED_DOCUMENT_TEMPLATE = """<html><body><div id="main"><div><div><div>
+{race_tracks}
+{race_data}
+</div></div></diary_snap>
+</div></div></div></div>
+{race_result_table}
+</body></html>"""
+
+
+def extract_regions(html: str) -> Optional[str]:
+    """ ページからスクレイピングに使う部分だけを取り出した HTML を作る
+
+        ページの大半はナビゲーション・広告・サイドバー・スクリプトなどで、スクレイピングに使うのは以下の部分だけなので、
+        それらを文字列のまま探して切り出し、パースする量(時間・メモリ)を減らす
+
+        - 競馬場のタブ(ul.race_place)
+        - レース番号・レース名・コース情報・開催日(diary_snap の中の dl.racedata とその後の p.smalltxt)
+        - レース結果の表(table[summary=レース結果])
+
+        切り出した部分はページ中と同じ構造の位置に置くので、スクレイピング時の処理はそのまま使える
+        (全体をパースした場合と同じ結果になることを tests/test_scoped_parsing.py で確認している)
+
+    Args:
+        html (str): netkeibaのレース結果ページのHTML
+
+    Returns:
+        Optional[str]: いずれかの部分が見つからない・入れ子になっている場合は None (全体をパースすること)
+    """
+    race_tracks_start = html.find('<ul class="race_place')
+    race_tracks_end = html.find('</ul>', race_tracks_start)
+    if race_tracks_start < 0 or race_tracks_end < 0:
+        return None
+
+    race_data_start = html.find('<diary_snap>', race_tracks_end)
+    race_data_end = html.find('</dl>', race_data_start)
+    if race_data_start < 0 or race_data_end < 0:
+        return None
+    race_data_end += len('</dl>')
+    # 開催日(p.smalltxt)は dl.racedata のすぐ後にある
+    date_start = html.find('<p class="smalltxt">', race_data_end)
+    date_end = html.find('</p>', date_start)
+    if date_start < 0 or date_end < 0 or html.find('</div>', race_data_end, date_start) >= 0:
+        return None
+    race_data_end = date_end + len('</p>')
+
+    marker = html.find('summary="レース結果"', race_data_end)
+    table_start = html.rfind('<table', 0, marker)
+    table_end = html.find('</table>', marker)
+    # 表の中に表がある場合は最初の </table> が外側の表の終わりではない
+    if marker < 0 or table_start < race_data_end or table_end < 0 or html.find('<table', marker, table_end) >= 0:
+        return None
+
+    return _SCOPED_DOCUMENT_TEMPLATE.format(
+        race_tracks=html[race_tracks_start:race_tracks_end + len('</ul>')],
+        race_data=html[race_data_start:race_data_end],
+        race_result_table=html[table_start:table_end + len('</table>')],
+    )
+
+
+class ParserBackend(Enum):
+    """ HTMLのパースに使うライブラリ
+
+        どちらを使っても同じ結果になる(tests/test_parser_backends.py で確認している)
+    """
+    HTML_PARSER = 'html.parser'  # BeautifulSoup + 標準ライブラリの html.parser (遅いが追加の依存がない)
+    LXML = 'lxml'  # lxml + コンパイル済みの XPath
+
+
+class RacePageScraper:
+    @staticmethod
+    def scrape(file: IO, parser: ParserBackend = ParserBackend.HTML_PARSER, scoped: bool = False) -> RacePage:
+        """ レース情報とレース結果を1回のパースでまとめて取得する
+
+            RaceInformationScraper と RaceResultScraper を続けて呼ぶとページを2回パースすることになるので、
+            両方必要な場合はこちらを使う
+
+        Args:
+            file (IO): netkeibaのレース結果ページのHTMLファイル
+            parser (ParserBackend): HTMLのパースに使うライブラリ
+            scoped (bool): レース情報・レース結果の表の部分だけをパースする(詳細は extract_regions を参照)
+
+        Returns:
+            RacePage
+        """
+        document = _parse(file, parser, scoped)
 
         return {
-            'title': title_element.get_text(),
-            'race_track': RaceTracFactory.create(race_track_name),
-            'track_kind': TrackKindFactory.create(track_kind_mark),
-            'track_direction': TrackDirectionFactory.create(track_direction_mark),
-            'race_distance_by_meter': race_distance_by_meter,
-            'track_surface': TrackSurfaceParser.parse(text_under_the_title),
-            'weather': WeatherFactory.create(weather_mark),
-            'race_number': race_number,
-            'starts_at': datetime(2019, 7, 27, 9, 50),
+            'race_information': _build_race_information(document.race_header()),
+            'race_records': _build_race_records(document.race_result_rows()),
         }
 
 
+class RaceInformationScraper:
+    @staticmethod
+    def scrape(file: IO, parser: ParserBackend = ParserBackend.HTML_PARSER, scoped: bool = False) -> RaceInformation:
+        """
+        Args:
+            file (IO): netkeibaのレース結果ページのHTMLファイル
+            parser (ParserBackend): HTMLのパースに使うライブラリ
+            scoped (bool): レース情報・レース結果の表の部分だけをパースする(詳細は extract_regions を参照)
+
+        Returns:
+            RaceInformation
+        """
+        return _build_race_information(_parse(file, parser, scoped).race_header())
+
+
 class RaceResultScraper:
     @staticmethod
-    def scrape(file: IO) -> List[RaceRecord]:
+    def scrape(file: IO, parser: ParserBackend = ParserBackend.HTML_PARSER, scoped: bool = False) -> List[RaceRecord]:
         """
         Args:
             file (IO): netkeibaのレース結果ページのHTMLファイル
+            parser (ParserBackend): HTMLのパースに使うライブラリ
+            scoped (bool): レース情報・レース結果の表の部分だけをパースする(詳細は extract_regions を参照)
 
         Returns:
             List[RaceRecord]
         """
-        soup = BeautifulSoup(file, 'html.parser')
-        race_result_table = soup.find('table', attrs={'summary': 'レース結果'})
-        if race_result_table is None:
+        return _build_race_records(_parse(file, parser, scoped).race_result_rows())
+
+
+# 以下はパースに使うライブラリごとの実装
+# ライブラリに依存するのはページから文字列を取り出すところまでで、取り出した文字列の解釈は共通の処理で行う
+
+class _RaceHeader(NamedTuple):
+    title: str
+    text_under_the_title: str  # 例: 芝右1800m / 天候 : 曇 / 芝 : 良 / 発走 : 09:50
+    race_number_text: str  # 例: 1 R
+    race_track_name: str
+    date_text: str  # 例: 2019年7月27日 1回札幌1日目 2歳未勝利
+
+
+class _RaceResultRow(NamedTuple):
+    cell_texts: List[str]  # レース結果の表の1行の各セルの文字列(使用する馬体重の列まで)
+    horse_link: Optional[str]
+    jockey_link: Optional[str]
+
+
+# 着順〜馬体重までの列数(これより右の列は使わないので取り出さない)
+NUMBER_OF_USED_COLUMNS = 15
+HORSE_COLUMN_INDEX = 3
+JOCKEY_COLUMN_INDEX = 6
+
+
+class _SoupDocument:
+    def __init__(self, file: IO) -> None:
+        self.soup = BeautifulSoup(file, 'html.parser')
+
+        # netkeiba側の仕様でレースデータが存在しないページにアクセスしても404をHTTPステータスコードとしてレスポンスしないので、
+        # データが存在しない掲載されていないファイルが渡ってくることも想定してここでデータがない場合の制御をする
+        self.race_result_table = self.soup.find('table', attrs={'summary': 'レース結果'})
+        if self.race_result_table is None:
             raise DataNotFound
-        race_result_table_rows = race_result_table.find_all('tr')
 
-        race_records = []
+    def race_header(self) -> _RaceHeader:
+        soup = self.soup
+        return _RaceHeader(
+            title=soup.select_one(
+                '#main > div > div > div > diary_snap > div > div > dl > dd > h1').get_text(),
+            text_under_the_title=soup.select_one(
+                '#main > div > div > div > diary_snap > div > div > dl > dd > p > diary_snap_cut > span').get_text(),
+            race_number_text=soup.select_one(
+                '#main > div > div > div > diary_snap > div > div > dl > dt').get_text(),
+            race_track_name=soup.select_one(
+                '#main > div > div > div > ul > li > a.active').get_text(),
+            date_text=soup.select_one(
+                '#main > div > div > div > diary_snap > div > div > p.smalltxt').get_text(),
+        )
+
+    def race_result_rows(self) -> List[_RaceResultRow]:
+        rows = []
+        # 最初の要素は項目行(header)なのでスキップ
+        for row in self.race_result_table.find_all('tr')[1:]:
+            cells = row.find_all('td', limit=NUMBER_OF_USED_COLUMNS)
+            rows.append(_RaceResultRow(
+                cell_texts=[cell.get_text() for cell in cells],
+                horse_link=self._link_of(cells, HORSE_COLUMN_INDEX),
+                jockey_link=self._link_of(cells, JOCKEY_COLUMN_INDEX),
+            ))
+        return rows
+
+    @staticmethod
+    def _link_of(cells: List[Tag], index: int) -> Optional[str]:
+        if len(cells) <= index:
+            return None
+        anchor = cells[index].find('a')
+        return None if anchor is None else anchor.get('href')
+
+
+class _LxmlDocument:
+    XPATHS: Dict[str, Any] = {}
+
+    def __init__(self, file: IO) -> None:
+        try:
+            import lxml.html
+        except ImportError:
+            raise ImportError("lxml is required to use ParserBackend.LXML.")
 
+        if not self.XPATHS:
+            self._compile_xpaths()
+
+        self.root = lxml.html.document_fromstring(file.read())
+
+        race_result_tables = self.XPATHS['race_result_table'](self.root)
+        if not race_result_tables:
+            raise DataNotFound
+        self.race_result_table = race_result_tables[0]
+
+    @classmethod
+    def _compile_xpaths(cls) -> None:
+        from lxml.etree import XPath
+
+        race_data = "//*[@id='main']/div/div/div/diary_snap/div/div/dl"
+        cls.XPATHS.update({
+            'race_result_table': XPath("//table[@summary='レース結果']"),
+            'title': XPath(f"string(({race_data}/dd/h1)[1])"),
+            'text_under_the_title': XPath(f"string(({race_data}/dd/p/diary_snap_cut/span)[1])"),
+            'race_number_text': XPath(f"string(({race_data}/dt)[1])"),
+            'race_track_name': XPath(
+                "string((//*[@id='main']/div/div/div/ul/li/a[contains(concat(' ', normalize-space(@class), ' '), ' active ')])[1])"),
+            'date_text': XPath(
+                "string((//*[@id='main']/div/div/div/diary_snap/div/div/p[contains(concat(' ', normalize-space(@class), ' '), ' smalltxt ')])[1])"),
+            'rows': XPath('.//tr'),
+            'cells': XPath('.//td'),
+            'link': XPath('string((.//a/@href)[1])'),
+        })
+
+    def race_header(self) -> _RaceHeader:
+        return _RaceHeader(
+            title=str(self.XPATHS['title'](self.root)),
+            text_under_the_title=str(self.XPATHS['text_under_the_title'](self.root)),
+            race_number_text=str(self.XPATHS['race_number_text'](self.root)),
+            race_track_name=str(self.XPATHS['race_track_name'](self.root)),
+            date_text=str(self.XPATHS['date_text'](self.root)),
+        )
+
+    def race_result_rows(self) -> List[_RaceResultRow]:
+        rows = []
         # 最初の要素は項目行(header)なのでスキップ
-        for row in race_result_table_rows[1:]:
-            cells = row.find_all('td')
-
-            try:
-                order_of_placing = int(cells[0].get_text())
-            except ValueError:
-                # 正常な結果として入ってくる自然数以外に
-                # 2(降) 、中、除、取 などが入ってくる
-                # 最初のものは降着とわかるが、それ以外のものはまだ意味がわかってないのでいったん記録しない
-                continue
-
-            bracket_number = int(cells[1].get_text())
-            horse_number = int(cells[2].get_text())
-
-            if s := re.search(r'horse/(\d+)', cells[3].find('a')['href']):
-                horse_id = int(s.group(1))
-            else:
-                raise ValueError("can't parse horse id.")
-
-            horse_name = cells[3].get_text().strip()
-            horse_age = int(cells[4].get_text()[1])
-            horse_gender = HorseGenderFactory.create(cells[4].get_text()[0])
-            impost = float(cells[5].get_text())
-
-            if s := re.search(r'jockey/result/recent/(\d+)', cells[6].find('a')['href']):
-                jockey_id = s.group(1)
-            else:
-                raise ValueError("can't parse jockey id.")
-
-            jockey_name = cells[6].get_text().strip()
-
-            if f := re.findall(r'^(\d{1}):(\d{2})\.(\d{1})', cells[7].get_text()):
-                minute, second, split_second = [
-                    int(time_data) for time_data in f[0]]
-                race_time = (minute * 60) + second + (split_second * 0.1)
-            else:
-                raise ValueError("can't parse race time.")
-
-            win_betting_ratio = float(cells[12].get_text())
-            favorite_order = int(cells[13].get_text())
-
-            if f := re.findall(r'(\d{3})\(([+-]?\d{1,2})\)', cells[14].get_text()):
-                horse_weight, weight_change = [
-                    int(weight_data) for weight_data in f[0]]
-            else:
-                raise ValueError("can't parse weight data.")
-
-            race_record: RaceRecord = {
-                'order_of_placing': order_of_placing,
-                'bracket_number': bracket_number,
-                'horse_number': horse_number,
-                'horse_id': horse_id,
-                'horse_name': horse_name,
-                'horse_age': horse_age,
-                'horse_gender': horse_gender,
-                'impost': impost,
-                'jockey_id': jockey_id,
-                'jockey_name': jockey_name,
-                'race_time': race_time,
-                'win_betting_ratio': win_betting_ratio,
-                'favorite_order': favorite_order,
-                'horse_weight': horse_weight,
-                'weight_change': weight_change,
-            }
-            race_records.append(race_record)
-
-        return race_records
+        for row in self.XPATHS['rows'](self.race_result_table)[1:]:
+            cells = self.XPATHS['cells'](row)[:NUMBER_OF_USED_COLUMNS]
+            rows.append(_RaceResultRow(
+                cell_texts=[str(cell.text_content()) for cell in cells],
+                horse_link=self._link_of(cells, HORSE_COLUMN_INDEX),
+                jockey_link=self._link_of(cells, JOCKEY_COLUMN_INDEX),
+            ))
+        return rows
+
+    def _link_of(self, cells: list, index: int) -> Optional[str]:
+        if len(cells) <= index:
+            return None
+        return str(self.XPATHS['link'](cells[index])) or None
+
+
+def _parse(file: IO, parser: ParserBackend, scoped: bool = False) -> Union[_SoupDocument, _LxmlDocument]:
+    """
+    Raises:
+        DataNotFound: レース結果の表が存在しない場合
+    """
+    if scoped:
+        html = file.read()
+        file = io.StringIO(extract_regions(html) or html)
+    if parser == ParserBackend.LXML:
+        return _LxmlDocument(file)
+    return _SoupDocument(file)
+
+
+def _build_race_information(race_header: _RaceHeader) -> RaceInformation:
+    text_under_the_title = race_header.text_under_the_title
+
+    if s := re.search(r'(\d{4})m', text_under_the_title):
+        race_distance_by_meter = int(s.group(1))
+    else:
+        raise ValueError("can't parse race distance.")
+
+    if s := re.search(r'\d+', race_header.race_number_text):
+        race_number = int(s.group())
+    else:
+        raise ValueError("can't parse race number.")
+
+    track_kind_mark = text_under_the_title[0]
+    if track_kind_mark == '障':
+        raise IncompatibleDataDetected
+
+    track_direction_mark = text_under_the_title[1]
+    if track_direction_mark == '直':
+        raise IncompatibleDataDetected
+
+    if s := re.search(r'天候 : (\w+)', text_under_the_title):
+        weather_mark = s.group(1)
+    else:
+        raise ValueError("can't parse weather.")
+
+    if s := re.search(r'(\d{4})年(\d{1,2})月(\d{1,2})日', race_header.date_text):
+        year, month, day = [int(date_data) for date_data in s.groups()]
+    else:
+        raise ValueError("can't parse race date.")
+
+    if s := re.search(r'発走 : (\d{1,2}):(\d{2})', text_under_the_title):
+        hour, minute = [int(time_data) for time_data in s.groups()]
+    else:
+        raise ValueError("can't parse start time.")
+
+    return {
+        'title': race_header.title,
+        'race_track': RACE_TRACK_CODES.member(race_header.race_track_name),
+        'track_kind': TRACK_KIND_CODES.member(track_kind_mark),
+        'track_direction': TRACK_DIRECTION_CODES.member(track_direction_mark),
+        'race_distance_by_meter': race_distance_by_meter,
+        'track_surface': TrackSurfaceParser.parse(text_under_the_title),
+        'weather': WEATHER_CODES.member(weather_mark),
+        'race_number': race_number,
+        'starts_at': datetime(year, month, day, hour, minute),
+    }
+
+
+def _build_race_records(race_result_rows: List[_RaceResultRow]) -> List[RaceRecord]:
+    race_records = []
+
+    for row in race_result_rows:
+        cells = row.cell_texts
+
+        try:
+            order_of_placing = int(cells[0])
+        except ValueError:
+            # 正常な結果として入ってくる自然数以外に
+            # 2(降) 、中、除、取 などが入ってくる
+            # 最初のものは降着とわかるが、それ以外のものはまだ意味がわかってないのでいったん記録しない
+            continue
+
+        bracket_number = int(cells[1])
+        horse_number = int(cells[2])
+
+        if s := re.search(r'horse/(\d+)', row.horse_link or ''):
+            horse_id = int(s.group(1))
+        else:
+            raise ValueError("can't parse horse id.")
+
+        horse_name = cells[3].strip()
+        horse_age = int(cells[4][1])
+        horse_gender = HORSE_GENDER_CODES.member(cells[4][0])
+        impost = float(cells[5])
+
+        # 騎手ページへのリンクは "/jockey/result/recent/05339/" の形式と "/jockey/05339/" の形式がある
+        if s := re.search(r'jockey/(?:result/recent/)?(\d+)', row.jockey_link or ''):
+            jockey_id = s.group(1)
+        else:
+            raise ValueError("can't parse jockey id.")
+
+        jockey_name = cells[6].strip()
+
+        if f := re.findall(r'^(\d{1}):(\d{2})\.(\d{1})', cells[7]):
+            minute, second, split_second = [
+                int(time_data) for time_data in f[0]]
+            race_time = (minute * 60) + second + (split_second * 0.1)
+        else:
+            raise ValueError("can't parse race time.")
+
+        win_betting_ratio = float(cells[12])
+        favorite_order = int(cells[13])
+
+        if f := re.findall(r'(\d{3})\(([+-]?\d{1,2})\)', cells[14]):
+            horse_weight, weight_change = [
+                int(weight_data) for weight_data in f[0]]
+        else:
+            raise ValueError("can't parse weight data.")
+
+        race_record: RaceRecord = {
+            'order_of_placing': order_of_placing,
+            'bracket_number': bracket_number,
+            'horse_number': horse_number,
+            'horse_id': horse_id,
+            'horse_name': horse_name,
+            'horse_age': horse_age,
+            'horse_gender': horse_gender,
+            'impost': impost,
+            'jockey_id': jockey_id,
+            'jockey_name': jockey_name,
+            'race_time': race_time,
+            'win_betting_ratio': win_betting_ratio,
+            'favorite_order': favorite_order,
+            'horse_weight': horse_weight,
+            'weight_change': weight_change,
+        }
+        race_records.append(race_record)
+
+    return race_records
 
 
 class TrackSurfaceParser:
@@ -186,6 +496,6 @@ class TrackSurfaceParser:
             TrackSurface
         """
         if s := re.search(r'(芝|ダート) : (\w+)', text):
-            return TrackSurfaceFactory.create(s.group(2))
+            return TRACK_SURFACE_CODES.member(s.group(2))
         else:
             raise ValueError("can't parse track surface.")
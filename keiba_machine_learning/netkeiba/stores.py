@@ -0,0 +1,325 @@
+"""ダウンロードしたレースページの保存先
+
+    以下の2種類を用意しており、get_page_store で取得できるものが Race.file などで使われる
+    (デフォルトは DirectoryPageStore で、set_page_store で差し替えられる)
+
+    - DirectoryPageStore: 1レース1ファイル({race_id}.html)で保存する
+    - ArchivePageStore: 年ごとに1つのファイルにまとめて圧縮して保存する
+
+    何十年分もダウンロードすると数十万ファイルになり、ファイルの一覧取得が遅い・inodeを消費する・読み込みが散らばるといった問題があるので、
+    その場合は ArchivePageStore を使う
+"""
+import gzip
+import io
+import os
+import struct
+import tempfile
+from abc import ABC, abstractmethod
+from typing import IO, BinaryIO, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from keiba_machine_learning.netkeiba.constants import ENCODING_OF_WEB_PAGE, RACE_DATA_DIR
+from keiba_machine_learning.netkeiba.race_ids import year_of
+
+
+def write_atomically(file_path: str, content: bytes) -> None:
+    """ 一時ファイルに書き込んでから rename することで、中途半端な内容のファイルが残らないように保存する
+
+    Args:
+        file_path (str): 保存先のパス
+        content (bytes): 保存する内容
+    """
+    directory = os.path.dirname(file_path)
+    file_descriptor, temporary_file_path = tempfile.mkstemp(
+        dir=directory, prefix='.', suffix='.tmp')
+    try:
+        with os.fdopen(file_descriptor, mode='wb') as file:
+            file.write(content)
+        os.replace(temporary_file_path, file_path)
+    except BaseException:
+        os.unlink(temporary_file_path)
+        raise
+
+
+class PageStore(ABC):
+    """ レースIDをキーにしてページ(EUC-JPのバイト列)を保存する """
+
+    @abstractmethod
+    def read(self, race_id: int) -> bytes:
+        """
+        Raises:
+            KeyError: 保存されていない場合
+        """
+
+    @abstractmethod
+    def write(self, race_id: int, content: bytes) -> None:
+        pass
+
+    @abstractmethod
+    def size(self, race_id: int) -> Optional[int]:
+        """
+        Returns:
+            Optional[int]: 保存されているページのバイト数(保存されていなければ None)
+        """
+
+    @abstractmethod
+    def race_ids(self) -> List[int]:
+        """
+        Returns:
+            List[int]: 保存されているレースIDの一覧(昇順)
+        """
+
+    def __contains__(self, race_id: int) -> bool:
+        return self.size(race_id) is not None
+
+    def fingerprint(self, race_id: int) -> Optional[str]:
+        """ ページを読み込まずに内容が変わったかどうかを判定するための値
+
+            ページが書き換えられると変わるが、内容が同じでも変わることはある(その場合は無駄に読み直すだけ)
+
+        Returns:
+            Optional[str]: 保存されていなければ None
+        """
+        size = self.size(race_id)
+        return None if size is None else str(size)
+
+    def open(self, race_id: int) -> IO:
+        """ スクレイパーに渡せるようにテキストモードのファイルオブジェクトとして開く """
+        return io.TextIOWrapper(io.BytesIO(self.read(race_id)), encoding=ENCODING_OF_WEB_PAGE)
+
+    def iter_pages(self, race_ids: Optional[Iterable[int]] = None) -> Iterator[Tuple[int, bytes]]:
+        """ ページをまとめて読み込む
+
+            保存先の並び順で読み込むので、渡したレースIDの順番通りに返ってくるとは限らない
+
+        Args:
+            race_ids (Optional[Iterable[int]]): 対象のレースID(省略時は保存されている全て)
+
+        Returns:
+            Iterator[Tuple[int, bytes]]: レースIDとページの組
+        """
+        for race_id in sorted(self.race_ids() if race_ids is None else race_ids):
+            yield race_id, self.read(race_id)
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self) -> 'PageStore':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+class DirectoryPageStore(PageStore):
+    """ 1レース1ファイルで {directory}/{race_id}.html として保存する(従来の形式) """
+
+    def __init__(self, directory: str = RACE_DATA_DIR) -> None:
+        self.directory = directory
+
+    def file_path(self, race_id: int) -> str:
+        return os.path.join(self.directory, f'{race_id}.html')
+
+    def read(self, race_id: int) -> bytes:
+        try:
+            with open(self.file_path(race_id), mode='rb') as file:
+                return file.read()
+        except FileNotFoundError:
+            raise KeyError(race_id)
+
+    def write(self, race_id: int, content: bytes) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        write_atomically(self.file_path(race_id), content)
+
+    def size(self, race_id: int) -> Optional[int]:
+        try:
+            return os.stat(self.file_path(race_id)).st_size
+        except FileNotFoundError:
+            return None
+
+    def fingerprint(self, race_id: int) -> Optional[str]:
+        try:
+            stat = os.stat(self.file_path(race_id))
+        except FileNotFoundError:
+            return None
+        return f'{stat.st_size}:{stat.st_mtime_ns}'
+
+    def race_ids(self) -> List[int]:
+        race_ids = []
+        for file_name in os.listdir(self.directory):
+            race_id, extension = os.path.splitext(file_name)
+            if extension == '.html' and race_id.isdigit():
+                race_ids.append(int(race_id))
+        return sorted(race_ids)
+
+    def open(self, race_id: int) -> IO:
+        return open(self.file_path(race_id), mode='r', encoding=ENCODING_OF_WEB_PAGE)
+
+
+class ArchiveIndexEntry(NamedTuple):
+    offset: int  # アーカイブ内での開始位置
+    length: int  # 圧縮後のバイト数
+    size: int  # 圧縮前のバイト数
+
+
+class ArchivePageStore(PageStore):
+    """ 年ごとに {directory}/{year}.pages.gz にまとめて保存する
+
+        - 1ページを1つの gzip メンバーとして追記していく(ファイル全体としても gzip として展開できる)
+        - 各ページの位置は {directory}/{year}.index に固定長のレコードとして追記していく
+        - 同じレースIDを書き込んだ場合は後に書き込んだものが有効になる(古いものは領域として残る)
+
+        ページ本体を書き込んでからインデックスを書き込むので、途中でクラッシュしても
+        インデックスに載っているページが壊れていることはない
+    """
+
+    INDEX_RECORD = struct.Struct('<QQII')  # race_id, offset, length, size
+
+    def __init__(self, directory: str, compress_level: int = 6) -> None:
+        self.directory = directory
+        self.compress_level = compress_level
+        self._indexes: Dict[int, Dict[int, ArchiveIndexEntry]] = {}
+        self._readers: Dict[int, BinaryIO] = {}
+
+    def __getstate__(self) -> dict:
+        # 別プロセスに渡す場合はインデックスや開いているファイルは渡さず、渡った先で読み込み直す
+        return {'directory': self.directory, 'compress_level': self.compress_level}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(**state)  # type: ignore
+
+    def archive_path(self, year: int) -> str:
+        return os.path.join(self.directory, f'{year}.pages.gz')
+
+    def index_path(self, year: int) -> str:
+        return os.path.join(self.directory, f'{year}.index')
+
+    def years(self) -> List[int]:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(int(file_name.split('.')[0]) for file_name in os.listdir(self.directory)
+                      if file_name.endswith('.index') and file_name.split('.')[0].isdigit())
+
+    def read(self, race_id: int) -> bytes:
+        year = year_of(race_id)
+        entry = self._index_of(year)[race_id]
+        reader = self._reader_of(year)
+        reader.seek(entry.offset)
+        return gzip.decompress(reader.read(entry.length))
+
+    def write(self, race_id: int, content: bytes) -> None:
+        self.write_many([(race_id, content)])
+
+    def write_many(self, pages: Iterable[Tuple[int, bytes]]) -> None:
+        """ まとめて書き込む(同じ年のページを続けて渡すと効率が良い) """
+        os.makedirs(self.directory, exist_ok=True)
+        year: Optional[int] = None
+        archive: Optional[BinaryIO] = None
+        records: List[bytes] = []
+        try:
+            for race_id, content in pages:
+                if year != year_of(race_id):
+                    if archive is not None:
+                        self._commit(year, archive, records)
+                        archive = None
+                    year = year_of(race_id)
+                    archive = open(self.archive_path(year), mode='ab')
+                    records = []
+
+                compressed = gzip.compress(content, compresslevel=self.compress_level, mtime=0)
+                offset = archive.tell()
+                archive.write(compressed)
+                records.append(self.INDEX_RECORD.pack(race_id, offset, len(compressed), len(content)))
+        finally:
+            if archive is not None:
+                self._commit(year, archive, records)
+
+    def size(self, race_id: int) -> Optional[int]:
+        entry = self._index_of(year_of(race_id)).get(race_id)
+        return None if entry is None else entry.size
+
+    def fingerprint(self, race_id: int) -> Optional[str]:
+        # 書き換えると必ず末尾に追記されるので、位置が変わる
+        entry = self._index_of(year_of(race_id)).get(race_id)
+        return None if entry is None else f'{entry.offset}:{entry.length}:{entry.size}'
+
+    def race_ids(self) -> List[int]:
+        return sorted(race_id for year in self.years() for race_id in self._index_of(year))
+
+    def iter_pages(self, race_ids: Optional[Iterable[int]] = None) -> Iterator[Tuple[int, bytes]]:
+        """ アーカイブ内の並び順で読み込むので、大きなファイルを先頭から順に読むことになる """
+        if race_ids is None:
+            race_ids = self.race_ids()
+
+        race_ids_by_year: Dict[int, List[int]] = {}
+        for race_id in race_ids:
+            race_ids_by_year.setdefault(year_of(race_id), []).append(race_id)
+
+        for year in sorted(race_ids_by_year):
+            index = self._index_of(year)
+            entries = sorted(((index[race_id], race_id) for race_id in race_ids_by_year[year]))
+            with open(self.archive_path(year), mode='rb', buffering=1024 * 1024) as archive:
+                for entry, race_id in entries:
+                    archive.seek(entry.offset)
+                    yield race_id, gzip.decompress(archive.read(entry.length))
+
+    def close(self) -> None:
+        for reader in self._readers.values():
+            reader.close()
+        self._readers.clear()
+
+    def _index_of(self, year: int) -> Dict[int, ArchiveIndexEntry]:
+        if year not in self._indexes:
+            index: Dict[int, ArchiveIndexEntry] = {}
+            try:
+                with open(self.index_path(year), mode='rb') as index_file:
+                    data = index_file.read()
+            except FileNotFoundError:
+                data = b''
+
+            # 書き込み途中でクラッシュした場合に末尾のレコードが欠けていることがあるので、その分は無視する
+            record_size = self.INDEX_RECORD.size
+            for race_id, offset, length, size in self.INDEX_RECORD.iter_unpack(
+                    data[:len(data) - len(data) % record_size]):
+                index[race_id] = ArchiveIndexEntry(offset, length, size)
+            self._indexes[year] = index
+        return self._indexes[year]
+
+    def _reader_of(self, year: int) -> BinaryIO:
+        if year not in self._readers:
+            self._readers[year] = open(self.archive_path(year), mode='rb')
+        return self._readers[year]
+
+    def _commit(self, year: int, archive: BinaryIO, records: List[bytes]) -> None:
+        """ ページ本体をディスクに書き出してからインデックスに追記する """
+        archive.flush()
+        os.fsync(archive.fileno())
+        archive.close()
+
+        with open(self.index_path(year), mode='ab') as index_file:
+            index_file.write(b''.join(records))
+
+        index = self._index_of(year)
+        for race_id, offset, length, size in self.INDEX_RECORD.iter_unpack(b''.join(records)):
+            index[race_id] = ArchiveIndexEntry(offset, length, size)
+
+        # 読み込み用に開いているファイルは追記前の内容をバッファしているかもしれないので開き直させる
+        reader = self._readers.pop(year, None)
+        if reader is not None:
+            reader.close()
+
+
+_page_store: Optional[PageStore] = None
+
+
+def get_page_store() -> PageStore:
+    """ Race.file やダウンローダーが使う保存先を返す(未設定の場合は RACE_DATA_DIR の DirectoryPageStore) """
+    global _page_store
+    if _page_store is None:
+        _page_store = DirectoryPageStore(RACE_DATA_DIR)
+    return _page_store
+
+
+def set_page_store(page_store: Optional[PageStore]) -> None:
+    """ 保存先を差し替える(None を渡すとデフォルトに戻る) """
+    global _page_store
+    _page_store = page_store
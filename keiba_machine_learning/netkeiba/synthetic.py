@@ -0,0 +1,362 @@
+"""負荷試験・ベンチマーク用に netkeiba のレースページに似せたページを生成する
+
+    スクレイパーが読み取る部分(競馬場のタブ・レース名・コース情報・開催日・レース結果の表)は実際のページと同じ構造で、
+    EUC-JP で出力する。それ以外の部分(広告・メニューなど)は padding の大きさの埋め草で代用する
+
+    以下のようなページが含まれる
+    - 通常のレース: 頭数・競馬場・芝/ダート・距離・天候・馬場状態・オッズなどがばらつく
+    - 着順が 中(競走中止)・除(競走除外)・取(出走取消) の馬を含むレース
+    - 障害レース(スクレイピングすると IncompatibleDataDetected になる)
+    - レース結果がないページ(スクレイピングすると DataNotFound になる)
+
+    同じ seed・レースIDからは常に同じページができる(レースごとに独立して生成するので並列にも作れる)
+
+    Examples:
+        corpus = SyntheticCorpus(seed=0)
+        store = DirectoryPageStore('/tmp/synthetic_race')
+        write_corpus(corpus, store, synthetic_race_ids(range(1986, 2020)))
+"""
+import datetime
+import random
+from enum import Enum
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from keiba_machine_learning.models import (RACE_TRACK_CODES, TRACK_SURFACE_CODES, WEATHER_CODES, HorseGender,
+                                           RaceTrac, TrackSurface, Weather)
+from keiba_machine_learning.netkeiba.constants import ENCODING_OF_WEB_PAGE
+from keiba_machine_learning.netkeiba.race_ids import all_race_ids, decode
+from keiba_machine_learning.netkeiba.stores import PageStore
+
+
+class PageKind(Enum):
+    RACE = 'race'  # レース結果があるページ
+    JUMP = 'jump'  # 障害レース
+    EMPTY = 'empty'  # レース結果がないページ
+
+
+# 着順の欄に数字以外が入る場合(スクレイピング時は読み飛ばされる)
+SCRATCH_MARKS = ('中', '除', '取')
+
+_MARKS_OF_RACE_TRACKS = {member: mark for mark, member in RACE_TRACK_CODES.members_indexed_by_mark.items()}
+_MARKS_OF_WEATHERS = {member: mark for mark, member in WEATHER_CODES.members_indexed_by_mark.items()}
+_MARKS_OF_TRACK_SURFACES = {member: mark for mark, member in TRACK_SURFACE_CODES.members_indexed_by_mark.items()}
+_MARKS_OF_GENDERS = {HorseGender.MALE: '牡', HorseGender.FEMALE: '牝', HorseGender.CASTRATED: 'セ'}
+
+_KATAKANA = 'アイウエオカキクケコサシスセソタチツテトナニヌネノハヒフヘホマミムメモヤユヨラリルレロワン'
+_FAMILY_NAMES = ('武', '岩田', '福永', '川田', '戸崎', '横山', '田辺', '松山', '池添', '北村', '坂井', '吉田', '丸山', '藤岡')
+_GIVEN_NAMES = ('豊', '康誠', '祐一', '将雅', '圭太', '典弘', '裕信', '弘平', '謙一', '友一', '瑠星', '隼人', '元気', '佑介')
+_DISTANCES = {'芝': (1000, 1200, 1400, 1600, 1800, 2000, 2200, 2400, 2500, 3000, 3200),
+              'ダ': (1000, 1150, 1200, 1400, 1600, 1700, 1800, 2100, 2400)}
+_TITLES = ('2歳未勝利', '2歳新馬', '3歳未勝利', '3歳1勝クラス', '1勝クラス', '2勝クラス', '3勝クラス', 'オープン')
+
+
+class SyntheticCorpus:
+    """ レースIDからページを生成する """
+
+    def __init__(self, seed: int = 0, empty_ratio: float = 0.1, jump_ratio: float = 0.03,
+                 scratch_ratio: float = 0.02, min_field_size: int = 5, max_field_size: int = 18,
+                 jockey_count: int = 150, padding: int = 30_000) -> None:
+        """
+        Args:
+            seed (int): 乱数のシード
+            empty_ratio (float): レース結果がないページの割合
+            jump_ratio (float): 障害レースの割合
+            scratch_ratio (float): 各馬が 中・除・取 になる確率
+            min_field_size (int): 最小の頭数
+            max_field_size (int): 最大の頭数
+            jockey_count (int): 騎手の人数
+            padding (int): スクレイピングに使わない部分の大きさ(バイト数。実際のページは 40KB 前後)
+        """
+        if not 1 <= min_field_size <= max_field_size <= 18:
+            raise ValueError("field sizes must be between 1 and 18.")
+
+        self.seed = seed
+        self.empty_ratio = empty_ratio
+        self.jump_ratio = jump_ratio
+        self.scratch_ratio = scratch_ratio
+        self.min_field_size = min_field_size
+        self.max_field_size = max_field_size
+        self.jockeys = _make_jockeys(random.Random(f'{seed}:jockeys'), jockey_count)
+        self.padding = padding
+
+    def page_kind(self, race_id: int) -> PageKind:
+        rng = self._random(race_id, 'kind')
+        value = rng.random()
+        if value < self.empty_ratio:
+            return PageKind.EMPTY
+        if value < self.empty_ratio + self.jump_ratio:
+            return PageKind.JUMP
+        return PageKind.RACE
+
+    def page(self, race_id: int) -> bytes:
+        """ レースIDに対応するページ(EUC-JP) """
+        kind = self.page_kind(race_id)
+        if kind == PageKind.EMPTY:
+            html = _EMPTY_PAGE_TEMPLATE.format(padding=self._padding(race_id))
+        else:
+            html = self._race_page(race_id, kind)
+        return html.encode(ENCODING_OF_WEB_PAGE)
+
+    def iter_pages(self, race_ids: Iterable[int]) -> Iterator[Tuple[int, bytes]]:
+        for race_id in race_ids:
+            yield int(race_id), self.page(int(race_id))
+
+    def _race_page(self, race_id: int, kind: PageKind) -> str:
+        rng = self._random(race_id, 'race')
+        year, race_track_value, series_number, day_number, race_number = decode(int(race_id))
+        race_track = RaceTrac(race_track_value)
+
+        track_kind_mark = rng.choice(('芝', 'ダ'))
+        distance = rng.choice(_DISTANCES[track_kind_mark])
+        weather = rng.choice(list(Weather))
+        track_surface = rng.choices(list(TrackSurface), weights=(70, 15, 10, 5))[0]
+        hour, minute = divmod(9 * 60 + 50 + (race_number - 1) * 30, 60)
+        course = f"{'障' if kind == PageKind.JUMP else ''}{track_kind_mark}{rng.choice('右左')}{distance}m"
+        text_under_the_title = '&nbsp;/&nbsp;'.join([
+            course,
+            f'天候 : {_MARKS_OF_WEATHERS[weather]}',
+            f"{'芝' if track_kind_mark == '芝' else 'ダート'} : {_MARKS_OF_TRACK_SURFACES[track_surface]}",
+            f'発走 : {hour:02d}:{minute:02d}',
+        ])
+
+        # 開催日は回・日目の順に並ぶようにする(土日の2日ずつ、1回あたり7週)
+        race_date = datetime.date(year, 1, 5) + datetime.timedelta(
+            days=(series_number - 1) * 49 + (day_number - 1) // 2 * 7 + (day_number - 1) % 2)
+        title = rng.choice(_TITLES)
+
+        race_tracks = ''.join(
+            f'<li><a href="/race/{year}{other.value:02d}{series_number:02d}{day_number:02d}{race_number:02d}/" '
+            f'''{'class="active"' if other == race_track else ''}>{_MARKS_OF_RACE_TRACKS[other]}</a></li>'''
+            for other in sorted({race_track, *rng.sample(list(RaceTrac), 2)}, key=lambda member: member.value))
+
+        return _RACE_PAGE_TEMPLATE.format(
+            race_id=race_id,
+            race_tracks=race_tracks,
+            race_number=race_number,
+            title=title,
+            text_under_the_title=text_under_the_title,
+            date_text=(f'{race_date.year}年{race_date.month}月{race_date.day}日 '
+                       f'{series_number}回{_MARKS_OF_RACE_TRACKS[race_track]}{day_number}日目 {title}'),
+            rows=''.join(self._rows(rng, race_id, distance)),
+            padding=self._padding(race_id),
+        )
+
+    def _rows(self, rng: random.Random, race_id: int, distance: int) -> Iterator[str]:
+        field_size = rng.randint(self.min_field_size, self.max_field_size)
+        brackets = _bracket_numbers(field_size)
+
+        # 強さの順に着順・人気・タイムを決める(人気は強さに乱数を足した順)
+        strengths = sorted((rng.gauss(0, 1) for _ in range(field_size)), reverse=True)
+        horse_numbers = rng.sample(range(1, field_size + 1), field_size)
+        popularity = sorted(range(field_size), key=lambda i: -(strengths[i] + rng.gauss(0, 1)))
+        favorite_orders = [0] * field_size
+        for order, i in enumerate(popularity):
+            favorite_orders[i] = order + 1
+        odds = sorted(round(rng.uniform(1.1, 3.0) * (1.6 ** order), 1) for order in range(field_size))
+
+        seconds = distance / rng.uniform(16.0, 17.5)
+        placing = 0
+        scratched_rows = []
+        for i in range(field_size):
+            horse_number = horse_numbers[i]
+            horse = self._horse(rng, race_id)
+            jockey_id, jockey_name = rng.choice(self.jockeys)
+            if rng.random() < self.scratch_ratio:
+                scratched_rows.append(_row(rng.choice(SCRATCH_MARKS), brackets[horse_number - 1], horse_number,
+                                           horse, jockey_id, jockey_name, race_time='', odds='', favorite_order=''))
+                continue
+
+            placing += 1
+            seconds += rng.uniform(0.0, 0.6)
+            minute, tenths = divmod(int(round(seconds * 10)), 600)
+            yield _row(str(placing), brackets[horse_number - 1], horse_number, horse, jockey_id, jockey_name,
+                       race_time=f'{minute}:{tenths // 10:02d}.{tenths % 10}', odds=f'{odds[favorite_orders[i] - 1]:.1f}',
+                       favorite_order=str(favorite_orders[i]))
+        # 中・除・取 の馬は表の最後に並ぶ
+        yield from scratched_rows
+
+    def _horse(self, rng: random.Random, race_id: int) -> Tuple[int, str, str, str, str]:
+        """ (馬ID, 馬名, 性齢, 斤量, 馬体重) """
+        year = race_id // 10 ** 8
+        age = rng.randint(2, 8)
+        horse_id = (year - age) * 10 ** 6 + rng.randint(100_000, 109_999)
+        name = ''.join(rng.choice(_KATAKANA) for _ in range(rng.randint(3, 9)))
+        gender = rng.choices(list(_MARKS_OF_GENDERS.values()), weights=(50, 40, 10))[0]
+        impost = rng.choice(('51', '52', '53', '54', '55', '56', '57', '58', '54.5', '55.5'))
+        weight = rng.randint(400, 560)
+        change = rng.randint(-20, 20)
+        return horse_id, name, f'{gender}{age}', impost, f'{weight}({change:+d})' if change else f'{weight}(0)'
+
+    def _padding(self, race_id: int) -> str:
+        if self.padding <= 0:
+            return ''
+        line = f'<!-- {race_id} -->\n'
+        return line * max(1, self.padding // len(line))
+
+    def _random(self, race_id: int, purpose: str) -> random.Random:
+        return random.Random(f'{self.seed}:{purpose}:{int(race_id)}')
+
+
+def synthetic_race_ids(years: Iterable[int], scale: float = 1.0, seed: int = 0) -> np.ndarray:
+    """ 生成するレースIDを選ぶ
+
+        実際は1年に約3,500レース(存在しうるレースIDの約4割)なので、scale=1.0 ならその程度の数を選ぶ
+        1年分のレースIDの数(8,400)を超える分は年を増やすこと(10倍なら years を10倍にするなど)
+        そのため年は実在する範囲(1986年〜今年)に限らず、4桁であれば受け付ける
+
+    Args:
+        years (Iterable[int]): 年(1000〜9999)
+        scale (float): 実際のレース数に対する倍率
+        seed (int): 乱数のシード
+
+    Returns:
+        np.ndarray: 昇順のレースID
+
+    Raises:
+        ValueError: 4桁でない年がある場合(レースIDが12桁にならない)
+    """
+    rng = np.random.default_rng(seed)
+    selected = []
+    for year in years:
+        if not 1000 <= year <= 9999:
+            raise ValueError(f"year must have 4 digits: {year}")
+        race_ids = all_race_ids(year, validate=False)
+        count = min(len(race_ids), int(round(len(race_ids) * 0.41 * scale)))
+        selected.append(np.sort(rng.choice(race_ids, size=count, replace=False)))
+    return np.concatenate(selected) if selected else np.array([], dtype=np.int64)
+
+
+def write_corpus(corpus: SyntheticCorpus, store: PageStore, race_ids: Iterable[int],
+                 on_written: Optional[Callable[[int], None]] = None) -> int:
+    """ 生成したページを保存先に書き込む
+
+    Returns:
+        int: 書き込んだページ数
+    """
+    count = 0
+    for race_id, content in corpus.iter_pages(race_ids):
+        store.write(race_id, content)
+        count += 1
+        if on_written is not None:
+            on_written(race_id)
+    return count
+
+
+def _make_jockeys(rng: random.Random, count: int) -> List[Tuple[str, str]]:
+    return [(f'{i + 1:05d}', rng.choice(_FAMILY_NAMES) + rng.choice(_GIVEN_NAMES)) for i in range(count)]
+
+
+def _bracket_numbers(field_size: int) -> List[int]:
+    """ 馬番 → 枠番(8頭以下は馬番と同じ、それ以上は後ろの枠から2頭・3頭にする) """
+    if field_size <= 8:
+        return list(range(1, field_size + 1))
+    sizes = [field_size // 8] * 8
+    for i in range(field_size % 8):
+        sizes[7 - i] += 1
+    return [bracket for bracket, size in enumerate(sizes, start=1) for _ in range(size)]
+
+
+def _row(placing: str, bracket_number: int, horse_number: int, horse: Tuple[int, str, str, str, str],
+         jockey_id: str, jockey_name: str, race_time: str, odds: str, favorite_order: str) -> str:
+    horse_id, horse_name, gender_and_age, impost, weight = horse
+    return _ROW_TEMPLATE.format(placing=placing, bracket_number=bracket_number, horse_number=horse_number,
+                                horse_id=horse_id, horse_name=horse_name, gender_and_age=gender_and_age,
+                                impost=impost, jockey_id=jockey_id, jockey_name=jockey_name, race_time=race_time,
+                                odds=odds, favorite_order=favorite_order, weight=weight)
+
+
+_HEAD = '''<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Transitional//EN" "http://www.w3.org/TR/xhtml1/DTD/xhtml1-transitional.dtd">
+<html xmlns="http://www.w3.org/1999/xhtml" lang="ja" xml:lang="ja" id="html">
+<head>
+<meta http-equiv="content-type" content="text/html; charset=euc-jp" />
+<title>競馬データベース - netkeiba.com</title>
+</head>
+'''
+
+_RACE_PAGE_TEMPLATE = _HEAD + '''<body>
+<div id="contents" class="fc">
+<div id="main">
+<div class="netkeiba_toprace_block">
+<div class="race_head">
+<div class="race_head_inner">
+<ul class="race_place fc">
+{race_tracks}
+</ul>
+<diary_snap>
+<div class="mainrace_data fc">
+<div class="data_intro">
+<dl class="racedata fc">
+<dt>
+{race_number} R
+</dt>
+<dd>
+<h1>{title}</h1>
+<p>
+<diary_snap_cut>
+<span>{text_under_the_title}</span><br />
+</diary_snap_cut>
+</p>
+</dd>
+</dl>
+<p class="smalltxt">{date_text}</p>
+</div>
+</div>
+</diary_snap>
+</div>
+</div>
+</div>
+</div>
+</div>
+{padding}<table class="race_table_01 nk_tb_common" summary="レース結果" cellspacing="1" cellpadding="0">
+<tr class="txt_c">
+<th nowrap="nowrap">着<br />順</th><th nowrap="nowrap">枠<br />番</th><th nowrap="nowrap">馬<br />番</th>
+<th nowrap="nowrap">馬名</th><th nowrap="nowrap">性齢</th><th nowrap="nowrap">斤量</th><th nowrap="nowrap">騎手</th>
+<th nowrap="nowrap">タイム</th><th nowrap="nowrap">着差</th>
+<diary_snap_cut><th nowrap="nowrap">ﾀｲﾑ<br />指数</th><th nowrap="nowrap">通過</th><th nowrap="nowrap">上り</th></diary_snap_cut>
+<th nowrap="nowrap">単勝</th><th nowrap="nowrap">人<br />気</th><th nowrap="nowrap">馬体重</th>
+<th nowrap="nowrap">調教師</th>
+</tr>
+{rows}</table>
+<a href="/race/movie/{race_id}">レース映像</a>
+</body>
+</html>
+'''
+
+_ROW_TEMPLATE = '''<tr>
+<td class="txt_r" nowrap="nowrap">{placing}</td>
+<td class="w{bracket_number}ml" align="right" nowrap="nowrap"><span>{bracket_number}</span></td>
+<td class="txt_r" nowrap="nowrap">{horse_number}</td>
+<td class="txt_l" nowrap="nowrap">
+<a href="/horse/{horse_id}/" title="{horse_name}">{horse_name}</a>
+</td>
+<td class="txt_c" nowrap="nowrap">{gender_and_age}</td>
+<td class="txt_c" nowrap="nowrap">{impost}</td>
+<td class="txt_l" nowrap="nowrap">
+<a href="/jockey/{jockey_id}/" title="{jockey_name}">{jockey_name}</a>
+</td>
+<td class="txt_r" nowrap="nowrap">{race_time}</td>
+<td class="txt_c" nowrap="nowrap"></td>
+<diary_snap_cut>
+<td class="speed_index bml" nowrap="nowrap">**</td>
+<td nowrap="nowrap"></td>
+<td class="txt_c" nowrap="nowrap"><span></span></td>
+</diary_snap_cut>
+<td class="txt_r" nowrap="nowrap">{odds}</td>
+<td class="r1ml" align="right" nowrap="nowrap"><span>{favorite_order}</span></td>
+<td nowrap="nowrap">{weight}</td>
+<td class="txt_l" nowrap="nowrap">[東]</td>
+</tr>
+'''
+
+_EMPTY_PAGE_TEMPLATE = _HEAD + '''<body>
+<div id="contents" class="fc">
+<div id="main">
+<div class="netkeiba_toprace_block">
+</div>
+</div>
+</div>
+{padding}</body>
+</html>
+'''
@@ -0,0 +1,40 @@
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from keiba_machine_learning.netkeiba import models
+from keiba_machine_learning.netkeiba.stores import ArchivePageStore, DirectoryPageStore, set_page_store
+from keiba_machine_learning.netkeiba.tests.helpers import StubHandler
+
+
+@pytest.fixture(params=['directory', 'archive'])
+def store(request, tmp_path):
+    """ 空のページの保存先(レースごとのファイル・年ごとのアーカイブの両方で試す) """
+    if request.param == 'directory':
+        store = DirectoryPageStore(str(tmp_path / 'pages'))
+    else:
+        store = ArchivePageStore(str(tmp_path / 'pages'))
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def stub_server():
+    StubHandler.failures = {}
+    StubHandler.existing_race_ids = None
+    StubHandler.requested_paths = []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def race_data_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(models, 'RACE_DATA_DIR', str(tmp_path))
+    set_page_store(DirectoryPageStore(str(tmp_path)))
+    yield tmp_path
+    set_page_store(None)
@@ -0,0 +1,47 @@
+""" テストで共有するフィクスチャのページ・スタブのHTTPハンドラ(pytest のフィクスチャは conftest.py に置く) """
+import os
+from http.server import BaseHTTPRequestHandler
+
+base_path = os.path.dirname(os.path.abspath(__file__))
+
+with open(os.path.join(base_path, "./fixtures/201901010101.html"), mode="rb") as fixture:
+    RACE_PAGE = fixture.read()
+
+with open(os.path.join(base_path, "./fixtures/empty_page.html"), mode="rb") as fixture:
+    EMPTY_PAGE = fixture.read()
+
+with open(os.path.join(base_path, "./fixtures/disability_race_page.html"), mode="rb") as fixture:
+    DISABILITY_RACE_PAGE = fixture.read()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """ netkeiba の代わりにフィクスチャのHTMLを返すハンドラ
+
+        - /race/{race_id} のうち failures に登録されている回数だけ 503 を返す
+        - existing_race_ids が指定されている場合はそこに含まれないレースで空のページを返す
+          (netkeiba はデータがなくても 404 を返さないのでそれに合わせている)
+    """
+    protocol_version = 'HTTP/1.1'
+    failures: dict = {}
+    existing_race_ids = None
+    requested_paths: list = []
+
+    def do_GET(self):
+        self.requested_paths.append(self.path)
+        race_id = self.path.rstrip('/').split('/')[-1]
+
+        if self.failures.get(race_id, 0) > 0:
+            self.failures[race_id] -= 1
+            status, body = 503, b''
+        elif self.existing_race_ids is not None and int(race_id) not in self.existing_race_ids:
+            status, body = 200, EMPTY_PAGE
+        else:
+            status, body = 200, RACE_PAGE
+
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
@@ -0,0 +1,53 @@
+import os
+
+from keiba_machine_learning.models import RaceTrac
+from keiba_machine_learning.netkeiba.models import Race
+from keiba_machine_learning.netkeiba.crawlers import RaceCalendarCrawler
+from keiba_machine_learning.netkeiba.downloaders import RacePageDownloader
+from keiba_machine_learning.netkeiba.scrapers import has_race_result
+from keiba_machine_learning.netkeiba.tests.helpers import RACE_PAGE, EMPTY_PAGE, StubHandler
+
+
+def race_ids_of(series_number, day_number):
+    return [Race(year=2019, race_track=RaceTrac.SAPPORO, series_number=series_number,
+                 day_number=day_number, race_number=race_number).id
+            for race_number in range(1, Race.MAX_RACE_NUMBER + 1)]
+
+
+def test_has_race_result():
+    assert has_race_result(RACE_PAGE)
+    assert not has_race_result(EMPTY_PAGE)
+
+
+def test_crawl_only_held_days(stub_server, race_data_dir):
+    # 1回は2日目まで、2回は1日目だけ開催されていて3回以降は開催がない
+    held_race_ids = race_ids_of(1, 1) + race_ids_of(1, 2) + race_ids_of(2, 1)
+    StubHandler.existing_race_ids = set(held_race_ids)
+
+    crawler = RaceCalendarCrawler(RacePageDownloader(
+        requests_per_second=1000, max_connections=4, base_url=stub_server))
+    result = crawler.run(2019, race_tracks=[RaceTrac.SAPPORO])
+
+    assert [race.id for race in result.found_races] == sorted(held_race_ids)
+    assert result.failed_races == []
+    # 開催日の12レース × 3日 + 1回3日目・2回2日目・3回1日目の1レース目のみ
+    assert result.request_count == 12 * 3 + 3
+    assert len(StubHandler.requested_paths) == result.request_count
+    # 空のページは保存しない
+    assert sorted(os.listdir(race_data_dir)) == sorted(f'{race_id}.html' for race_id in held_race_ids)
+
+
+def test_crawl_resumes_from_saved_pages(stub_server, race_data_dir):
+    held_race_ids = race_ids_of(1, 1)
+    StubHandler.existing_race_ids = set(held_race_ids)
+    crawler = RaceCalendarCrawler(RacePageDownloader(
+        requests_per_second=1000, max_connections=4, base_url=stub_server))
+    crawler.run(2019, race_tracks=[RaceTrac.SAPPORO])
+
+    StubHandler.requested_paths = []
+    result = crawler.run(2019, race_tracks=[RaceTrac.SAPPORO])
+
+    assert [race.id for race in result.found_races] == sorted(held_race_ids)
+    # 保存済みのページは取得し直さない
+    assert result.request_count == 2
+    assert len(StubHandler.requested_paths) == 2
@@ -0,0 +1,183 @@
+import json
+import os
+
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+from keiba_machine_learning.netkeiba.datasets import (
+    SCRAPER_VERSION, STATE_FILE_NAME, DatasetWriter, apply_update, iter_race_results, load_race_results, partition_path,
+    partitions, plan_update)
+from keiba_machine_learning.netkeiba.pipelines import COLUMNS, iter_scraped_chunks
+from keiba_machine_learning.netkeiba.stores import DirectoryPageStore
+from keiba_machine_learning.netkeiba.tests.helpers import RACE_PAGE, EMPTY_PAGE
+
+ANOTHER_RACE_PAGE = RACE_PAGE.replace(b'<span>1</span>', b'<span>2</span>', 1)
+
+
+def build(store, directory, full=False, batch_size=50_000):
+    plan = plan_update(store.race_ids(), store=store, directory=directory, full=full)
+    chunks = iter_scraped_chunks(plan.scraping_race_ids, store=store, chunk_size=2)
+    written_partitions = apply_update(plan, (chunk.columns for chunk in chunks), batch_size=batch_size)
+    return plan, written_partitions
+
+
+def test_only_new_or_changed_pages_are_scraped(store, tmp_path):
+    directory = str(tmp_path / 'race_results')
+    store.write(201901010101, RACE_PAGE)
+    store.write(201901010102, EMPTY_PAGE)
+    store.write(201905010101, RACE_PAGE)
+
+    plan, written_partitions = build(store, directory)
+    assert plan.full
+    assert plan.scraping_race_ids == [201901010101, 201901010102, 201905010101]
+    assert written_partitions == [(2019, 1), (2019, 5)]
+    assert os.path.exists(os.path.join(directory, STATE_FILE_NAME))
+
+    # データが存在しないページも含めて、変わっていないものはスクレイピングしない
+    plan, written_partitions = build(store, directory)
+    assert plan.scraping_race_ids == []
+    assert written_partitions == []
+
+    store.write(201901010102, ANOTHER_RACE_PAGE)
+    store.write(202001010101, RACE_PAGE)
+    plan, written_partitions = build(store, directory)
+    assert plan.scraping_race_ids == [201901010102, 202001010101]
+    # 変更のない(年, 競馬場)のファイルは書き直さない
+    assert written_partitions == [(2019, 1), (2020, 1)]
+    incremental = load_race_results(directory=directory)
+
+    build(store, directory, full=True)
+    pd.testing.assert_frame_equal(incremental, load_race_results(directory=directory))
+    assert incremental['race_id'].is_monotonic_increasing
+    assert set(incremental['race_id']) == {201901010101, 201901010102, 201905010101, 202001010101}
+    assert (incremental[incremental['race_id'] == 201901010102]['bracket_number'].iloc[0]
+            != incremental[incremental['race_id'] == 201901010101]['bracket_number'].iloc[0])
+
+
+def test_removed_races_are_dropped(tmp_path):
+    directory = str(tmp_path / 'race_results')
+    store = DirectoryPageStore(str(tmp_path / 'pages'))
+    store.write(201901010101, RACE_PAGE)
+    store.write(201901010102, RACE_PAGE)
+    store.write(201905010101, RACE_PAGE)
+    build(store, directory)
+
+    os.remove(store.file_path(201901010101))
+    os.remove(store.file_path(201905010101))
+    plan, _ = build(store, directory)
+
+    assert plan.scraping_race_ids == []
+    assert plan.removed_race_ids == [201901010101, 201905010101]
+    assert set(load_race_results(directory=directory)['race_id']) == {201901010102}
+    # 行がなくなった(年, 競馬場)のファイルは削除する
+    assert partitions(directory) == [(2019, 1)]
+
+
+def test_rebuild_without_state(store, tmp_path):
+    directory = str(tmp_path / 'race_results')
+    store.write(201901010101, RACE_PAGE)
+    build(store, directory)
+    os.remove(os.path.join(directory, STATE_FILE_NAME))
+
+    plan, _ = build(store, directory)
+
+    assert plan.full
+    assert plan.scraping_race_ids == [201901010101]
+
+
+def test_rebuild_after_scraper_change(store, tmp_path):
+    """ 古いスクレイピング処理で作ったデータセットはページが変わっていなくても作り直す """
+    directory = str(tmp_path / 'race_results')
+    store.write(201901010101, RACE_PAGE)
+    build(store, directory)
+    state_path = os.path.join(directory, STATE_FILE_NAME)
+    with open(state_path) as file:
+        state = json.load(file)
+    with open(state_path, mode='w') as file:
+        json.dump({**state, 'scraper_version': SCRAPER_VERSION - 1}, file)
+
+    plan, _ = build(store, directory)
+
+    assert plan.full
+    assert plan.scraping_race_ids == [201901010101]
+
+
+def test_load_with_projection_and_filters(tmp_path):
+    directory = str(tmp_path / 'race_results')
+    store = DirectoryPageStore(str(tmp_path / 'pages'))
+    for race_id in [201901010101, 201905010101, 202005010101]:
+        store.write(race_id, RACE_PAGE)
+    build(store, directory)
+
+    df = load_race_results(directory=directory)
+    assert list(df.columns) == COLUMNS
+    assert str(df['race_track'].dtype) == 'int8'
+    assert str(df['impost'].dtype) == 'float32'
+    assert str(df['jockey_id'].dtype) == 'category'
+    assert str(df['horse_name'].dtype) == 'category'
+    assert pd.api.types.is_datetime64_dtype(df['starts_at'])
+    # 競馬場はファイルには含めずディレクトリ名で表す
+    assert os.path.exists(partition_path(directory, 2019, 5))
+
+    df = load_race_results(columns=['race_id', 'year', 'order_of_placing'],
+                           filters=[('year', '=', 2019), ('race_track', '=', 5)], directory=directory)
+    assert list(df.columns) == ['race_id', 'year', 'order_of_placing']
+    assert set(df['race_id']) == {201905010101}
+    assert set(df['year']) == {2019}
+
+
+def test_iter_race_results_in_shuffled_partition_order(tmp_path):
+    directory = str(tmp_path / 'race_results')
+    store = DirectoryPageStore(str(tmp_path / 'pages'))
+    for year in range(2010, 2020):
+        for race_track in [1, 5, 10]:
+            store.write(year * 10 ** 8 + race_track * 10 ** 6 + 10101, RACE_PAGE)
+    build(store, directory)
+
+    def partition_order(shuffle_seed):
+        batches = iter_race_results(columns=['race_id'], directory=directory, batch_size=1, shuffle_seed=shuffle_seed)
+        return [int(race_id) for df in batches for race_id in df['race_id'].unique()]
+
+    # シャッフルしない場合は年 → 競馬場の順
+    assert partition_order(None) == sorted(partition_order(None))
+    assert partition_order(0) == partition_order(0)
+    assert partition_order(0) != partition_order(1)
+    assert sorted(partition_order(0)) == partition_order(None)
+
+
+def test_small_batches_are_merged_with_existing_rows(tmp_path):
+    directory = str(tmp_path / 'race_results')
+    store = DirectoryPageStore(str(tmp_path / 'pages'))
+    for race_number in range(1, 13, 2):
+        store.write(201901010100 + race_number, RACE_PAGE)
+    build(store, directory)
+
+    # 既存のレースの間に入るレースを追加・変更する
+    for race_number in range(2, 13, 2):
+        store.write(201901010100 + race_number, RACE_PAGE)
+    store.write(201901010105, ANOTHER_RACE_PAGE)
+    build(store, directory, batch_size=10)
+    incremental = load_race_results(directory=directory)
+    assert pq.ParquetFile(partition_path(directory, 2019, 1)).num_row_groups > 1
+
+    build(store, directory, full=True)
+    pd.testing.assert_frame_equal(incremental, load_race_results(directory=directory))
+    assert incremental['race_id'].is_monotonic_increasing
+    assert len(set(incremental['race_id'])) == 12
+
+
+def test_writer_rejects_unordered_columns(tmp_path):
+    store = DirectoryPageStore(str(tmp_path / 'pages'))
+    store.write(201901010101, RACE_PAGE)
+    store.write(201901010102, RACE_PAGE)
+    directory = str(tmp_path / 'race_results')
+
+    with pytest.raises(ValueError):
+        with DatasetWriter(directory, batch_size=1) as writer:
+            for chunk in iter_scraped_chunks([201901010102, 201901010101], store=store, chunk_size=1):
+                writer.write(chunk.columns)
+
+    # 書き込み途中のファイルは残らない
+    assert partitions(directory) == []
+    assert [file_names for _, _, file_names in os.walk(directory) if file_names] == []
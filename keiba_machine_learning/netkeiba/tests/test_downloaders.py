@@ -0,0 +1,62 @@
+import asyncio
+import os
+import time
+
+from keiba_machine_learning.models import RaceTrac
+from keiba_machine_learning.netkeiba.models import Race
+from keiba_machine_learning.netkeiba.downloaders import RacePageDownloader, TokenBucket
+from keiba_machine_learning.netkeiba.tests.helpers import RACE_PAGE, StubHandler
+
+
+def create_races(count):
+    return [Race(year=2019, race_track=RaceTrac.SAPPORO, series_number=1, day_number=1, race_number=race_number)
+            for race_number in range(1, count + 1)]
+
+
+def test_download_races(stub_server, race_data_dir):
+    races = create_races(6)
+    downloader = RacePageDownloader(
+        requests_per_second=100, max_connections=3, base_url=stub_server)
+
+    assert downloader.run(races) == []
+    for race in races:
+        with open(race.file_path, mode='rb') as file:
+            assert file.read() == RACE_PAGE
+    assert sorted(StubHandler.requested_paths) == sorted(f'/race/{race.id}' for race in races)
+    # 一時ファイルが残っていないこと
+    assert sorted(os.listdir(race_data_dir)) == sorted(f'{race.id}.html' for race in races)
+
+
+def test_retry_with_backoff(stub_server, race_data_dir):
+    race = create_races(1)[0]
+    StubHandler.failures = {str(race.id): 2}
+    downloader = RacePageDownloader(
+        requests_per_second=100, max_retries=2, backoff_seconds=0.01, base_url=stub_server)
+
+    assert downloader.run([race]) == []
+    assert len(StubHandler.requested_paths) == 3
+    assert os.path.exists(race.file_path)
+
+
+def test_give_up_after_max_retries(stub_server, race_data_dir):
+    race = create_races(1)[0]
+    StubHandler.failures = {str(race.id): 3}
+    downloader = RacePageDownloader(
+        requests_per_second=100, max_retries=1, backoff_seconds=0.01, base_url=stub_server)
+
+    assert downloader.run([race]) == [race]
+    assert not os.path.exists(race.file_path)
+    assert os.listdir(race_data_dir) == []
+
+
+def test_token_bucket_limits_request_rate():
+    async def acquire_many(bucket, count):
+        for _ in range(count):
+            await bucket.acquire()
+
+    bucket = TokenBucket(rate=50)
+    started_at = time.monotonic()
+    asyncio.run(acquire_many(bucket, 11))
+
+    # 最初の1回は貯まっているトークンを使うので、残り10回分は 1/50 秒ずつ待たされる
+    assert time.monotonic() - started_at >= 0.19
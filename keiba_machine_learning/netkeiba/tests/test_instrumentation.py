@@ -0,0 +1,149 @@
+import json
+import os
+
+import pytest
+from prometheus_client.parser import text_string_to_metric_families
+
+from keiba_machine_learning.models import RaceTrac
+from keiba_machine_learning.netkeiba.datasets import apply_update, plan_update
+from keiba_machine_learning.netkeiba.downloaders import RacePageDownloader
+from keiba_machine_learning.netkeiba.instrumentation import (Histogram, PipelineMetrics, get_metrics, set_metrics,
+                                                             stage)
+from keiba_machine_learning.netkeiba.models import Race
+from keiba_machine_learning.netkeiba.pipelines import RacePageScrapingFailed, iter_scraped_chunks, scrape_race_pages
+from keiba_machine_learning.netkeiba.stores import DirectoryPageStore
+from keiba_machine_learning.netkeiba.tests.helpers import DISABILITY_RACE_PAGE, EMPTY_PAGE, RACE_PAGE, StubHandler
+
+@pytest.fixture
+def metrics():
+    metrics = PipelineMetrics()
+    set_metrics(metrics)
+    yield metrics
+    set_metrics(None)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = DirectoryPageStore(str(tmp_path / 'pages'))
+    os.makedirs(store.directory)
+    for race_number in range(1, 5):
+        store.write(201901010100 + race_number, RACE_PAGE)
+    store.write(201901010105, EMPTY_PAGE)
+    store.write(201901010106, DISABILITY_RACE_PAGE)
+    return store
+
+
+def test_histogram():
+    histogram = Histogram([0.1, 1.0])
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value)
+
+    # 上限ちょうどの値はそのバケットに入る
+    assert histogram.cumulative_counts() == {'0.1': 2, '1.0': 3, '+Inf': 4}
+    assert histogram.count == 4
+    assert histogram.sum == pytest.approx(2.65)
+
+    other = Histogram([0.1, 1.0])
+    other.observe(3.0)
+    histogram.merge(other)
+    assert histogram.cumulative_counts() == {'0.1': 2, '1.0': 3, '+Inf': 5}
+    assert histogram.max == 3.0
+    with pytest.raises(ValueError):
+        histogram.merge(Histogram([0.5]))
+
+
+def test_disabled_by_default(store):
+    assert get_metrics() is None
+    with stage('noop'):
+        pass
+    scrape_race_pages(store.race_ids(), store=store)
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_scraping(store, metrics, processes):
+    result = scrape_race_pages(store.race_ids(), store=store, processes=processes, chunk_size=2)
+
+    assert metrics.counters['pages_parsed'] == 4
+    assert metrics.counters['pages_not_found'] == 1
+    assert metrics.counters['pages_incompatible'] == 1
+    assert metrics.counters['parse_failures'] == 0
+    assert metrics.counters['pages_prefiltered'] == 2
+    assert metrics.counters['rows_emitted'] == len(result.columns['race_id'])
+    assert metrics.histograms['parse_seconds'].count == 6
+    assert metrics.peak_memory_bytes > 0
+
+
+def test_parse_failure(store, metrics):
+    store.write(201901010107, RACE_PAGE.replace(b'diary_snap', b'broken'))
+
+    with pytest.raises(RacePageScrapingFailed):
+        list(iter_scraped_chunks(store.race_ids(), store=store))
+    assert metrics.counters['parse_failures'] == 1
+
+
+def test_dataset_write_stage(store, metrics, tmp_path):
+    directory = str(tmp_path / 'dataset')
+    with stage('plan'):
+        plan = plan_update(store.race_ids(), store=store, directory=directory)
+    apply_update(plan, (chunk.columns for chunk in iter_scraped_chunks(plan.scraping_race_ids, store=store)))
+
+    assert set(metrics.stage_seconds) == {'plan', 'dataset_write'}
+    assert all(seconds > 0 for seconds in metrics.stage_seconds.values())
+
+
+def test_download(stub_server, race_data_dir, metrics):
+    races = [Race(year=2019, race_track=RaceTrac.SAPPORO, series_number=1, day_number=1, race_number=race_number)
+             for race_number in range(1, 4)]
+    StubHandler.failures = {str(races[0].id): 1, str(races[1].id): 5}
+    StubHandler.existing_race_ids = {races[0].id, races[1].id}
+    downloader = RacePageDownloader(requests_per_second=100, max_retries=1, backoff_seconds=0.01,
+                                    base_url=stub_server)
+
+    assert downloader.run(races) == [races[1]]
+    assert metrics.counters['fetch_requests'] == 5
+    assert metrics.counters['fetch_errors'] == 3
+    assert metrics.counters['fetch_failures'] == 1
+    assert metrics.counters['fetched_bytes'] == len(RACE_PAGE) + len(EMPTY_PAGE)
+    assert metrics.counters['pages_saved'] == 1
+    assert metrics.counters['pages_empty'] == 1
+    assert metrics.histograms['fetch_seconds'].count == 5
+
+
+def test_export(store, metrics, tmp_path):
+    scrape_race_pages(store.race_ids(), store=store)
+
+    families = {family.name: family for family in text_string_to_metric_families(metrics.to_prometheus().decode())}
+    assert families['keiba_pages_parsed'].samples[0].value == 4
+    assert families['keiba_parse_seconds'].type == 'histogram'
+    assert [sample.value for sample in families['keiba_parse_seconds'].samples
+            if sample.name == 'keiba_parse_seconds_count'] == [6]
+    assert families['keiba_peak_memory_bytes'].samples[0].value > 0
+
+    file_path = str(tmp_path / 'metrics.json')
+    metrics.save(file_path)
+    with open(file_path) as file:
+        summary = json.load(file)
+    assert summary['counters']['pages_parsed'] == 4
+    assert summary['histograms']['parse_seconds']['buckets']['+Inf'] == 6
+
+    metrics.save(str(tmp_path / 'metrics.prom'))
+    with open(tmp_path / 'metrics.prom') as file:
+        assert 'keiba_pages_not_found_total 1.0' in file.read()
+
+
+def test_merge():
+    metrics = PipelineMetrics()
+    other = PipelineMetrics()
+    other.increment('rows_emitted', 10)
+    other.observe('parse_seconds', 0.01)
+    other.peak_memory_bytes = 1024
+    with other.stage('plan'):
+        pass
+
+    metrics.merge(other)
+    metrics.merge(other)
+
+    assert metrics.counters['rows_emitted'] == 20
+    assert metrics.histograms['parse_seconds'].count == 2
+    assert metrics.peak_memory_bytes == 1024
+    assert 'plan' in metrics.stage_seconds
@@ -0,0 +1,179 @@
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+from keiba_machine_learning.models import RaceTrac
+from keiba_machine_learning.netkeiba.models import Race
+from keiba_machine_learning.netkeiba.crawlers import RaceCalendarCrawler
+from keiba_machine_learning.netkeiba.downloaders import RacePageDownloader
+from keiba_machine_learning.netkeiba.manifests import CrawlManifest, PageStatus
+from keiba_machine_learning.netkeiba.tests.helpers import RACE_PAGE, EMPTY_PAGE, StubHandler
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    with CrawlManifest(os.path.join(tmp_path, 'manifest', 'race_manifest.sqlite3')) as manifest:
+        yield manifest
+
+
+def create_race(race_number=1, day_number=1):
+    return Race(year=2019, race_track=RaceTrac.SAPPORO, series_number=1,
+                day_number=day_number, race_number=race_number)
+
+
+def test_record_and_get(manifest):
+    manifest.record(201901010101, PageStatus.OK, RACE_PAGE)
+    manifest.record(201901010102, PageStatus.EMPTY)
+
+    entry = manifest.get(201901010101)
+    assert entry.status == PageStatus.OK
+    assert entry.byte_size == len(RACE_PAGE)
+    assert manifest.get(201901010102).byte_size is None
+    assert manifest.get(201901010103) is None
+
+    manifest.update_status(201901010101, PageStatus.INCOMPATIBLE)
+    assert manifest.get(201901010101).status == PageStatus.INCOMPATIBLE
+    assert manifest.get(201901010101).byte_size == len(RACE_PAGE)
+
+
+def test_race_ids(manifest):
+    manifest.record(201901010102, PageStatus.OK, RACE_PAGE)
+    manifest.record(201901010101, PageStatus.OK, RACE_PAGE)
+    manifest.record(201901010103, PageStatus.EMPTY)
+    manifest.record(201901010104, PageStatus.FAILED)
+
+    assert manifest.race_ids() == [201901010101, 201901010102]
+    assert manifest.race_ids(PageStatus.FAILED) == [201901010104]
+
+
+def test_needs_fetch(manifest, race_data_dir):
+    unknown_race, failed_race, empty_race, ok_race, truncated_race = [
+        create_race(race_number) for race_number in range(1, 6)]
+    manifest.record(failed_race.id, PageStatus.FAILED)
+    manifest.record(empty_race.id, PageStatus.EMPTY)
+    for race in [ok_race, truncated_race]:
+        manifest.record(race.id, PageStatus.OK, RACE_PAGE)
+    with open(ok_race.file_path, mode='wb') as file:
+        file.write(RACE_PAGE)
+    with open(truncated_race.file_path, mode='wb') as file:
+        file.write(RACE_PAGE[:100])
+
+    assert manifest.needs_fetch(unknown_race)
+    assert manifest.needs_fetch(failed_race)
+    assert not manifest.needs_fetch(empty_race)
+    assert not manifest.needs_fetch(ok_race)
+    assert manifest.needs_fetch(truncated_race)
+
+
+def test_is_expired(manifest):
+    recent_race_id = Race(year=datetime.now().year, race_track=RaceTrac.SAPPORO, series_number=1,
+                          day_number=1, race_number=1).id
+    manifest.record(recent_race_id, PageStatus.EMPTY)
+    # 2019年のレースを今年取得して EMPTY だったものは開催がなかったとみなす
+    manifest.record(201901010101, PageStatus.EMPTY)
+    manifest.record(201901010102, PageStatus.FAILED)
+    recent_entry, past_entry, failed_entry = [manifest.get(race_id)
+                                              for race_id in (recent_race_id, 201901010101, 201901010102)]
+    later = recent_entry.fetched_at + timedelta(days=1)
+
+    assert not manifest.is_expired(recent_entry)
+    assert manifest.is_expired(recent_entry, now=later)
+    assert not manifest.is_expired(past_entry, now=later)
+    assert not manifest.is_expired(failed_entry, now=later)
+
+    manifest.empty_ttl = None
+    assert not manifest.is_expired(recent_entry, now=later)
+
+
+def test_needs_fetch_with_hash(manifest, race_data_dir):
+    race = create_race()
+    manifest.record(race.id, PageStatus.OK, RACE_PAGE)
+    with open(race.file_path, mode='wb') as file:
+        file.write(b'x' * len(RACE_PAGE))
+
+    assert not manifest.needs_fetch(race)
+    assert manifest.needs_fetch(race, check_hash=True)
+
+
+def test_register_files(manifest, race_data_dir):
+    ok_race, empty_race, missing_race = [create_race(race_number) for race_number in range(1, 4)]
+    for race, content in [(ok_race, RACE_PAGE), (empty_race, EMPTY_PAGE)]:
+        with open(race.file_path, mode='wb') as file:
+            file.write(content)
+
+    manifest.register_files([ok_race, empty_race, missing_race])
+
+    assert manifest.get(ok_race.id).status == PageStatus.OK
+    assert manifest.get(empty_race.id).status == PageStatus.EMPTY
+    assert manifest.get(missing_race.id) is None
+
+
+def test_crawl_skips_known_empty_pages(stub_server, race_data_dir, manifest):
+    held_race_ids = [create_race(race_number).id for race_number in range(1, Race.MAX_RACE_NUMBER + 1)]
+    StubHandler.existing_race_ids = set(held_race_ids)
+    crawler = RaceCalendarCrawler(RacePageDownloader(
+        requests_per_second=1000, base_url=stub_server, manifest=manifest))
+    crawler.run(2019, race_tracks=[RaceTrac.SAPPORO])
+
+    assert manifest.race_ids() == held_race_ids
+    assert manifest.get(create_race(day_number=2).id).status == PageStatus.EMPTY
+
+    StubHandler.requested_paths = []
+    result = crawler.run(2019, race_tracks=[RaceTrac.SAPPORO])
+
+    assert [race.id for race in result.found_races] == held_race_ids
+    assert result.request_count == 0
+    assert StubHandler.requested_paths == []
+
+
+def test_crawl_refetches_failed_and_corrupt_pages(stub_server, race_data_dir, manifest):
+    held_race_ids = [create_race(race_number).id for race_number in range(1, Race.MAX_RACE_NUMBER + 1)]
+    StubHandler.existing_race_ids = set(held_race_ids)
+    StubHandler.failures = {str(held_race_ids[1]): 1}
+    crawler = RaceCalendarCrawler(RacePageDownloader(
+        requests_per_second=1000, max_retries=0, base_url=stub_server, manifest=manifest))
+    crawler.run(2019, race_tracks=[RaceTrac.SAPPORO])
+
+    assert manifest.get(held_race_ids[1]).status == PageStatus.FAILED
+    corrupt_race = create_race(race_number=3)
+    with open(corrupt_race.file_path, mode='wb') as file:
+        file.write(RACE_PAGE[:100])
+
+    StubHandler.requested_paths = []
+    result = crawler.run(2019, race_tracks=[RaceTrac.SAPPORO])
+
+    assert [race.id for race in result.found_races] == held_race_ids
+    assert sorted(StubHandler.requested_paths) == sorted([f'/race/{held_race_ids[1]}', f'/race/{corrupt_race.id}'])
+    assert manifest.race_ids() == held_race_ids
+
+
+def test_crawl_refetches_expired_empty_pages(stub_server, race_data_dir, tmp_path):
+    """ まだ結果が掲載されていなかった日も、記録が古くなれば取得し直して見つけられる """
+    this_year = datetime.now().year
+    first_day, second_day = [[Race(year=this_year, race_track=RaceTrac.SAPPORO, series_number=1,
+                                   day_number=day_number, race_number=race_number).id
+                              for race_number in range(1, Race.MAX_RACE_NUMBER + 1)] for day_number in (1, 2)]
+    StubHandler.existing_race_ids = set(first_day)
+    file_path = os.path.join(tmp_path, 'manifest', 'race_manifest.sqlite3')
+
+    with CrawlManifest(file_path) as manifest:
+        crawler = RaceCalendarCrawler(RacePageDownloader(
+            requests_per_second=1000, base_url=stub_server, manifest=manifest))
+        crawler.run(this_year, race_tracks=[RaceTrac.SAPPORO])
+        assert manifest.get(second_day[0]).status == PageStatus.EMPTY
+
+        # 記録したばかりの EMPTY は取得し直さない
+        StubHandler.existing_race_ids = set(first_day + second_day)
+        StubHandler.requested_paths = []
+        assert crawler.run(this_year, race_tracks=[RaceTrac.SAPPORO]).request_count == 0
+
+    with CrawlManifest(file_path, empty_ttl=timedelta(0)) as manifest:
+        crawler = RaceCalendarCrawler(RacePageDownloader(
+            requests_per_second=1000, base_url=stub_server, manifest=manifest))
+        result = crawler.run(this_year, race_tracks=[RaceTrac.SAPPORO])
+
+        assert [race.id for race in result.found_races] == first_day + second_day
+        assert manifest.race_ids() == first_day + second_day
+        # 結果が保存済みの1日目は取得し直さない
+        assert not {f'/race/{race_id}' for race_id in first_day} & set(StubHandler.requested_paths)
@@ -0,0 +1,74 @@
+import io
+import mmap
+import os
+
+import pytest
+
+from keiba_machine_learning.netkeiba.constants import ENCODING_OF_WEB_PAGE
+from keiba_machine_learning.netkeiba.scrapers import (DataNotFound, IncompatibleDataDetected, PageVerdict,
+                                                      ParserBackend, RacePageScraper, classify_page)
+from keiba_machine_learning.netkeiba.synthetic import SyntheticCorpus, synthetic_race_ids
+from keiba_machine_learning.netkeiba.tests.helpers import RACE_PAGE
+
+base_path = os.path.dirname(os.path.abspath(__file__))
+fixture_names = sorted(os.listdir(os.path.join(base_path, "./fixtures")))
+
+
+def encode(text):
+    return text.encode(ENCODING_OF_WEB_PAGE)
+
+
+# 直線のレース・レース番号やコース情報が読み取れない(スクレイピングすると ValueError などになる)ページ
+MODIFIED_PAGES = {
+    'straight': RACE_PAGE.replace(encode('芝右1800m'), encode('芝直1000m')),
+    'jump_without_distance': RACE_PAGE.replace(encode('芝右1800m'), encode('障芝')),
+    'without_race_number': RACE_PAGE.replace(b'1 R\n</dt>', b'R\n</dt>'),
+    'without_course': RACE_PAGE.replace(encode('<span>芝右1800m'), encode('<b>芝右1800m')),
+}
+
+
+def expected_verdict(content, parser):
+    """ スクレイピングした結果から期待する判定 """
+    try:
+        RacePageScraper.scrape(io.TextIOWrapper(io.BytesIO(content), encoding=ENCODING_OF_WEB_PAGE), parser=parser)
+    except DataNotFound:
+        return PageVerdict.NOT_FOUND
+    except IncompatibleDataDetected:
+        return PageVerdict.INCOMPATIBLE
+    except Exception:
+        # DataNotFound・IncompatibleDataDetected 以外で失敗するページはパースして失敗させる
+        pass
+    return PageVerdict.PARSE
+
+
+@pytest.mark.parametrize('parser', list(ParserBackend))
+@pytest.mark.parametrize('file_name', fixture_names)
+def test_fixtures(file_name, parser):
+    with open(os.path.join(base_path, "./fixtures", file_name), mode="rb") as file:
+        content = file.read()
+
+    assert classify_page(content) == expected_verdict(content, parser)
+
+
+@pytest.mark.parametrize('parser', list(ParserBackend))
+@pytest.mark.parametrize('name', list(MODIFIED_PAGES))
+def test_modified_pages(name, parser):
+    content = MODIFIED_PAGES[name]
+    assert classify_page(content) == expected_verdict(content, parser)
+
+
+def test_synthetic_pages():
+    corpus = SyntheticCorpus(empty_ratio=0.3, jump_ratio=0.3)
+    verdicts = set()
+    for _, content in corpus.iter_pages(synthetic_race_ids([2019], scale=0.02)):
+        verdict = classify_page(content)
+        assert verdict == expected_verdict(content, ParserBackend.LXML)
+        verdicts.add(verdict)
+
+    assert verdicts == set(PageVerdict)
+
+
+def test_memory_mapped_file():
+    with open(os.path.join(base_path, "./fixtures/disability_race_page.html"), mode="rb") as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as content:
+            assert classify_page(content) == PageVerdict.INCOMPATIBLE
@@ -0,0 +1,30 @@
+import os
+import pickle
+
+import pytest
+
+from keiba_machine_learning.netkeiba.scrapers import ParserBackend, RacePageScraper, RaceInformationScraper, RaceResultScraper
+from keiba_machine_learning.netkeiba.constants import ENCODING_OF_WEB_PAGE
+
+base_path = os.path.dirname(os.path.abspath(__file__))
+fixture_names = sorted(os.listdir(os.path.join(base_path, "./fixtures")))
+
+
+def scrape(scraper, file_name, parser):
+    with open(os.path.join(base_path, "./fixtures", file_name), mode="r", encoding=ENCODING_OF_WEB_PAGE) as file:
+        try:
+            return scraper.scrape(file, parser=parser)
+        except Exception as e:
+            # 例外になる場合はどの例外になるかまで一致させる
+            return type(e)
+
+
+@pytest.mark.parametrize('scraper', [RacePageScraper, RaceInformationScraper, RaceResultScraper])
+@pytest.mark.parametrize('file_name', fixture_names)
+def test_backends_return_identical_result(scraper, file_name):
+    expected = scrape(scraper, file_name, ParserBackend.HTML_PARSER)
+    actual = scrape(scraper, file_name, ParserBackend.LXML)
+
+    assert actual == expected
+    # str のサブクラスなどが混ざっていないことまで確認する
+    assert pickle.dumps(actual) == pickle.dumps(expected)
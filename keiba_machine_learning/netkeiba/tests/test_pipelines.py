@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from keiba_machine_learning.netkeiba.pipelines import COLUMNS, RacePageScrapingFailed, scrape_race_pages
+from keiba_machine_learning.netkeiba.stores import DirectoryPageStore
+from keiba_machine_learning.netkeiba.tests.helpers import DISABILITY_RACE_PAGE, EMPTY_PAGE, RACE_PAGE
+
+
+@pytest.fixture
+def store(store):
+    for race_number in range(1, 6):
+        store.write(201901010100 + race_number, RACE_PAGE)
+    store.write(201901010106, EMPTY_PAGE)
+    store.write(201901010107, DISABILITY_RACE_PAGE)
+    store.write(202001010101, RACE_PAGE)
+    return store
+
+
+def test_scrape_race_pages(store):
+    result = scrape_race_pages(store.race_ids(), store=store, chunk_size=3)
+
+    assert list(result.columns) == COLUMNS
+    assert result.not_found_race_ids == [201901010106]
+    assert result.incompatible_race_ids == [201901010107]
+    race_ids = result.columns['race_id']
+    assert sorted(set(race_ids)) == [201901010101, 201901010102, 201901010103,
+                                     201901010104, 201901010105, 202001010101]
+    assert result.columns['horse_id'].dtype == np.int64
+    assert result.columns['starts_at'].dtype == np.dtype('datetime64[s]')
+
+
+def test_multiprocess_result_is_same_as_single_process(store):
+    race_ids = store.race_ids()
+    single = scrape_race_pages(race_ids, store=store, processes=1, chunk_size=2)
+    multi = scrape_race_pages(race_ids, store=store, processes=2, chunk_size=2)
+
+    assert multi.not_found_race_ids == single.not_found_race_ids
+    assert multi.incompatible_race_ids == single.incompatible_race_ids
+    for column in COLUMNS:
+        np.testing.assert_array_equal(multi.columns[column], single.columns[column])
+
+
+def test_progress_is_reported_per_chunk(store):
+    progress = []
+    scrape_race_pages(store.race_ids(), store=store, chunk_size=3, on_progress=progress.append)
+
+    assert progress == [3, 3, 2]
+
+
+def test_failure_carries_race_id(tmp_path):
+    store = DirectoryPageStore(str(tmp_path))
+    store.write(201901010101, RACE_PAGE)
+    # 枠番の列を壊す
+    store.write(201901010102, RACE_PAGE.replace(b'<span>1</span>', b'<span>x</span>', 1))
+
+    for processes in (1, 2):
+        with pytest.raises(RacePageScrapingFailed) as exception_info:
+            scrape_race_pages(store.race_ids(), store=store, processes=processes)
+        assert exception_info.value.race_id == 201901010102
+
+
+def test_empty_input():
+    result = scrape_race_pages([], store=DirectoryPageStore('/nonexistent'))
+
+    assert all(len(values) == 0 for values in result.columns.values())
@@ -1,8 +1,42 @@
+import pydantic
+import pytest
+
 from keiba_machine_learning.models import RaceTrac
-from keiba_machine_learning.netkeiba.models import Race
+from keiba_machine_learning.netkeiba.models import Race, RaceKey, validate_race_keys
+from keiba_machine_learning.netkeiba.race_ids import all_race_ids
 
 
 def test_identifier():
     race = Race(year=2020, race_track=RaceTrac.SAPPORO,
                 series_number=1, day_number=1, race_number=1)
     assert race.id == 202001010101
+
+
+def test_race_key_is_interoperable_with_race():
+    race = Race(year=2019, race_track=RaceTrac.HANSHIN,
+                series_number=3, day_number=4, race_number=12)
+    race_key = RaceKey.from_race(race)
+
+    assert race_key == RaceKey.from_id(201909030412)
+    assert (race_key.id, race_key.url, race_key.file_path) == (race.id, race.url, race.file_path)
+    assert race_key.to_race() == race
+
+
+def test_race_key_from_ids():
+    race_ids = all_race_ids(2019)
+
+    race_keys = RaceKey.from_ids(race_ids)
+
+    assert [race_key.id for race_key in race_keys] == race_ids.tolist()
+    assert race_keys[0] == RaceKey(RaceTrac.SAPPORO, 2019, 1, 1, 1)
+    with pytest.raises(ValueError):
+        RaceKey.from_ids([201901010101, 201901010113])
+
+
+def test_validate_race_keys():
+    validate_race_keys([RaceKey(RaceTrac.SAPPORO, 2019, 1, 1, 1)])
+    validate_race_keys([])
+    with pytest.raises(ValueError):
+        validate_race_keys([RaceKey(RaceTrac.SAPPORO, 2019, 1, 1, 1), RaceKey(RaceTrac.SAPPORO, 2019, 8, 1, 1)])
+    with pytest.raises(pydantic.ValidationError):
+        RaceKey(RaceTrac.SAPPORO, 2019, 8, 1, 1).to_race()
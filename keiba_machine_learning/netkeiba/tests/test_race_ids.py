@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from keiba_machine_learning.models import Race as BaseRace, RaceTrac
+from keiba_machine_learning.netkeiba.models import Race
+from keiba_machine_learning.netkeiba.race_ids import all_race_ids, decode, encode, is_valid, race_track_of, validate
+
+
+def test_encode_and_decode_scalar():
+    race_id = encode(2019, 5, 2, 3, 11)
+
+    assert race_id == 201905020311
+    assert isinstance(race_id, int)
+    assert decode(race_id) == (2019, 5, 2, 3, 11)
+    assert race_track_of(race_id) == 5
+
+
+def test_encode_and_decode_arrays():
+    race_ids = encode(2019, np.array([1, 10]), 1, np.array([1, 2]), 12)
+
+    np.testing.assert_array_equal(race_ids, [201901010112, 201910010212])
+    components = decode(race_ids)
+    np.testing.assert_array_equal(components.race_track, [1, 10])
+    np.testing.assert_array_equal(components.day_number, [1, 2])
+    np.testing.assert_array_equal(components.race_number, [12, 12])
+
+
+def test_encode_with_invalid_components():
+    with pytest.raises(ValueError):
+        encode(2019, np.array([1, 11]), 1, 1, 1)
+    with pytest.raises(ValueError):
+        encode(1985, 1, 1, 1, 1)
+    # 検証しない場合はそのまま計算する
+    assert encode(2019, 11, 1, 1, 1, validate=False) == 201911010101
+
+
+def test_is_valid():
+    race_ids = np.array([201901010101, 201911010101, 201901080101, 201901011301, 198501010101])
+
+    np.testing.assert_array_equal(is_valid(race_ids), [True, False, False, False, False])
+    assert is_valid(201901010101) is True
+    assert is_valid(203001010101, max_year=2030) is True
+
+    with pytest.raises(ValueError, match='4 invalid race IDs'):
+        validate(race_ids)
+    validate(race_ids[:1])
+
+
+def test_all_race_ids():
+    race_ids = all_race_ids(2019)
+
+    assert len(race_ids) == len(RaceTrac) * BaseRace.MAX_SERIES_NUMBER * BaseRace.MAX_DAY_NUMBER * BaseRace.MAX_RACE_NUMBER
+    assert np.all(np.diff(race_ids) > 0)
+    assert is_valid(race_ids).all()
+    assert race_ids[0] == 201901010101
+    assert race_ids[-1] == 201910071012
+
+
+def test_race_uses_codec():
+    race = Race.from_id(201909030412)
+
+    assert race.race_track == RaceTrac.HANSHIN
+    assert (race.year, race.series_number, race.day_number, race.race_number) == (2019, 3, 4, 12)
+    assert race.id == 201909030412
+    assert hash(race) == race.id
+    assert [Race.from_id(race_id).id for race_id in all_race_ids(2019)[:30]] == all_race_ids(2019)[:30].tolist()
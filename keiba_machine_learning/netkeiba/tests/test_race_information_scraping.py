@@ -1,9 +1,11 @@
 import pytest
+import io
 import os
 from datetime import datetime
 
 from keiba_machine_learning.models import RaceTrac, TrackKind, TrackDirection, TrackSurface, Weather
-from keiba_machine_learning.netkeiba.scrapers import RaceInformationScraper, DataNotFound, IncompatibleDataDetected
+from keiba_machine_learning.netkeiba.scrapers import (ParserBackend, RaceInformationScraper, DataNotFound,
+                                                      IncompatibleDataDetected)
 from keiba_machine_learning.netkeiba.constants import ENCODING_OF_WEB_PAGE
 
 base_path = os.path.dirname(os.path.abspath(__file__))
@@ -28,6 +30,23 @@ def test_to_scrape_general_race_information():
         assert RaceInformationScraper.scrape(file) == expect_data
 
 
+@pytest.mark.parametrize('scoped', [False, True])
+@pytest.mark.parametrize('parser', list(ParserBackend))
+def test_starts_at_is_scraped_from_the_page(parser, scoped):
+    """ 発走日時はページの開催日(p.smalltxt)と発走時刻から読み取る """
+    file_path = os.path.normpath(os.path.join(
+        base_path, "./fixtures/201901010101.html"))
+    with open(file_path, mode="r", encoding=ENCODING_OF_WEB_PAGE) as file:
+        html = file.read()
+    html = html.replace('2019年7月27日 1回札幌1日目', '2019年8月4日 1回札幌6日目').replace('発走 : 09:50', '発走 : 15:25')
+
+    race_information = RaceInformationScraper.scrape(io.StringIO(html), parser=parser, scoped=scoped)
+    assert race_information['starts_at'] == datetime(2019, 8, 4, 15, 25)
+
+    with pytest.raises(ValueError):
+        RaceInformationScraper.scrape(io.StringIO(html.replace('2019年8月4日', '')), parser=parser, scoped=scoped)
+
+
 def test_to_scrape_disability_race_page():
     file_path = os.path.normpath(os.path.join(
         base_path, "./fixtures/disability_race_page.html"))
@@ -0,0 +1,41 @@
+import io
+import os
+
+import pytest
+
+from keiba_machine_learning.netkeiba.scrapers import RacePageScraper, RaceInformationScraper, RaceResultScraper, DataNotFound, IncompatibleDataDetected
+from keiba_machine_learning.netkeiba.constants import ENCODING_OF_WEB_PAGE
+
+base_path = os.path.dirname(os.path.abspath(__file__))
+
+
+def read_fixture(file_name):
+    with open(os.path.join(base_path, "./fixtures", file_name), mode="rb") as file:
+        return file.read()
+
+
+def open_as_text(content):
+    return io.TextIOWrapper(io.BytesIO(content), encoding=ENCODING_OF_WEB_PAGE)
+
+
+def test_to_scrape_general_race_page():
+    # 騎手ページへのリンクが旧形式("/jockey/result/recent/{id}/")のページでも取得できることを兼ねて確認する
+    content = read_fixture("201901010101.html").replace(
+        b'href="/jockey/', b'href="/jockey/result/recent/')
+
+    race_page = RacePageScraper.scrape(open_as_text(content))
+
+    assert race_page['race_information'] == RaceInformationScraper.scrape(open_as_text(content))
+    assert race_page['race_records'] == RaceResultScraper.scrape(open_as_text(content))
+    assert len(race_page['race_records']) == 9
+    assert race_page['race_records'][0]['jockey_id'] == '05339'
+
+
+def test_to_scrape_disability_race_page():
+    with pytest.raises(IncompatibleDataDetected):
+        RacePageScraper.scrape(open_as_text(read_fixture("disability_race_page.html")))
+
+
+def test_to_scrape_empty_page():
+    with pytest.raises(DataNotFound):
+        RacePageScraper.scrape(open_as_text(read_fixture("empty_page.html")))
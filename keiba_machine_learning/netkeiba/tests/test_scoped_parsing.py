@@ -0,0 +1,91 @@
+import io
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+from keiba_machine_learning.netkeiba.constants import ENCODING_OF_WEB_PAGE
+from keiba_machine_learning.netkeiba.pipelines import COLUMNS, scrape_race_pages
+from keiba_machine_learning.netkeiba.scrapers import (ParserBackend, RaceInformationScraper, RacePageScraper,
+                                                      RaceResultScraper, extract_regions)
+from keiba_machine_learning.netkeiba.stores import DirectoryPageStore
+from keiba_machine_learning.netkeiba.synthetic import SyntheticCorpus, synthetic_race_ids
+from keiba_machine_learning.netkeiba.tests.helpers import RACE_PAGE
+
+base_path = os.path.dirname(os.path.abspath(__file__))
+fixture_names = sorted(os.listdir(os.path.join(base_path, "./fixtures")))
+RACE_HTML = RACE_PAGE.decode(ENCODING_OF_WEB_PAGE)
+
+
+def scrape(scraper, content, parser, scoped):
+    try:
+        return scraper.scrape(io.TextIOWrapper(io.BytesIO(content), encoding=ENCODING_OF_WEB_PAGE),
+                              parser=parser, scoped=scoped)
+    except Exception as e:
+        # 例外になる場合はどの例外になるかまで一致させる
+        return type(e)
+
+
+def assert_same_as_full_parse(scraper, content, parser):
+    expected = scrape(scraper, content, parser, scoped=False)
+    actual = scrape(scraper, content, parser, scoped=True)
+
+    assert actual == expected
+    assert pickle.dumps(actual) == pickle.dumps(expected)
+
+
+@pytest.mark.parametrize('parser', list(ParserBackend))
+@pytest.mark.parametrize('scraper', [RacePageScraper, RaceInformationScraper, RaceResultScraper])
+@pytest.mark.parametrize('file_name', fixture_names)
+def test_fixtures(file_name, scraper, parser):
+    with open(os.path.join(base_path, "./fixtures", file_name), mode="rb") as file:
+        assert_same_as_full_parse(scraper, file.read(), parser)
+
+
+@pytest.mark.parametrize('parser', list(ParserBackend))
+def test_synthetic_pages(parser):
+    corpus = SyntheticCorpus(scratch_ratio=0.1, padding=0)
+    for _, content in corpus.iter_pages(synthetic_race_ids([2019], scale=0.01)):
+        assert_same_as_full_parse(RacePageScraper, content, parser)
+
+
+def test_extract_regions():
+    scoped_html = extract_regions(RACE_HTML)
+
+    assert len(scoped_html) < len(RACE_HTML) / 2
+    assert 'id="side"' not in scoped_html
+    assert scoped_html.count('<table') == 1
+
+
+# 競馬場のタブ・レース情報・レース結果の表のいずれかがない・レース結果の表の中に表があるページ
+UNEXPECTED_PAGES = {
+    'without_race_tracks': RACE_HTML.replace('<ul class="race_place', '<ul class="other'),
+    'without_race_data': RACE_HTML.replace('<diary_snap>', '<div>'),
+    'without_race_result_table': RACE_HTML.replace('summary="レース結果"', 'summary="other"'),
+    'nested_table': RACE_HTML.replace('<th nowrap="nowrap">着<br />順</th>', '<th><table></table>着順</th>'),
+}
+
+
+@pytest.mark.parametrize('name', list(UNEXPECTED_PAGES))
+def test_fall_back_to_full_parse(name):
+    html = UNEXPECTED_PAGES[name]
+    assert html != RACE_HTML
+    assert extract_regions(html) is None
+    assert_same_as_full_parse(RacePageScraper, html.encode(ENCODING_OF_WEB_PAGE), ParserBackend.HTML_PARSER)
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_pipeline(tmp_path, processes):
+    store = DirectoryPageStore(str(tmp_path))
+    race_ids = synthetic_race_ids([2019], scale=0.01)
+    for race_id, content in SyntheticCorpus().iter_pages(race_ids):
+        store.write(race_id, content)
+
+    full = scrape_race_pages(store.race_ids(), store=store)
+    scoped = scrape_race_pages(store.race_ids(), store=store, processes=processes, chunk_size=20, scoped=True)
+
+    assert scoped.not_found_race_ids == full.not_found_race_ids
+    assert scoped.incompatible_race_ids == full.incompatible_race_ids
+    for column in COLUMNS:
+        np.testing.assert_array_equal(scoped.columns[column], full.columns[column])
@@ -0,0 +1,88 @@
+import gzip
+import os
+
+import pytest
+
+from keiba_machine_learning.models import RaceTrac
+from keiba_machine_learning.netkeiba.models import Race
+from keiba_machine_learning.netkeiba.scrapers import RaceInformationScraper
+from keiba_machine_learning.netkeiba.stores import ArchivePageStore, set_page_store
+from keiba_machine_learning.netkeiba.tests.helpers import RACE_PAGE, EMPTY_PAGE
+
+
+def test_write_and_read(store):
+    store.write(201901010101, RACE_PAGE)
+    store.write(202001010101, EMPTY_PAGE)
+
+    assert store.read(201901010101) == RACE_PAGE
+    assert store.read(202001010101) == EMPTY_PAGE
+    assert store.size(201901010101) == len(RACE_PAGE)
+    assert store.size(201901010102) is None
+    assert 201901010101 in store
+    assert 201901010102 not in store
+    assert store.race_ids() == [201901010101, 202001010101]
+    with pytest.raises(KeyError):
+        store.read(201901010102)
+
+
+def test_overwrite(store):
+    store.write(201901010101, EMPTY_PAGE)
+    store.write(201901010101, RACE_PAGE)
+
+    assert store.read(201901010101) == RACE_PAGE
+    assert store.race_ids() == [201901010101]
+
+
+def test_iter_pages(store):
+    pages = [(race_id, RACE_PAGE + str(race_id).encode()) for race_id in
+             [201901010103, 201901010101, 201801010101, 201901010102]]
+    for race_id, content in pages:
+        store.write(race_id, content)
+
+    assert sorted(store.iter_pages([201901010101, 201801010101])) == sorted(
+        [page for page in pages if page[0] in (201901010101, 201801010101)])
+    assert sorted(store.iter_pages()) == sorted(pages)
+
+
+def test_open_as_text(store):
+    store.write(201901010101, RACE_PAGE)
+
+    with store.open(201901010101) as file:
+        assert RaceInformationScraper.scrape(file)['race_number'] == 1
+
+
+def test_archive_is_persisted(tmp_path):
+    with ArchivePageStore(str(tmp_path)) as store:
+        store.write_many([(201901010101, RACE_PAGE), (201901010102, EMPTY_PAGE), (202001010101, RACE_PAGE)])
+
+    assert sorted(os.listdir(tmp_path)) == ['2019.index', '2019.pages.gz', '2020.index', '2020.pages.gz']
+    # 年ごとのアーカイブはそのまま gzip として展開できる
+    with gzip.open(os.path.join(tmp_path, '2019.pages.gz')) as archive:
+        assert archive.read() == RACE_PAGE + EMPTY_PAGE
+
+    with ArchivePageStore(str(tmp_path)) as store:
+        assert store.race_ids() == [201901010101, 201901010102, 202001010101]
+        assert store.read(201901010102) == EMPTY_PAGE
+
+
+def test_archive_ignores_truncated_index_record(tmp_path):
+    with ArchivePageStore(str(tmp_path)) as store:
+        store.write_many([(201901010101, RACE_PAGE), (201901010102, EMPTY_PAGE)])
+
+    with open(os.path.join(tmp_path, '2019.index'), mode='r+b') as index_file:
+        index_file.truncate(ArchivePageStore.INDEX_RECORD.size + 3)
+
+    with ArchivePageStore(str(tmp_path)) as store:
+        assert store.race_ids() == [201901010101]
+
+
+def test_race_file_reads_from_page_store(tmp_path):
+    race = Race(year=2019, race_track=RaceTrac.SAPPORO, series_number=1, day_number=1, race_number=1)
+    with ArchivePageStore(str(tmp_path)) as store:
+        store.write(race.id, RACE_PAGE)
+        set_page_store(store)
+        try:
+            with race.file as file:
+                assert RaceInformationScraper.scrape(file)['race_track'] == RaceTrac.SAPPORO
+        finally:
+            set_page_store(None)
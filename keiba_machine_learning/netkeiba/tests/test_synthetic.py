@@ -0,0 +1,131 @@
+import io
+import re
+
+import numpy as np
+import pytest
+
+from keiba_machine_learning.models import RaceTrac
+from keiba_machine_learning.netkeiba.constants import ENCODING_OF_WEB_PAGE
+from keiba_machine_learning.netkeiba.datasets import apply_update, load_race_results, plan_update
+from keiba_machine_learning.netkeiba.pipelines import iter_scraped_chunks
+from keiba_machine_learning.netkeiba.race_ids import is_valid
+from keiba_machine_learning.netkeiba.scrapers import DataNotFound, IncompatibleDataDetected, ParserBackend, RacePageScraper
+from keiba_machine_learning.netkeiba.stores import ArchivePageStore, DirectoryPageStore
+from keiba_machine_learning.netkeiba.synthetic import (SCRATCH_MARKS, PageKind, SyntheticCorpus, synthetic_race_ids,
+                                                       write_corpus)
+
+RACE_IDS = synthetic_race_ids([2019], scale=0.02)
+
+
+def scrape(content, parser=ParserBackend.HTML_PARSER):
+    return RacePageScraper.scrape(io.TextIOWrapper(io.BytesIO(content), encoding=ENCODING_OF_WEB_PAGE), parser=parser)
+
+
+def pages_of_kind(corpus, kind):
+    return [(race_id, content) for race_id, content in corpus.iter_pages(RACE_IDS) if corpus.page_kind(race_id) == kind]
+
+
+def test_deterministic():
+    def page(seed):
+        return SyntheticCorpus(seed=seed, empty_ratio=0, jump_ratio=0).page(201901010101)
+
+    assert page(1) == page(1)
+    assert page(1) != page(2)
+
+
+@pytest.mark.parametrize('parser', list(ParserBackend))
+def test_race_pages(parser):
+    corpus = SyntheticCorpus(scratch_ratio=0.1)
+    pages = pages_of_kind(corpus, PageKind.RACE)
+    assert pages
+
+    for race_id, content in pages:
+        race_page = scrape(content, parser)
+        race_information = race_page['race_information']
+        assert race_information['race_track'] == RaceTrac(race_id // 10 ** 6 % 100)
+        assert race_information['race_number'] == race_id % 100
+
+        # 中・除・取 の馬は読み飛ばされ、残りの馬は1着から順に並ぶ
+        records = race_page['race_records']
+        placings = re.findall(rb'<tr>\n<td class="txt_r" nowrap="nowrap">(.+?)</td>', content)
+        scratch_marks = [mark.encode(ENCODING_OF_WEB_PAGE) for mark in SCRATCH_MARKS]
+        assert len(records) == len([placing for placing in placings if placing not in scratch_marks])
+        assert [record['order_of_placing'] for record in records] == list(range(1, len(records) + 1))
+        assert all(record['race_time'] > 0 for record in records)
+
+        # 馬番ごとに枠番が決まっている(8頭を超えると後ろの枠から2頭になる)
+        bracket_numbers = sorted((record['horse_number'], record['bracket_number']) for record in records)
+        assert [bracket for _, bracket in bracket_numbers] == sorted(bracket for _, bracket in bracket_numbers)
+
+
+def test_other_pages():
+    corpus = SyntheticCorpus(empty_ratio=0.3, jump_ratio=0.3)
+
+    for _, content in pages_of_kind(corpus, PageKind.EMPTY):
+        with pytest.raises(DataNotFound):
+            scrape(content)
+    for _, content in pages_of_kind(corpus, PageKind.JUMP):
+        with pytest.raises(IncompatibleDataDetected):
+            scrape(content)
+
+
+def test_padding():
+    assert len(SyntheticCorpus(padding=50_000).page(201901010101)) > 50_000
+    assert len(SyntheticCorpus(padding=0).page(201901010101)) < 20_000
+
+
+def test_synthetic_race_ids():
+    race_ids = synthetic_race_ids([2018, 2019])
+
+    # 1年分の存在しうるレースID(8,400件)の約4割
+    assert len(race_ids) == 2 * 3444
+    assert is_valid(race_ids).all()
+    assert (race_ids[1:] > race_ids[:-1]).all()
+    assert len(synthetic_race_ids([2019], scale=0.5)) == 1722
+
+
+def test_synthetic_race_ids_beyond_real_years():
+    # 実在する年(1986年〜)の10倍の規模にするため、実在しない年も使えること
+    race_ids = synthetic_race_ids(range(1700, 2050), scale=0.01)
+
+    assert len(race_ids) == 10 * len(synthetic_race_ids(range(1986, 2021), scale=0.01))
+    assert (race_ids[1:] > race_ids[:-1]).all()
+    assert not is_valid(race_ids).all()
+    with pytest.raises(ValueError):
+        synthetic_race_ids([999])
+
+
+@pytest.mark.parametrize('store_class', [DirectoryPageStore, ArchivePageStore])
+def test_scrape_corpus_beyond_real_years(store_class, tmp_path):
+    # 全件のスクレイピングは時間がかかるので、最初と最後の年に加えて間引いたものだけ使う
+    race_ids = synthetic_race_ids(range(1700, 2050), scale=0.01)
+    years = race_ids // 10 ** 8
+    race_ids = race_ids[(years == 1700) | (years == 2049) | (np.arange(len(race_ids)) % 100 == 0)]
+    directory = str(tmp_path / 'race_results')
+
+    with store_class(str(tmp_path / 'pages')) as store:
+        write_corpus(SyntheticCorpus(padding=0), store, race_ids)
+        assert store.race_ids() == race_ids.tolist()
+
+        plan = plan_update(store.race_ids(), store=store, directory=directory)
+        chunks = iter_scraped_chunks(plan.scraping_race_ids, store=store, chunk_size=100)
+        apply_update(plan, (chunk.columns for chunk in chunks))
+
+    df = load_race_results(directory=directory)
+    scraped_race_ids = np.unique(df['race_id'])
+    assert set(scraped_race_ids) <= set(race_ids.tolist())
+    assert {1700, 2049} <= set(scraped_race_ids // 10 ** 8)
+    assert (df['starts_at'].dt.year == df['race_id'] // 10 ** 8).all()
+
+
+def test_write_corpus(tmp_path):
+    store = DirectoryPageStore(str(tmp_path))
+    corpus = SyntheticCorpus()
+    written = []
+
+    count = write_corpus(corpus, store, RACE_IDS, on_written=written.append)
+
+    assert count == len(RACE_IDS)
+    assert written == RACE_IDS.tolist()
+    assert store.race_ids() == RACE_IDS.tolist()
+    assert store.read(int(RACE_IDS[0])) == corpus.page(int(RACE_IDS[0]))
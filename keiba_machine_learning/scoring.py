@@ -0,0 +1,150 @@
+"""学習済みのモデルでレースの各馬の着順を予想する
+
+    当日はオッズが更新される度に同じレースを何度も予想し直すので、以下のようにしている
+
+    - モデルとエンコーダーはインスタンスを作るときに一度だけ読み込む
+    - 複数のレースをまとめて受け取り、1つの行列にしてモデルを1回だけ呼ぶ
+    - 各馬の one-hot の結果(1 になる列の番号)をキャッシュしておき、前回から値が変わった馬だけを変換し直す
+
+    Examples:
+        scorer = RaceScorer.load('data/placing_classifier.pickle')
+        scores = scorer.score([RacePageScraper.scrape(file) for file in files])
+        scores[0].probabilities  # 1頭1行 × 着順のクラス(1〜4)ごとの確率
+"""
+import pickle
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Sequence, Tuple
+
+import numpy as np
+import scipy.sparse
+
+from keiba_machine_learning.features import SparseOneHotEncoder
+from keiba_machine_learning.netkeiba.datasets import to_table
+from keiba_machine_learning.netkeiba.pipelines import COLUMNS, race_page_to_columns
+from keiba_machine_learning.types import RacePage, RaceInformation
+
+# レースを特定するキー(競馬場, 発走日時, レース番号)
+RaceKey = Tuple[int, Any, int]
+
+
+class RaceScore(NamedTuple):
+    race_information: RaceInformation
+    horse_numbers: np.ndarray  # 馬番(probabilities の行の順番)
+    probabilities: np.ndarray  # 1頭1行 × classes の各クラスになる確率
+    classes: np.ndarray  # 着順のクラス(probabilities の列の順番)
+
+
+class _CachedRow(NamedTuple):
+    values: tuple  # エンコーダーが使う列の値
+    indices: np.ndarray  # one-hot で 1 になる列の番号
+
+
+class RaceScorer:
+    """ 学習済みのモデル(predict_proba を持つもの)とエンコーダーでレースをまとめて予想する """
+
+    def __init__(self, model: Any, encoder: SparseOneHotEncoder, max_cached_races: int = 1024) -> None:
+        """
+        Args:
+            model (Any): 学習済みのモデル(LogisticRegression・SGDClassifier など)
+            encoder (SparseOneHotEncoder): 学習時に fit したもの
+            max_cached_races (int): 変換結果をキャッシュしておくレース数(古いものから捨てる)
+        """
+        self.model = model
+        self.encoder = encoder
+        self.max_cached_races = max_cached_races
+        self._cache: 'OrderedDict[RaceKey, Dict[int, _CachedRow]]' = OrderedDict()
+        self.encoded_row_count = 0  # 変換し直した行数
+        self.reused_row_count = 0  # キャッシュを使った行数
+
+    @staticmethod
+    def load(file_path: str, max_cached_races: int = 1024) -> 'RaceScorer':
+        """ TrainingResult.save で保存したモデルとエンコーダーを読み込む """
+        with open(file_path, mode='rb') as file:
+            saved = pickle.load(file)
+        return RaceScorer(saved['model'], saved['encoder'], max_cached_races=max_cached_races)
+
+    def score(self, race_pages: Sequence[RacePage]) -> List[RaceScore]:
+        """
+        Args:
+            race_pages (Sequence[RacePage]): 予想するレース(スクレイパーの結果と同じ形式。着順・タイムなどは使わない)
+
+        Returns:
+            List[RaceScore]: race_pages と同じ順番の予想結果
+        """
+        row_indices = self._encode(race_pages)
+
+        indptr = np.zeros(len(row_indices) + 1, dtype=np.int64)
+        np.cumsum([len(indices) for indices in row_indices], out=indptr[1:])
+        indices = np.concatenate(row_indices) if row_indices else np.array([], dtype=np.int64)
+        x = scipy.sparse.csr_matrix((np.ones(len(indices)), indices, indptr),
+                                    shape=(len(row_indices), len(self.encoder.feature_names())))
+        probabilities = self.model.predict_proba(x) if x.shape[0] > 0 else np.empty((0, len(self.model.classes_)))
+
+        scores = []
+        offset = 0
+        for race_page in race_pages:
+            race_records = race_page['race_records']
+            scores.append(RaceScore(
+                race_information=race_page['race_information'],
+                horse_numbers=np.array([race_record['horse_number'] for race_record in race_records]),
+                probabilities=probabilities[offset:offset + len(race_records)],
+                classes=self.model.classes_,
+            ))
+            offset += len(race_records)
+        return scores
+
+    def clear_cache(self) -> None:
+        self._cache.clear()
+
+    def _encode(self, race_pages: Sequence[RacePage]) -> List[np.ndarray]:
+        """ 各馬の one-hot で 1 になる列の番号を返す(キャッシュと値が異なる馬だけをまとめて変換する) """
+        row_indices: List[np.ndarray] = []
+        stale_rows: List[Tuple[int, RaceKey, int, tuple]] = []  # (行番号, レース, 馬番, 値)
+        stale_pages: List[RacePage] = []
+
+        for race_page in race_pages:
+            race_key = self._race_key(race_page['race_information'])
+            cached_rows = self._cache.get(race_key, {})
+            stale_records = []
+            for race_record in race_page['race_records']:
+                values = self._values(race_page['race_information'], race_record)
+                cached_row = cached_rows.get(race_record['horse_number'])
+                if cached_row is not None and cached_row.values == values:
+                    row_indices.append(cached_row.indices)
+                    self.reused_row_count += 1
+                else:
+                    stale_rows.append((len(row_indices), race_key, race_record['horse_number'], values))
+                    stale_records.append(race_record)
+                    row_indices.append(np.array([], dtype=np.int64))
+            if stale_records:
+                stale_pages.append({'race_information': race_page['race_information'], 'race_records': stale_records})
+
+        if stale_rows:
+            columns: Dict[str, list] = {column: [] for column in COLUMNS}
+            for stale_page in stale_pages:
+                race_page_to_columns(0, stale_page, columns)
+            # 学習時と同じ型(データセットの型)にしてから変換する(float32 のオッズなどが一致しなくなるため)
+            df = to_table(columns).to_pandas()
+            x = self.encoder.transform(df)
+            for (row_number, race_key, horse_number, values), start, end in zip(stale_rows, x.indptr[:-1], x.indptr[1:]):
+                indices = x.indices[start:end].astype(np.int64)
+                row_indices[row_number] = indices
+                self._cache.setdefault(race_key, {})[horse_number] = _CachedRow(values, indices)
+            self.encoded_row_count += len(stale_rows)
+
+        for race_page in race_pages:
+            race_key = self._race_key(race_page['race_information'])
+            if race_key in self._cache:
+                self._cache.move_to_end(race_key)
+        while len(self._cache) > self.max_cached_races:
+            self._cache.popitem(last=False)
+
+        return row_indices
+
+    def _values(self, race_information: RaceInformation, race_record: Any) -> tuple:
+        return tuple(race_record[column] if column in race_record else race_information[column]  # type: ignore
+                     for column in self.encoder.columns)
+
+    @staticmethod
+    def _race_key(race_information: RaceInformation) -> RaceKey:
+        return (race_information['race_track'].value, race_information['starts_at'], race_information['race_number'])
@@ -0,0 +1,404 @@
+"""学習済みのモデルでレースを予想する HTTP サーバー(標準ライブラリの asyncio だけで動く)
+
+    オッズを取得する度に小さなリクエストが同時に大量に届くので、
+    短い時間(max_delay)の間に届いたリクエストをまとめて RaceScorer に渡し、モデルの呼び出しを1回にする
+
+    エンドポイント
+        POST /score: {"races": [レース, ...]} を受け取り {"races": [予想結果, ...]} を返す
+            レースは RacePage と同じ構造の JSON (Enum は値、starts_at は ISO 8601 形式の文字列。着順・タイムなどは省略可)
+            予想結果は {"horse_numbers": [...], "classes": [...], "probabilities": [[...], ...]}
+        GET /metrics: リクエスト数・レイテンシ(p50/p99)・スループットなど
+
+    Examples:
+        scorer = RaceScorer.load('data/placing_classifier.pickle')
+        asyncio.run(serve(scorer, host='127.0.0.1', port=8000))
+"""
+import asyncio
+import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Deque, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from keiba_machine_learning.models import RaceTrac, TrackKind, TrackDirection, TrackSurface, Weather, HorseGender
+from keiba_machine_learning.netkeiba.datasets import SCHEMA
+from keiba_machine_learning.scoring import RaceScore, RaceScorer
+from keiba_machine_learning.types import RacePage
+
+# リクエストボディの上限(これより大きいものは 413 を返す)
+MAX_BODY_SIZE = 16 * 1024 * 1024
+
+_RACE_INFORMATION_ENUMS = {
+    'race_track': RaceTrac,
+    'track_kind': TrackKind,
+    'track_direction': TrackDirection,
+    'track_surface': TrackSurface,
+    'weather': Weather,
+}
+# 予想に使う項目の型(int の項目はデータセットの型に収まるかも確認する。float の項目は整数も受け付ける)
+_RACE_INFORMATION_TYPES = {'race_distance_by_meter': int, 'race_number': int}
+_RACE_RECORD_TYPES = {
+    'bracket_number': int, 'horse_number': int, 'horse_age': int, 'impost': float, 'jockey_id': str,
+    'win_betting_ratio': float, 'favorite_order': int, 'horse_weight': int, 'weight_change': int,
+}
+# 予想に使わない項目(省略された場合は None にする)
+_OPTIONAL_RACE_RECORD_TYPES = {
+    'order_of_placing': int, 'horse_id': int, 'horse_name': str, 'jockey_name': str, 'race_time': float,
+}
+
+
+class BadRequest(Exception):
+    pass
+
+
+def race_page_from_json(data: Dict[str, Any]) -> RacePage:
+    """ JSON から RacePage を作る
+
+        予想に使う項目は全て揃っていて型が正しいことを確認する
+        (不正なレースが他のリクエストとまとめて予想されると、まとめた全てのリクエストが失敗するため)
+
+    Raises:
+        BadRequest: 必要な項目がない・値が不正な場合
+    """
+    try:
+        race_information = dict(data['race_information'])
+        for key, enum in _RACE_INFORMATION_ENUMS.items():
+            race_information[key] = enum(race_information[key])
+        race_information['starts_at'] = datetime.fromisoformat(race_information['starts_at'])
+        race_information.setdefault('title', '')
+        for key, value_type in _RACE_INFORMATION_TYPES.items():
+            race_information[key] = _checked_value(key, race_information[key], value_type)
+
+        if not isinstance(data['race_records'], list):
+            raise TypeError("race_records must be a list.")
+        race_records = []
+        for race_record in data['race_records']:
+            race_record = dict(race_record)
+            race_record['horse_gender'] = HorseGender(race_record['horse_gender'])
+            for key, value_type in _RACE_RECORD_TYPES.items():
+                race_record[key] = _checked_value(key, race_record[key], value_type)
+            for key, value_type in _OPTIONAL_RACE_RECORD_TYPES.items():
+                value = race_record.get(key)
+                race_record[key] = None if value is None else _checked_value(key, value, value_type)
+            race_records.append(race_record)
+    except (KeyError, TypeError, ValueError) as e:
+        raise BadRequest(f"invalid race: {e!r}")
+
+    return {'race_information': race_information, 'race_records': race_records}  # type: ignore
+
+
+def _checked_value(key: str, value: Any, value_type: type) -> Any:
+    """
+    Raises:
+        TypeError: 値の型が違う場合(bool は数値として扱わない)
+        ValueError: 整数がデータセットの列の型に収まらない場合
+    """
+    accepted_types = (int, float) if value_type is float else (value_type,)
+    if isinstance(value, bool) or not isinstance(value, accepted_types):
+        raise TypeError(f"{key} must be {value_type.__name__}.")
+    if value_type is int:
+        limits = np.iinfo(SCHEMA.field(key).type.to_pandas_dtype())
+        if not limits.min <= value <= limits.max:
+            raise ValueError(f"{key} is out of range.")
+    return float(value) if value_type is float else value
+
+
+def race_score_to_json(race_score: RaceScore) -> Dict[str, Any]:
+    return {
+        'horse_numbers': race_score.horse_numbers.tolist(),
+        'classes': race_score.classes.tolist(),
+        'probabilities': race_score.probabilities.tolist(),
+    }
+
+
+class LatencyStats:
+    """ リクエストのレイテンシとスループットを集計する
+
+        レイテンシのパーセンタイルは直近 window 件のリクエストから計算する
+    """
+
+    def __init__(self, window: int = 10_000) -> None:
+        self.started_at = time.monotonic()
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.request_count = 0
+        self.error_count = 0
+        self.race_count = 0
+        self.batch_count = 0
+        self.batched_race_count = 0
+
+    def record_request(self, seconds: float, race_count: int) -> None:
+        self.latencies.append(seconds)
+        self.request_count += 1
+        self.race_count += race_count
+
+    def record_error(self) -> None:
+        self.error_count += 1
+
+    def record_batch(self, race_count: int) -> None:
+        self.batch_count += 1
+        self.batched_race_count += race_count
+
+    def snapshot(self) -> Dict[str, Any]:
+        elapsed = max(time.monotonic() - self.started_at, 1e-9)
+        if self.latencies:
+            p50, p99 = np.percentile(np.fromiter(self.latencies, dtype=np.float64), [50, 99]) * 1000
+        else:
+            p50 = p99 = 0.0
+        return {
+            'request_count': self.request_count,
+            'error_count': self.error_count,
+            'race_count': self.race_count,
+            'batch_count': self.batch_count,
+            'average_batch_size': self.batched_race_count / self.batch_count if self.batch_count else 0.0,
+            'latency_p50_ms': float(p50),
+            'latency_p99_ms': float(p99),
+            'requests_per_second': self.request_count / elapsed,
+            'races_per_second': self.race_count / elapsed,
+            'uptime_seconds': elapsed,
+        }
+
+
+class _PendingRequest(NamedTuple):
+    race_pages: Sequence[RacePage]
+    future: 'asyncio.Future[List[RaceScore]]'
+
+
+class BatchingScorer:
+    """ 同時に届いたリクエストをまとめて RaceScorer に渡す
+
+        最初のリクエストが届いてから max_delay 秒待つか、レース数が max_batch_size に達したら予想する
+        予想は1つのスレッドで順番に行うので、その間もリクエストを受け付けられる(RaceScorer のキャッシュを同時に触ることはない)
+        まとめた予想が失敗した場合はリクエストごとに予想し直すので、失敗するのは原因になったリクエストだけになる
+    """
+
+    def __init__(self, scorer: RaceScorer, max_delay: float = 0.005, max_batch_size: int = 256,
+                 stats: Optional[LatencyStats] = None) -> None:
+        """
+        Args:
+            scorer (RaceScorer): モデルを読み込み済みのもの
+            max_delay (float): リクエストをまとめるために待つ最大の秒数
+            max_batch_size (int): 1回の予想でまとめる最大のレース数(1リクエストでこれを超える場合はそのまま予想する)
+            stats (Optional[LatencyStats]): バッチ数などの集計先
+        """
+        self.scorer = scorer
+        self.max_delay = max_delay
+        self.max_batch_size = max_batch_size
+        self.stats = stats if stats is not None else LatencyStats()
+        self._queue: 'Optional[asyncio.Queue[_PendingRequest]]' = None
+        self._worker: 'Optional[asyncio.Task[None]]' = None
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    async def score(self, race_pages: Sequence[RacePage]) -> List[RaceScore]:
+        if not race_pages:
+            return []
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+
+        future: 'asyncio.Future[List[RaceScore]]' = asyncio.get_running_loop().create_future()
+        await self._queue.put(_PendingRequest(race_pages, future))
+        return await future
+
+    async def close(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+            self._queue = None
+        self._executor.shutdown(wait=True)
+
+    async def _run(self) -> None:
+        assert self._queue is not None
+        loop = asyncio.get_running_loop()
+        carried_over: Optional[_PendingRequest] = None
+        while True:
+            batch = [carried_over if carried_over is not None else await self._queue.get()]
+            carried_over = None
+            race_count = len(batch[0].race_pages)
+            deadline = loop.time() + self.max_delay
+
+            while race_count < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    pending = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if race_count + len(pending.race_pages) > self.max_batch_size:
+                    carried_over = pending
+                    break
+                batch.append(pending)
+                race_count += len(pending.race_pages)
+
+            race_pages = [race_page for pending in batch for race_page in pending.race_pages]
+            try:
+                race_scores = await loop.run_in_executor(self._executor, self.scorer.score, race_pages)
+            except Exception as e:
+                if len(batch) == 1:
+                    if not batch[0].future.done():
+                        batch[0].future.set_exception(e)
+                else:
+                    await self._score_each(batch)
+                continue
+
+            self.stats.record_batch(len(race_pages))
+            offset = 0
+            for pending in batch:
+                if not pending.future.done():
+                    pending.future.set_result(race_scores[offset:offset + len(pending.race_pages)])
+                offset += len(pending.race_pages)
+
+    async def _score_each(self, batch: List[_PendingRequest]) -> None:
+        """ まとめた予想が失敗した場合に、どのリクエストが原因かわかるように1件ずつ予想する """
+        loop = asyncio.get_running_loop()
+        for pending in batch:
+            if pending.future.done():
+                continue
+            try:
+                race_scores = await loop.run_in_executor(self._executor, self.scorer.score, pending.race_pages)
+            except Exception as e:
+                if not pending.future.done():
+                    pending.future.set_exception(e)
+                continue
+            self.stats.record_batch(len(pending.race_pages))
+            if not pending.future.done():
+                pending.future.set_result(race_scores)
+
+
+class _Request(NamedTuple):
+    method: str
+    path: str
+    headers: Dict[str, str]
+    body: bytes
+
+
+class _HttpError(Exception):
+    def __init__(self, status: int, reason: str) -> None:
+        super().__init__(reason)
+        self.status = status
+
+
+_STATUS_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+                   413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+
+class PredictionServer:
+    """ HTTP/1.1 のリクエストを受け付けて BatchingScorer に渡す(Keep-Alive に対応) """
+
+    def __init__(self, batching_scorer: BatchingScorer) -> None:
+        self.batching_scorer = batching_scorer
+        self.stats = batching_scorer.stats
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8000) -> asyncio.AbstractServer:
+        """ port に 0 を指定すると空いているポートを使う(server.sockets[0].getsockname() で確認できる) """
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except _HttpError as e:
+                    await self._write_response(writer, e.status, {'error': str(e)}, keep_alive=False)
+                    return
+                if request is None:
+                    return
+
+                status, body = await self._dispatch(request)
+                keep_alive = request.headers.get('connection', '').lower() != 'close'
+                await self._write_response(writer, status, body, keep_alive)
+                if not keep_alive:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, request: _Request) -> Tuple[int, Dict[str, Any]]:
+        if request.path == '/metrics':
+            if request.method != 'GET':
+                return 405, {'error': 'method not allowed'}
+            return 200, self.stats.snapshot()
+
+        if request.path == '/score':
+            if request.method != 'POST':
+                return 405, {'error': 'method not allowed'}
+            started_at = time.monotonic()
+            try:
+                data = json.loads(request.body)
+                race_pages = [race_page_from_json(race) for race in data['races']]
+            except (ValueError, KeyError, TypeError, BadRequest) as e:
+                self.stats.record_error()
+                return 400, {'error': str(e)}
+            try:
+                race_scores = await self.batching_scorer.score(race_pages)
+            except Exception as e:
+                self.stats.record_error()
+                return 500, {'error': repr(e)}
+            self.stats.record_request(time.monotonic() - started_at, len(race_pages))
+            return 200, {'races': [race_score_to_json(race_score) for race_score in race_scores]}
+
+        return 404, {'error': 'not found'}
+
+    @staticmethod
+    async def _read_request(reader: asyncio.StreamReader) -> Optional[_Request]:
+        """
+        Returns:
+            Optional[_Request]: 接続が閉じられた場合は None
+        """
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        try:
+            method, target, _ = request_line.decode('latin-1').split(' ', 2)
+        except ValueError:
+            raise _HttpError(400, 'malformed request line')
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            content_length = int(headers.get('content-length', '0'))
+        except ValueError:
+            raise _HttpError(400, 'invalid content-length')
+        if content_length > MAX_BODY_SIZE:
+            raise _HttpError(413, 'request body too large')
+        body = await reader.readexactly(content_length) if content_length > 0 else b''
+
+        return _Request(method=method.upper(), path=target.split('?', 1)[0], headers=headers, body=body)
+
+    @staticmethod
+    async def _write_response(writer: asyncio.StreamWriter, status: int, body: Dict[str, Any],
+                              keep_alive: bool) -> None:
+        content = json.dumps(body).encode('utf-8')
+        head = (f"HTTP/1.1 {status} {_STATUS_REASONS[status]}\r\n"
+                "Content-Type: application/json\r\n"
+                f"Content-Length: {len(content)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+                "\r\n")
+        writer.write(head.encode('latin-1') + content)
+        await writer.drain()
+
+
+async def serve(scorer: RaceScorer, host: str = '127.0.0.1', port: int = 8000,
+                max_delay: float = 0.005, max_batch_size: int = 256) -> None:
+    """ 止めるまでリクエストを受け付ける """
+    batching_scorer = BatchingScorer(scorer, max_delay=max_delay, max_batch_size=max_batch_size)
+    server = await PredictionServer(batching_scorer).start(host, port)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await batching_scorer.close()
@@ -0,0 +1,39 @@
+import io
+
+import pytest
+
+from keiba_machine_learning.features import FeaturePipeline
+
+from keiba_machine_learning.netkeiba.constants import ENCODING_OF_WEB_PAGE
+from keiba_machine_learning.netkeiba.scrapers import RacePageScraper
+from keiba_machine_learning.netkeiba.stores import DirectoryPageStore
+from keiba_machine_learning.netkeiba.tests.helpers import RACE_PAGE
+from keiba_machine_learning.scoring import RaceScorer
+from keiba_machine_learning.tests.helpers import build_dataset
+from keiba_machine_learning.training import train_incrementally
+
+
+@pytest.fixture
+def dataset_dir(tmp_path):
+    """ フィクスチャのページを10日分(1日1レース、2019年8月1日〜10日に開催)保存して作ったデータセット """
+    store = DirectoryPageStore(str(tmp_path / 'pages'))
+    for day_number in range(1, 11):
+        date_text = f'2019年8月{day_number}日 1回札幌{day_number}日目'.encode(ENCODING_OF_WEB_PAGE)
+        store.write(201901010001 + day_number * 100,
+                    RACE_PAGE.replace('2019年7月27日 1回札幌1日目'.encode(ENCODING_OF_WEB_PAGE), date_text))
+    directory = str(tmp_path / 'race_results')
+    build_dataset(store, directory)
+    return directory
+
+
+@pytest.fixture
+def scorer(dataset_dir, tmp_path):
+    """ dataset_dir で学習させて保存したモデルを読み込んだもの """
+    file_path = str(tmp_path / 'model.pickle')
+    train_incrementally(FeaturePipeline(), directory=dataset_dir, chunk_size=100, epochs=1).save(file_path)
+    return RaceScorer.load(file_path)
+
+
+@pytest.fixture
+def race_page():
+    return RacePageScraper.scrape(io.BytesIO(RACE_PAGE))
@@ -0,0 +1,8 @@
+""" テストで共有する関数(フィクスチャは conftest.py に置く) """
+from keiba_machine_learning.netkeiba.datasets import apply_update, plan_update
+from keiba_machine_learning.netkeiba.pipelines import scrape_race_pages
+
+
+def build_dataset(store, directory):
+    plan = plan_update(store.race_ids(), store=store, directory=directory)
+    apply_update(plan, [scrape_race_pages(plan.scraping_race_ids, store=store).columns])
@@ -0,0 +1,60 @@
+import pytest
+
+from keiba_machine_learning.benchmarks import (BenchmarkResult, compare, load_results, run_benchmarks, save_results,
+                                               synthetic_race_results)
+from keiba_machine_learning.netkeiba.datasets import load_race_results
+from keiba_machine_learning.netkeiba.tests.helpers import EMPTY_PAGE, RACE_PAGE
+
+
+def test_run_benchmarks():
+    results = run_benchmarks([RACE_PAGE, EMPTY_PAGE], sizes=(50, 100), repeat=1)
+
+    assert [result.name for result in results] == [
+        'scrape.race_information', 'scrape.race_result', 'build.data_frame',
+        'model.encode[50]', 'model.fit[50]', 'model.encode[100]', 'model.fit[100]',
+    ]
+    assert all(result.value > 0 for result in results)
+
+
+def test_run_benchmarks_without_race_results():
+    with pytest.raises(ValueError):
+        run_benchmarks([EMPTY_PAGE], sizes=(10,), repeat=1)
+
+
+def test_compare():
+    baseline = [
+        BenchmarkResult('scrape', 100.0, 'pages/s', True),
+        BenchmarkResult('fit', 1.0, 's', False),
+        BenchmarkResult('encode', 1.0, 's', False),
+    ]
+    results = [
+        BenchmarkResult('scrape', 80.0, 'pages/s', True),  # 25% 悪化
+        BenchmarkResult('fit', 1.1, 's', False),  # 10% 悪化
+        BenchmarkResult('encode', 0.5, 's', False),  # 改善
+        BenchmarkResult('new', 1.0, 's', False),  # ベースラインにない
+    ]
+
+    regressions = compare(results, baseline, threshold=0.2)
+
+    assert [regression.name for regression in regressions] == ['scrape']
+    assert regressions[0].change == pytest.approx(0.25)
+    assert [regression.name for regression in compare(results, baseline, threshold=0.05)] == ['scrape', 'fit']
+
+
+def test_save_and_load_results(tmp_path):
+    results = [BenchmarkResult('scrape', 100.0, 'pages/s', True)]
+    file_path = str(tmp_path / 'benchmark.json')
+
+    save_results(results, file_path)
+
+    assert load_results(file_path) == results
+
+
+def test_synthetic_race_results(dataset_dir):
+    base = load_race_results(directory=dataset_dir)
+    df = synthetic_race_results(base, 1000)
+
+    assert len(df) == 1000
+    assert list(df.columns) == list(base.columns)
+    # 同じレースの中で着順が重複しない
+    assert not df.groupby('race_id')['order_of_placing'].apply(lambda s: s.duplicated().any()).any()
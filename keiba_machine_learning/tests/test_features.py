@@ -0,0 +1,145 @@
+import numpy as np
+import pandas as pd
+import pytest
+import scipy.sparse
+
+from keiba_machine_learning.features import FeaturePipeline, SparseOneHotEncoder
+from keiba_machine_learning.model_selection import period_keys
+from keiba_machine_learning.netkeiba.stores import DirectoryPageStore
+from keiba_machine_learning.netkeiba.tests.helpers import RACE_PAGE
+from keiba_machine_learning.tests.helpers import build_dataset
+
+COLUMNS = ['race_track', 'jockey_id', 'impost']
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame({
+        'race_track': pd.Series([1, 5, 1, 9], dtype='int8'),
+        'jockey_id': pd.Series(['05339', '01088', '05339', '01170'], dtype='category'),
+        'impost': pd.Series([54.0, 55.0, 57.0, 54.0], dtype='float32'),
+        'order_of_placing': [1, 2, 3, 4],
+    })
+
+
+def test_same_as_get_dummies(df):
+    encoder = SparseOneHotEncoder(COLUMNS)
+    x = encoder.fit_transform(df)
+    dummy_df = pd.get_dummies(df[COLUMNS], columns=COLUMNS)
+
+    assert scipy.sparse.isspmatrix_csr(x)
+    assert x.nnz == len(df) * len(COLUMNS)
+    assert encoder.feature_names() == ['race_track_1', 'race_track_5', 'race_track_9',
+                                       'jockey_id_01088', 'jockey_id_01170', 'jockey_id_05339',
+                                       'impost_54.0', 'impost_55.0', 'impost_57.0']
+    np.testing.assert_array_equal(x.toarray(), dummy_df.to_numpy(dtype=np.float64))
+
+
+def test_unseen_values_are_ignored(df):
+    encoder = SparseOneHotEncoder(COLUMNS).fit(df)
+    x = encoder.transform(pd.DataFrame({
+        'race_track': [5, 10],
+        'jockey_id': ['99999', None],
+        'impost': [54.0, 53.0],
+    }))
+
+    assert x.shape == (2, len(encoder.feature_names()))
+    names = encoder.feature_names()
+    assert [names[i] for i in x[0].indices] == ['race_track_5', 'impost_54.0']
+    assert x[1].nnz == 0
+
+
+def test_unused_categories_are_not_in_vocabulary(df):
+    df['jockey_id'] = df['jockey_id'].cat.add_categories(['00000'])
+
+    encoder = SparseOneHotEncoder(['jockey_id']).fit(df)
+
+    assert encoder.feature_names() == ['jockey_id_01088', 'jockey_id_01170', 'jockey_id_05339']
+
+
+def test_save_and_load(df, tmp_path):
+    encoder = SparseOneHotEncoder(COLUMNS).fit(df)
+    file_path = str(tmp_path / 'encoder.pickle')
+    encoder.save(file_path)
+
+    loaded = SparseOneHotEncoder.load(file_path)
+
+    assert loaded.feature_names() == encoder.feature_names()
+    assert (loaded.transform(df) != encoder.transform(df)).nnz == 0
+
+
+def test_transform_before_fit(df):
+    with pytest.raises(ValueError):
+        SparseOneHotEncoder(COLUMNS).transform(df)
+
+
+@pytest.mark.parametrize('split_by', ['race', 'row'])
+def test_feature_pipeline(dataset_dir, split_by):
+    features = FeaturePipeline(split_by=split_by).build(dataset_dir)
+
+    assert features.x_train.shape[0] == len(features.y_train)
+    assert features.x_test.shape[0] == len(features.y_test)
+    assert features.x_train.shape[1] == features.x_test.shape[1] == len(features.encoder.feature_names())
+    assert set(features.y_train) == {1, 2, 3, 4}
+    assert abs(len(features.y_test) / (len(features.y_train) + len(features.y_test)) - 0.3) < 0.05
+
+
+def test_feature_pipeline_cache(dataset_dir, tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / 'cache')
+    pipeline = FeaturePipeline()
+    features = pipeline.prepare(dataset_dir, cache_dir=cache_dir)
+
+    build_calls = []
+    monkeypatch.setattr(FeaturePipeline, 'build', lambda self, directory: build_calls.append(directory))
+    cached = pipeline.prepare(dataset_dir, cache_dir=cache_dir)
+    assert build_calls == []
+    assert (cached.x_train != features.x_train).nnz == 0
+    np.testing.assert_array_equal(cached.y_test, features.y_test)
+    assert cached.encoder.feature_names() == features.encoder.feature_names()
+
+    # 設定かデータセットが変われば作り直す
+    assert FeaturePipeline(random_state=1).cache_key(dataset_dir) != pipeline.cache_key(dataset_dir)
+    key = pipeline.cache_key(dataset_dir)
+    store = DirectoryPageStore(str(tmp_path / 'pages'))
+    store.write(201901020101, RACE_PAGE)
+    build_dataset(store, dataset_dir)
+    assert pipeline.cache_key(dataset_dir) != key
+
+
+def test_partial_fit_is_same_as_fit(df):
+    encoder = SparseOneHotEncoder(COLUMNS)
+    encoder.partial_fit(df.iloc[:2]).partial_fit(df.iloc[2:])
+
+    assert encoder.feature_names() == SparseOneHotEncoder(COLUMNS).fit(df).feature_names()
+
+
+def test_iter_chunks_is_reproducible(dataset_dir):
+    pipeline = FeaturePipeline()
+    first = [y_test for _, _, _, y_test in pipeline.iter_chunks(dataset_dir, chunk_size=30)]
+    second = [y_test for _, _, _, y_test in pipeline.iter_chunks(dataset_dir, chunk_size=30)]
+
+    assert len(first) > 1
+    for a, b in zip(first, second):
+        np.testing.assert_array_equal(a, b)
+
+
+def test_iter_chunks_cannot_shuffle_row_split(dataset_dir):
+    """ split_by='row' はチャンクの順番で分け方が決まるので、シャッフルすると訓練データとテストデータが混ざってしまう """
+    with pytest.raises(ValueError):
+        next(FeaturePipeline(split_by='row').iter_chunks(dataset_dir, chunk_size=30, shuffle_seed=0))
+
+
+def test_iter_chunks_uses_one_cutoff(dataset_dir):
+    """ チャンクをまたぐレースがあっても、全体で1つの境目で分けるので build と同じ分け方になる """
+    pipeline = FeaturePipeline()
+    chunks = list(pipeline.iter_chunks(dataset_dir, chunk_size=30))
+    train_race_ids = np.concatenate([train_df['race_id'].to_numpy() for train_df, _, _, _ in chunks])
+    test_race_ids = np.concatenate([test_df['race_id'].to_numpy() for _, test_df, _, _ in chunks])
+
+    assert len(chunks) > 1
+    assert len(test_race_ids) > 0
+    assert not set(train_race_ids) & set(test_race_ids)
+    features = pipeline.build(dataset_dir)
+    assert (len(train_race_ids), len(test_race_ids)) == (len(features.y_train), len(features.y_test))
+    cutoff = pipeline.dataset_train_cutoff(dataset_dir)
+    assert period_keys(train_race_ids).max() == cutoff < period_keys(test_race_ids).min()
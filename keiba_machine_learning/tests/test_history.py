@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from keiba_machine_learning.history import HISTORY_COLUMNS, HistoryFeatureStore
+from keiba_machine_learning.netkeiba.datasets import load_race_results
+
+
+def make_results(rows):
+    """ (発走日時, 馬, 騎手, 距離, 着順, タイム) から HISTORY_COLUMNS のデータを作る """
+    return pd.DataFrame([{
+        'starts_at': pd.Timestamp(starts_at), 'horse_id': horse_id, 'jockey_id': jockey_id,
+        'track_kind': 1, 'race_distance_by_meter': distance, 'track_surface': 1,
+        'order_of_placing': order_of_placing, 'race_time': race_time,
+    } for starts_at, horse_id, jockey_id, distance, order_of_placing, race_time in rows], columns=HISTORY_COLUMNS)
+
+
+RESULTS = make_results([
+    ('2019-01-05 10:00', 1, 'a', 1600, 1, 96.0),
+    ('2019-01-05 10:00', 2, 'b', 1600, 2, 97.0),
+    ('2019-01-05 11:00', 3, 'a', 1200, 1, 70.0),
+    ('2019-02-01 10:00', 1, 'b', 1600, 3, 98.0),
+    ('2019-02-01 10:00', 2, 'a', 1600, 1, 95.0),
+    ('2019-03-01 10:00', 1, 'a', 2000, None, None),
+])
+
+
+def test_join():
+    store = HistoryFeatureStore.build(RESULTS, last_n=2)
+    df = store.join(RESULTS)
+
+    # 行の順番は変わらず、そのレースより前の成績だけが使われている
+    pd.testing.assert_frame_equal(df[HISTORY_COLUMNS], RESULTS)
+    assert df['horse_race_count'].tolist() == [0, 0, 0, 1, 1, 2]
+    assert df['horse_win_count'].tolist() == [0, 0, 0, 1, 0, 1]
+    np.testing.assert_allclose(df['horse_win_rate'], [np.nan, np.nan, np.nan, 1.0, 0.0, 0.5])
+    np.testing.assert_allclose(df['horse_last_placing_1'], [np.nan, np.nan, np.nan, 1, 2, 3])
+    np.testing.assert_allclose(df['horse_last_placing_2'], [np.nan, np.nan, np.nan, np.nan, np.nan, 1])
+    # 騎手 a は 1/5 10:00 と 11:00 に乗っており、11:00 のレースでは 10:00 の結果が使える
+    assert df['jockey_race_count'].tolist() == [0, 0, 1, 1, 2, 3]
+    np.testing.assert_allclose(df['jockey_win_rate'], [np.nan, np.nan, 1.0, 0.0, 1.0, 1.0])
+    # 平均タイムは同じ条件(距離)のレースだけ
+    np.testing.assert_allclose(df['horse_average_race_time'], [np.nan, np.nan, np.nan, 96.0, 97.0, np.nan])
+
+
+def test_join_race_day_entries():
+    """ まだ結果のないレース(当日の出走表)にも結合できる """
+    store = HistoryFeatureStore.build(RESULTS, last_n=2)
+    entries = make_results([('2019-04-01 10:00', 1, 'b', 1600, None, None),
+                            ('2019-04-01 10:00', 9, 'z', 1600, None, None)])
+
+    df = store.join(entries)
+
+    assert df['horse_race_count'].tolist() == [3, 0]
+    np.testing.assert_allclose(df['horse_average_race_time'], [97.0, np.nan])
+    assert df['jockey_race_count'].tolist() == [2, 0]
+
+
+def test_save_and_load(tmp_path):
+    store = HistoryFeatureStore.build(RESULTS, last_n=3)
+    directory = str(tmp_path / 'history')
+    store.save(directory)
+    store.save(directory)  # 上書きできる
+
+    loaded = HistoryFeatureStore.load(directory)
+
+    assert loaded.last_n == 3
+    assert loaded.feature_names() == store.feature_names()
+    pd.testing.assert_frame_equal(loaded.join(RESULTS), store.join(RESULTS))
+
+
+def test_join_across_race_tracks():
+    """ 回・日目は競馬場ごとの通し番号なので、レースIDの順ではなく発走日時の順に結合する
+
+        東京2回8日目(5月)のレースの後に札幌1回1日目(7月)のレースを走った場合、
+        レースIDの順では札幌のレースが先になるが、5月のレースに7月の結果が使われてはいけない
+    """
+    df = make_results([('2019-05-26 15:40', 1, 'a', 2400, 3, 146.0),
+                       ('2019-07-27 09:50', 1, 'b', 1800, 1, 108.3)])
+    df.insert(0, 'race_id', [201905020811, 201901010101])
+
+    joined = HistoryFeatureStore.build(df, last_n=1).join(df)
+
+    assert joined['horse_race_count'].tolist() == [0, 1]
+    assert joined['horse_win_count'].tolist() == [0, 0]
+    np.testing.assert_allclose(joined['horse_last_placing_1'], [np.nan, 3])
+    assert joined['jockey_race_count'].tolist() == [0, 0]
+
+
+def test_from_dataset(dataset_dir):
+    df = load_race_results(directory=dataset_dir)
+
+    # フィクスチャは同じページの開催日を変えて8月1日〜10日のレースとして保存しているので、同じ馬が10日続けて走ったことになる
+    joined = HistoryFeatureStore.from_dataset(dataset_dir).join(df)
+    horse_count = len(df) // 10
+    assert sorted(joined['horse_race_count'].tolist()) == sorted(list(range(10)) * horse_count)
+    later = joined.loc[joined['horse_race_count'] > 0]
+    np.testing.assert_allclose(later['horse_last_placing_1'], later['order_of_placing'])
+    np.testing.assert_allclose(later['horse_average_race_time'], later['race_time'], rtol=1e-5)
+
+
+@pytest.mark.parametrize('last_n', [1, 5])
+def test_feature_names(last_n):
+    store = HistoryFeatureStore.build(RESULTS, last_n=last_n)
+    assert [name for name in store.feature_names() if 'last_placing' in name] == [
+        f'horse_last_placing_{k}' for k in range(1, last_n + 1)]
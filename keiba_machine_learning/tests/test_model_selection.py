@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from keiba_machine_learning.model_selection import (WalkForwardSplit, period_keys, race_grouped_train_test_split,
+                                                    train_period_cutoff)
+
+
+def race_ids_of(years, race_tracks=(1, 5), series_numbers=(1, 2), day_numbers=(1, 2), horse_count=3):
+    """ 1レース horse_count 行として、各年・競馬場・回・日目の1レース目のレースIDを並べる """
+    return np.array([
+        int(f'{year}{race_track:02d}{series_number:02d}{day_number:02d}01')
+        for year in years for race_track in race_tracks
+        for series_number in series_numbers for day_number in day_numbers
+        for _ in range(horse_count)])
+
+
+def test_period_keys():
+    race_ids = np.array([201905010101, 201901010212, 201901020101, 202001010101])
+
+    assert period_keys(race_ids, 'year').tolist() == [2019, 2019, 2019, 2020]
+    day_keys = period_keys(race_ids, 'day')
+    assert day_keys[0] < day_keys[1] < day_keys[2] < day_keys[3]
+    series_keys = period_keys(race_ids, 'series')
+    assert series_keys[0] == series_keys[1] < series_keys[2]
+
+
+def test_race_grouped_train_test_split():
+    race_ids = race_ids_of(range(2010, 2020))
+    rng = np.random.default_rng(0)
+    race_ids = race_ids[rng.permutation(len(race_ids))]
+
+    train_indices, test_indices = race_grouped_train_test_split(race_ids, test_size=0.3)
+
+    assert len(train_indices) + len(test_indices) == len(race_ids)
+    assert set(race_ids[train_indices]).isdisjoint(race_ids[test_indices])
+    keys = period_keys(race_ids)
+    assert keys[train_indices].max() < keys[test_indices].min()
+    # 重複を除いたレースIDから求めた境目でも同じ
+    assert train_period_cutoff(np.unique(race_ids), test_size=0.3) == keys[train_indices].max()
+    assert 0.2 <= len(test_indices) / len(race_ids) <= 0.35
+    # 何度実行しても同じ
+    np.testing.assert_array_equal(race_grouped_train_test_split(race_ids, test_size=0.3)[1], test_indices)
+
+
+def test_race_grouped_train_test_split_needs_two_periods():
+    with pytest.raises(ValueError):
+        race_grouped_train_test_split(np.array([201901010101, 201905010101]), period='day')
+
+
+def test_walk_forward_split():
+    race_ids = race_ids_of(range(2010, 2020))
+    splitter = WalkForwardSplit(n_splits=3, train_size=2)
+
+    folds = list(splitter.split(groups=race_ids))
+
+    assert len(folds) == splitter.get_n_splits() == 3
+    years = period_keys(race_ids, 'year')
+    for (train_indices, test_indices), test_year in zip(folds, [2017, 2018, 2019]):
+        assert set(years[test_indices]) == {test_year}
+        assert set(years[train_indices]) == {test_year - 2, test_year - 1}
+
+
+def test_walk_forward_split_with_gap_and_expanding_window():
+    race_ids = race_ids_of(range(2010, 2016))
+    folds = list(WalkForwardSplit(n_splits=2, gap=1).split(groups=race_ids))
+
+    years = period_keys(race_ids, 'year')
+    assert set(years[folds[0][1]]) == {2014}
+    assert set(years[folds[0][0]]) == {2010, 2011, 2012}
+    assert set(years[folds[1][0]]) == {2010, 2011, 2012, 2013}
+
+
+def test_walk_forward_split_needs_enough_periods():
+    with pytest.raises(ValueError):
+        list(WalkForwardSplit(n_splits=5).split(groups=race_ids_of(range(2010, 2015))))
@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from keiba_machine_learning.models import (HORSE_GENDER_CODES, RACE_TRACK_CODES, TRACK_KIND_CODES, HorseGender,
+                                           HorseGenderFactory, RaceTrac, RaceTracFactory, TrackKind, TrackKindFactory)
+
+
+def test_member_and_code():
+    assert RACE_TRACK_CODES.member('東京') == RaceTrac.TOKYO
+    assert RACE_TRACK_CODES.code('東京') == RaceTrac.TOKYO.value
+    # 略記も同じメンバーになる
+    assert TRACK_KIND_CODES.member('ダ') == TRACK_KIND_CODES.member('ダート') == TrackKind.DIRT
+    with pytest.raises(KeyError):
+        HORSE_GENDER_CODES.member('x')
+
+
+def test_factories_use_code_tables():
+    assert RaceTracFactory.create('小倉') == RaceTrac.KOKURA
+    assert TrackKindFactory.create('障') == TrackKind.JUMP
+    assert HorseGenderFactory.create('セ') == HorseGender.CASTRATED
+    with pytest.raises(KeyError):
+        RaceTracFactory.create('大井')
+
+
+@pytest.mark.parametrize('marks', [
+    ['牡', '牝', 'セ', '牡'],
+    np.array(['牡', '牝', 'セ', '牡'], dtype=object),
+    pd.Series(['牡', '牝', 'セ', '牡']),
+])
+def test_codes(marks):
+    codes = HORSE_GENDER_CODES.codes(marks)
+
+    assert codes.dtype == np.int8
+    np.testing.assert_array_equal(codes, [1, 2, 3, 1])
+    assert HORSE_GENDER_CODES.members(codes) == [HorseGender.MALE, HorseGender.FEMALE,
+                                                 HorseGender.CASTRATED, HorseGender.MALE]
+
+
+def test_codes_with_unknown_marks():
+    with pytest.raises(KeyError, match='大井'):
+        RACE_TRACK_CODES.codes(['東京', '大井'])
+
+    np.testing.assert_array_equal(RACE_TRACK_CODES.codes(['東京', '大井'], missing=-1), [5, -1])
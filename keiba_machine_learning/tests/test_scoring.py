@@ -0,0 +1,61 @@
+import copy
+
+import numpy as np
+
+from keiba_machine_learning.netkeiba.datasets import to_table
+from keiba_machine_learning.netkeiba.pipelines import COLUMNS, race_page_to_columns
+from keiba_machine_learning.scoring import RaceScorer
+
+
+def test_score(scorer, race_page):
+    scores = scorer.score([race_page])
+
+    assert len(scores) == 1
+    score = scores[0]
+    horse_count = len(race_page['race_records'])
+    assert score.probabilities.shape == (horse_count, 4)
+    np.testing.assert_allclose(score.probabilities.sum(axis=1), 1.0)
+    np.testing.assert_array_equal(score.classes, [1, 2, 3, 4])
+    assert sorted(score.horse_numbers.tolist()) == list(range(1, horse_count + 1))
+
+    # まとめて変換した結果と一致する
+    x = scorer.encoder.transform(_to_df(race_page))
+    np.testing.assert_allclose(score.probabilities, scorer.model.predict_proba(x))
+
+
+def test_score_reuses_unchanged_rows(scorer, race_page):
+    horse_count = len(race_page['race_records'])
+    scorer.score([race_page])
+    assert (scorer.encoded_row_count, scorer.reused_row_count) == (horse_count, 0)
+
+    # オッズが変わった馬だけを変換し直す
+    updated = copy.deepcopy(race_page)
+    updated['race_records'][0]['win_betting_ratio'] = 999.9
+    scores = scorer.score([updated, race_page])
+
+    assert scorer.encoded_row_count == horse_count + 1
+    assert scorer.reused_row_count == horse_count * 2 - 1
+    assert len(scores) == 2
+    assert scores[1].probabilities.shape == (horse_count, 4)
+
+
+def test_score_evicts_old_races(scorer, race_page):
+    scorer = RaceScorer(scorer.model, scorer.encoder, max_cached_races=1)
+
+    other = copy.deepcopy(race_page)
+    other['race_information']['race_number'] += 1
+    scorer.score([race_page])
+    scorer.score([other])
+    scorer.score([race_page])
+
+    assert scorer.reused_row_count == 0
+
+
+def test_score_empty(scorer):
+    assert scorer.score([]) == []
+
+
+def _to_df(race_page):
+    columns = {column: [] for column in COLUMNS}
+    race_page_to_columns(0, race_page, columns)
+    return to_table(columns).to_pandas()
@@ -0,0 +1,180 @@
+import asyncio
+import copy
+import json
+import urllib.error
+import urllib.request
+
+import numpy as np
+import pytest
+
+from keiba_machine_learning.serving import BadRequest, BatchingScorer, LatencyStats, PredictionServer, race_page_from_json
+
+
+def to_json(race_page):
+    """ RacePage をリクエストの JSON の形式にする """
+    race_information = dict(race_page['race_information'])
+    for key, value in race_information.items():
+        if hasattr(value, 'value'):
+            race_information[key] = value.value
+    race_information['starts_at'] = race_information['starts_at'].isoformat()
+    race_records = []
+    for race_record in race_page['race_records']:
+        race_record = dict(race_record)
+        race_record['horse_gender'] = race_record['horse_gender'].value
+        race_records.append(race_record)
+    return {'race_information': race_information, 'race_records': race_records}
+
+
+def test_race_page_from_json(race_page):
+    assert race_page_from_json(json.loads(json.dumps(to_json(race_page)))) == race_page
+
+
+def test_race_page_from_json_with_invalid_race(race_page):
+    data = to_json(race_page)
+    data['race_information']['weather'] = 99
+    with pytest.raises(BadRequest):
+        race_page_from_json(data)
+
+
+@pytest.mark.parametrize('key, value', [
+    ('impost', None),
+    ('horse_number', '1'),
+    ('horse_weight', 100_000),
+    ('favorite_order', True),
+    ('jockey_id', 5339),
+])
+def test_race_page_from_json_with_invalid_race_record(race_page, key, value):
+    """ 予想に使う項目が不正なレースは他のリクエストとまとめる前に弾く """
+    data = to_json(race_page)
+    data['race_records'][0][key] = value
+    with pytest.raises(BadRequest):
+        race_page_from_json(data)
+
+    del data['race_records'][0][key]
+    with pytest.raises(BadRequest):
+        race_page_from_json(data)
+
+
+class FailingScorer:
+    """ race_number が 99 のレースを含むと失敗する """
+
+    def __init__(self, scorer):
+        self.scorer = scorer
+        self.call_count = 0
+
+    def score(self, race_pages):
+        self.call_count += 1
+        if any(race_page['race_information']['race_number'] == 99 for race_page in race_pages):
+            raise ValueError('broken race')
+        return self.scorer.score(race_pages)
+
+
+def test_batching_scorer_isolates_failed_request(scorer, race_page):
+    broken = copy.deepcopy(race_page)
+    broken['race_information']['race_number'] = 99
+    failing_scorer = FailingScorer(scorer)
+
+    async def score_concurrently():
+        batching_scorer = BatchingScorer(failing_scorer, max_delay=0.05)
+        try:
+            return await asyncio.gather(*[batching_scorer.score([p]) for p in (race_page, broken, race_page)],
+                                        return_exceptions=True)
+        finally:
+            await batching_scorer.close()
+
+    first, second, third = asyncio.run(score_concurrently())
+
+    # まとめた予想が失敗したので1件ずつ予想し直し、原因のリクエストだけが失敗する
+    assert failing_scorer.call_count == 4
+    assert isinstance(second, ValueError)
+    np.testing.assert_allclose(first[0].probabilities, scorer.score([race_page])[0].probabilities)
+    np.testing.assert_allclose(third[0].probabilities, first[0].probabilities)
+
+
+def test_batching_scorer_coalesces_concurrent_requests(scorer, race_page):
+    race_pages = []
+    for race_number in range(1, 6):
+        other = copy.deepcopy(race_page)
+        other['race_information']['race_number'] = race_number
+        race_pages.append(other)
+
+    async def score_concurrently():
+        batching_scorer = BatchingScorer(scorer, max_delay=0.05)
+        try:
+            return batching_scorer, await asyncio.gather(*[batching_scorer.score([p]) for p in race_pages])
+        finally:
+            await batching_scorer.close()
+
+    batching_scorer, results = asyncio.run(score_concurrently())
+
+    # 5件のリクエストが1回の予想にまとめられている
+    assert batching_scorer.stats.batch_count == 1
+    assert batching_scorer.stats.batched_race_count == 5
+    expected = scorer.score(race_pages)
+    for result, race_score in zip(results, expected):
+        assert len(result) == 1
+        np.testing.assert_allclose(result[0].probabilities, race_score.probabilities)
+
+
+def test_batching_scorer_splits_by_max_batch_size(scorer, race_page):
+    async def score_concurrently():
+        batching_scorer = BatchingScorer(scorer, max_delay=0.05, max_batch_size=2)
+        try:
+            await asyncio.gather(*[batching_scorer.score([race_page]) for _ in range(5)])
+            return batching_scorer
+        finally:
+            await batching_scorer.close()
+
+    assert asyncio.run(score_concurrently()).stats.batch_count == 3
+
+
+def test_latency_stats():
+    stats = LatencyStats()
+    for milliseconds in range(1, 101):
+        stats.record_request(milliseconds / 1000, race_count=2)
+
+    snapshot = stats.snapshot()
+    assert snapshot['request_count'] == 100
+    assert snapshot['race_count'] == 200
+    assert snapshot['latency_p50_ms'] == pytest.approx(50.5)
+    assert snapshot['latency_p99_ms'] == pytest.approx(99.01)
+    assert snapshot['requests_per_second'] > 0
+
+
+def test_prediction_server(scorer, race_page):
+    def request(url, body=None):
+        data = None if body is None else json.dumps(body).encode('utf-8')
+        try:
+            with urllib.request.urlopen(urllib.request.Request(url, data=data), timeout=10) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, json.loads(e.read())
+
+    async def run():
+        batching_scorer = BatchingScorer(scorer)
+        server = await PredictionServer(batching_scorer).start(port=0)
+        base_url = 'http://127.0.0.1:%d' % server.sockets[0].getsockname()[1]
+        loop = asyncio.get_running_loop()
+        try:
+            async with server:
+                score = await loop.run_in_executor(None, request, base_url + '/score',
+                                                   {'races': [to_json(race_page)]})
+                invalid = await loop.run_in_executor(None, request, base_url + '/score', {'races': [{}]})
+                not_found = await loop.run_in_executor(None, request, base_url + '/unknown')
+                metrics = await loop.run_in_executor(None, request, base_url + '/metrics')
+        finally:
+            await batching_scorer.close()
+        return score, invalid, not_found, metrics
+
+    score, invalid, not_found, metrics = asyncio.run(run())
+
+    status, body = score
+    assert status == 200
+    np.testing.assert_allclose(body['races'][0]['probabilities'], scorer.score([race_page])[0].probabilities)
+    assert body['races'][0]['classes'] == [1, 2, 3, 4]
+    assert invalid[0] == 400
+    assert not_found[0] == 404
+    status, body = metrics
+    assert status == 200
+    assert body['request_count'] == 1
+    assert body['error_count'] == 1
@@ -0,0 +1,91 @@
+import pickle
+
+import numpy as np
+import scipy.sparse
+
+from keiba_machine_learning.features import FeaturePipeline
+from keiba_machine_learning.training import train_incrementally, under_sample
+
+
+def test_under_sample():
+    y = np.array([1, 2, 3, 4, 4, 4, 1, 4, 4])
+    x = scipy.sparse.csr_matrix(np.arange(len(y)).reshape(-1, 1))
+
+    x_resampled, y_resampled = under_sample(x, y, max_order_of_placing=4, random_state=0)
+
+    assert sorted(y_resampled.tolist()) == [1, 1, 2, 3, 4, 4]
+    assert x_resampled.shape == (6, 1)
+
+
+def test_under_sample_without_first():
+    y = np.array([2, 3, 4, 4])
+    x = scipy.sparse.csr_matrix(np.ones((len(y), 1)))
+
+    _, y_resampled = under_sample(x, y, max_order_of_placing=4, random_state=0)
+
+    np.testing.assert_array_equal(y_resampled, y)
+
+
+def test_train_incrementally(dataset_dir, tmp_path):
+    chunk_sizes = []
+    result = train_incrementally(FeaturePipeline(), directory=dataset_dir,
+                                 chunk_size=30, epochs=2, on_chunk=chunk_sizes.append)
+
+    # チャンクに分けて2周学習している
+    assert len(chunk_sizes) > 2
+    assert sum(chunk_sizes) % 2 == 0
+    assert 0.0 <= result.train_score <= 1.0
+    assert 0.0 <= result.test_score <= 1.0
+    assert result.model.coef_.shape == (4, len(result.encoder.feature_names()))
+
+    file_path = str(tmp_path / 'model.pickle')
+    result.save(file_path)
+    with open(file_path, mode='rb') as file:
+        saved = pickle.load(file)
+    assert saved['encoder'].feature_names() == result.encoder.feature_names()
+
+
+class RecordingPipeline(FeaturePipeline):
+    """ iter_chunks が返した訓練データ・テストデータのレースID・渡されたシャッフルのシードと、
+        データセット全体を読み込んで境目を求めた回数を記録する
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.train_race_ids = set()
+        self.test_race_ids = set()
+        self.cutoff_count = 0
+        self.shuffle_seeds = []
+
+    def dataset_train_cutoff(self, *args, **kwargs):
+        self.cutoff_count += 1
+        return super().dataset_train_cutoff(*args, **kwargs)
+
+    def iter_chunks(self, directory, chunk_size, train_cutoff=None, shuffle_seed=None):
+        self.shuffle_seeds.append(shuffle_seed)
+        for train_df, test_df, y_train, y_test in super().iter_chunks(directory, chunk_size, train_cutoff, shuffle_seed):
+            self.train_race_ids.update(train_df['race_id'])
+            self.test_race_ids.update(test_df['race_id'])
+            yield train_df, test_df, y_train, y_test
+
+
+def test_train_incrementally_does_not_leak(dataset_dir):
+    """ 30行ずつ読み込むとチャンクをまたぐレースがあるが、同じレースが訓練データとテストデータの両方に入ることはない """
+    pipeline = RecordingPipeline()
+    train_incrementally(pipeline, directory=dataset_dir, chunk_size=30, epochs=2)
+
+    assert pipeline.train_race_ids and pipeline.test_race_ids
+    assert pipeline.train_race_ids.isdisjoint(pipeline.test_race_ids)
+    assert pipeline.cutoff_count == 1
+
+
+def test_train_incrementally_shuffles_partitions_each_epoch(dataset_dir):
+    """ 同じ競馬場のデータばかり続けて学習しないように、エポックごとに違う順番で読み込む """
+    pipeline = RecordingPipeline()
+    train_incrementally(pipeline, directory=dataset_dir, chunk_size=30, epochs=3)
+
+    # fit_encoder と最後の正解率の計算ではシャッフルしない
+    training_seeds = pipeline.shuffle_seeds[1:-1]
+    assert len(training_seeds) == 3
+    assert None not in training_seeds
+    assert len(set(training_seeds)) == 3
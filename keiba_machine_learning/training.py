@@ -0,0 +1,111 @@
+"""着順を予測する分類器の学習
+
+    全期間のデータセットはメモリに載り切らないので、データセットをチャンクごとに読み込んで
+    SGDClassifier(ロジスティック回帰と同じ損失関数)を partial_fit で少しずつ学習させる
+    メモリの使用量はデータセットの大きさではなくチャンクの大きさで決まる
+
+    Examples:
+        result = train_incrementally(FeaturePipeline(filters=[('year', '>=', 1986)]), chunk_size=100_000)
+        print(result.train_score, result.test_score)
+"""
+import pickle
+from typing import Callable, NamedTuple, Optional, Tuple
+
+import numpy as np
+import scipy.sparse
+from imblearn.under_sampling import RandomUnderSampler
+from sklearn.linear_model import SGDClassifier
+
+from keiba_machine_learning.features import FeaturePipeline, SparseOneHotEncoder
+from keiba_machine_learning.netkeiba.constants import RACE_RESULTS_DATASET_DIR
+
+
+class TrainingResult(NamedTuple):
+    model: SGDClassifier
+    encoder: SparseOneHotEncoder
+    train_score: float  # 訓練データ(アンダーサンプリング前)での正解率
+    test_score: float  # テストデータでの正解率
+
+    def save(self, file_path: str) -> None:
+        """ 予測に必要なモデルとエンコーダーを保存する """
+        with open(file_path, mode='wb') as file:
+            pickle.dump({'model': self.model, 'encoder': self.encoder}, file)
+
+
+def under_sample(x: scipy.sparse.csr_matrix, y: np.ndarray, max_order_of_placing: int,
+                 random_state: int) -> Tuple[scipy.sparse.csr_matrix, np.ndarray]:
+    """ まとめた着順(max_order_of_placing)の行数を1着の行数に合わせる
+
+        着順をまとめると最後のクラスの割合が大幅に増えるので、標本を調整しないとそのクラスの予想に偏ってしまう
+        それ以外のクラスはそのまま残す
+    """
+    count_of_first = int(np.count_nonzero(y == 1))
+    count_of_last = int(np.count_nonzero(y == max_order_of_placing))
+    if count_of_first == 0 or count_of_last <= count_of_first:
+        return x, y
+
+    sampler = RandomUnderSampler(sampling_strategy={max_order_of_placing: count_of_first},
+                                 random_state=random_state)
+    return sampler.fit_resample(x, y)
+
+
+def train_incrementally(pipeline: Optional[FeaturePipeline] = None,
+                        directory: str = RACE_RESULTS_DATASET_DIR,
+                        chunk_size: int = 100_000,
+                        epochs: int = 5,
+                        on_chunk: Optional[Callable[[int], None]] = None) -> TrainingResult:
+    """ データセットをチャンクごとに読み込んで学習させる
+
+        1. データセット全体のレースIDから訓練データとテストデータの境目を一度だけ求める
+           (以降は全てのチャンクをこの境目で分けるので、同じレースが訓練データとテストデータの両方に入ることはない)
+        2. 訓練データを一通り読み込んで one-hot の語彙を学習する
+        3. epochs 回、チャンクごとにアンダーサンプリングして partial_fit する
+           (データセットは年・競馬場ごとに分かれているので、同じ競馬場のデータばかり続けて学習しないように
+           split_by='race' の場合はエポックごとにパーティションを読む順番をシャッフルする)
+        4. 訓練データ・テストデータでの正解率を計算する
+
+    Args:
+        pipeline (Optional[FeaturePipeline]): 使う列・着順のまとめ方・テストデータの割合など(省略時はデフォルトの設定)
+        directory (str): データセットの保存先
+        chunk_size (int): 1回に読み込む行数
+        epochs (int): 全データで学習させる回数
+        on_chunk (Optional[Callable[[int], None]]): チャンクを処理する度に行数を渡して呼ばれる(進捗表示用)
+
+    Returns:
+        TrainingResult
+    """
+    if epochs < 1:
+        raise ValueError("epochs must be positive.")
+
+    pipeline = pipeline if pipeline is not None else FeaturePipeline()
+    train_cutoff = pipeline.dataset_train_cutoff(directory, chunk_size) if pipeline.split_by == 'race' else None
+    encoder = pipeline.fit_encoder(directory, chunk_size, train_cutoff)
+    classes = np.arange(1, pipeline.max_order_of_placing + 1)
+    model = SGDClassifier(loss='log_loss', random_state=pipeline.random_state)
+
+    for epoch in range(epochs):
+        shuffle_seed = pipeline.random_state + epoch if pipeline.split_by == 'race' else None
+        chunks = pipeline.iter_chunks(directory, chunk_size, train_cutoff, shuffle_seed)
+        for index, (train_df, _, y_train, _) in enumerate(chunks):
+            # 後の日のレースだけのチャンクには訓練データがない
+            if len(train_df) == 0:
+                continue
+            x_train, y_train = under_sample(encoder.transform(train_df), y_train,
+                                            pipeline.max_order_of_placing,
+                                            random_state=pipeline.random_state + index)
+            model.partial_fit(x_train, y_train, classes=classes)
+            if on_chunk is not None:
+                on_chunk(len(train_df))
+
+    train_correct = train_count = test_correct = test_count = 0
+    for train_df, test_df, y_train, y_test in pipeline.iter_chunks(directory, chunk_size, train_cutoff):
+        if len(train_df) > 0:
+            train_correct += int(np.count_nonzero(model.predict(encoder.transform(train_df)) == y_train))
+        if len(test_df) > 0:
+            test_correct += int(np.count_nonzero(model.predict(encoder.transform(test_df)) == y_test))
+        train_count += len(y_train)
+        test_count += len(y_test)
+
+    return TrainingResult(model=model, encoder=encoder,
+                          train_score=train_correct / train_count if train_count else 0.0,
+                          test_score=test_correct / test_count if test_count else 0.0)
@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import TypedDict
+from typing import List, TypedDict
 from keiba_machine_learning.models import RaceTrac, TrackKind, TrackDirection, TrackSurface, Weather, HorseGender
 
 
@@ -46,3 +46,9 @@ class RaceRecord(TypedDict):
     favorite_order: int  # 人気
     horse_weight: float  # 馬体重
     weight_change: float  # 体重変化
+
+
+class RacePage(TypedDict):
+    """レース結果ページ1つ分をスクレイピングした結果として返すべき dict の構造を定義するクラス"""
+    race_information: RaceInformation
+    race_records: List[RaceRecord]
@@ -1,8 +1,22 @@
-"""netkeibaからダウンロードしたHTMLからpandasのDataFrameを生成するスクリプト
+"""netkeibaからダウンロードしたHTMLからレース結果のデータセットを生成するスクリプト
+
+    データセットは年・競馬場ごとに分けた Parquet ファイルとして RACE_RESULTS_DATASET_DIR に保存する
+    (読み込みは keiba_machine_learning.netkeiba.datasets.load_race_results で行う)
 
     Examples:
         ※ 実行時はパスを通すこと
         ※ 事前にファイルが用意されていること(`./download_race_pages.py` が実行済みであること)
+        ※ マニフェストがあればレース結果が存在するファイルだけを対象とし、なければ保存されている全ページを対象とする
+        ※ --archive を指定すると年ごとのアーカイブ(RACE_ARCHIVE_DIR)から読み込む
+        ※ --parser lxml を指定すると高速な lxml でパースする(デフォルトは html.parser)
+        ※ --scoped を指定するとページ全体ではなくレース情報・レース結果の表の部分だけをパースする(結果は同じで速い)
+        ※ --processes で並列に処理するプロセス数、--chunk-size で1プロセスにまとめて渡すレース数を指定できる
+          (デフォルトはデバッグしやすいように1プロセスで処理する)
+        ※ 前回作ったデータセットがあれば、それ以降に追加・変更されたページだけをスクレイピングして差し替える
+          (そのレースを含む年・競馬場のファイルだけを書き直す。--full を指定すると全ページをスクレイピングし直す)
+        ※ スクレイピングした結果は溜め込まずに --batch-size 行ごとに書き出していくので、何年分処理してもメモリの使用量は増えない
+        ※ --metrics にファイルを指定すると、パース時間・スキップしたページ数・行数・書き出し時間・ピーク時のメモリ使用量などを保存する
+          (拡張子が .json なら JSON、それ以外は Prometheus のテキスト形式)
         ※ 以下はコマンドライン上にて
 
         source venv/bin/activate
@@ -11,65 +25,77 @@
 """
 
 import os
+import argparse
+from typing import Dict, Iterator
+import numpy as np
 from tqdm import tqdm
-import pandas as pd
-
-from keiba_machine_learning.netkeiba.constants import RACE_DATA_DIR, ENCODING_OF_WEB_PAGE
-from keiba_machine_learning.netkeiba.scrapers import RaceInformationScraper, RaceResultScraper, DataNotFound, IncompatibleDataDetected
-
-race_records = []
-for file_name in tqdm(os.listdir(RACE_DATA_DIR)):
-    file_path = os.path.normpath(os.path.join(RACE_DATA_DIR, file_name))
-
-    with open(file_path, mode="r", encoding=ENCODING_OF_WEB_PAGE) as file:
-        try:
-            race_id, _ = file_name.split('.')
-            race_id = int(race_id)
-        except ValueError:
-            continue
-
-        try:
-            race_information = RaceInformationScraper.scrape(file)
-            file.seek(0)
-
-            rows = [{
-                'race_id': race_id,
-                'race_track': race_information['race_track'].value,
-                'track_kind': race_information['track_kind'].value,
-                'track_direction': race_information['track_direction'].value,
-                'race_distance_by_meter': race_information['race_distance_by_meter'],
-                'track_surface': race_information['track_surface'].value,
-                'weather': race_information['weather'].value,
-                'race_number': race_information['race_number'],
-                'starts_at': race_information['starts_at'],
-                'order_of_placing': race_record['order_of_placing'],
-                'bracket_number': race_record['bracket_number'],
-                'horse_number': race_record['horse_number'],
-                'horse_id': race_record['horse_id'],
-                'horse_name': race_record['horse_name'],
-                'horse_age': race_record['horse_age'],
-                'horse_gender': race_record['horse_gender'].value,
-                'impost': race_record['impost'],
-                'jockey_id': race_record['jockey_id'],
-                'jockey_name': race_record['jockey_name'],
-                'race_time': race_record['race_time'],
-                'win_betting_ratio': race_record['win_betting_ratio'],
-                'favorite_order': race_record['favorite_order'],
-                'horse_weight': race_record['horse_weight'],
-                'weight_change': race_record['weight_change'],
-            } for race_record in RaceResultScraper.scrape(file)]
-
-            race_records.extend(rows)
-        except DataNotFound:
-            pass
-        except IncompatibleDataDetected:
-            pass
-        except Exception as e:
-            print(f"race_id: {race_id} can't parse.")
-            raise e
-
-
-df = pd.DataFrame([], columns=race_records[0].keys())
-df = pd.concat([df, pd.DataFrame.from_dict(race_records)])
-df.to_pickle(os.path.normpath(os.path.join(
-    RACE_DATA_DIR, 'race_results_data_frame.pickle')))
+
+from keiba_machine_learning.netkeiba.constants import RACE_ARCHIVE_DIR, RACE_MANIFEST_FILE_PATH
+from keiba_machine_learning.netkeiba.datasets import apply_update, plan_update
+from keiba_machine_learning.netkeiba.instrumentation import PipelineMetrics, set_metrics, stage
+from keiba_machine_learning.netkeiba.manifests import CrawlManifest, PageStatus
+from keiba_machine_learning.netkeiba.pipelines import RacePageScrapingFailed, iter_scraped_chunks
+from keiba_machine_learning.netkeiba.scrapers import ParserBackend
+from keiba_machine_learning.netkeiba.stores import ArchivePageStore, get_page_store, set_page_store
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--archive', action='store_true')
+parser.add_argument('--parser', default=ParserBackend.HTML_PARSER.value,
+                    choices=[backend.value for backend in ParserBackend])
+parser.add_argument('--scoped', action='store_true')
+parser.add_argument('--processes', type=int, default=1)
+parser.add_argument('--chunk-size', type=int, default=200)
+parser.add_argument('--full', action='store_true')
+parser.add_argument('--batch-size', type=int, default=50_000)
+parser.add_argument('--metrics')
+args = parser.parse_args()
+
+metrics = None
+if args.metrics:
+    metrics = PipelineMetrics()
+    set_metrics(metrics)
+
+if args.archive:
+    set_page_store(ArchivePageStore(RACE_ARCHIVE_DIR))
+store = get_page_store()
+
+manifest = None
+if os.path.exists(RACE_MANIFEST_FILE_PATH):
+    manifest = CrawlManifest()
+    race_ids = manifest.race_ids(PageStatus.OK)
+else:
+    race_ids = store.race_ids()
+
+with stage('plan'):
+    plan = plan_update(race_ids, store=store, full=args.full)
+print(f"{len(plan.scraping_race_ids)} pages to scrape, {len(plan.removed_race_ids)} races to remove.")
+
+
+def scraped_columns(progress_bar: tqdm) -> Iterator[Dict[str, np.ndarray]]:
+    """ チャンクごとにスクレイピングした結果を順に返す(全ての結果を溜め込まずに書き出していく) """
+    chunks = iter_scraped_chunks(plan.scraping_race_ids, store=store, parser=ParserBackend(args.parser),
+                                 processes=args.processes, chunk_size=args.chunk_size, scoped=args.scoped)
+    for chunk in chunks:
+        if manifest is not None:
+            for race_id in chunk.not_found_race_ids:
+                manifest.update_status(race_id, PageStatus.EMPTY)
+            # 次回以降はスクレイピングの対象から外す
+            for race_id in chunk.incompatible_race_ids:
+                manifest.update_status(race_id, PageStatus.INCOMPATIBLE)
+        progress_bar.update(chunk.page_count)
+        yield chunk.columns
+
+
+with tqdm(total=len(plan.scraping_race_ids)) as progress_bar:
+    try:
+        partitions = apply_update(plan, scraped_columns(progress_bar), batch_size=args.batch_size)
+    except RacePageScrapingFailed as e:
+        print(f"race_id: {e.race_id} can't parse.")
+        if metrics is not None:
+            metrics.save(args.metrics)
+        raise e
+
+print(f"{len(partitions)} partitions were written.")
+
+if metrics is not None:
+    metrics.save(args.metrics)
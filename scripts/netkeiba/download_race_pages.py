@@ -6,12 +6,24 @@
     このスクリプトでは指定された年のレースのファイルを全てダウンロードする
 
     netkeiba側の仕様でレースデータが存在しないページにアクセスしても404をHTTPステータスコードとしてレスポンスしないので、
-    ここでは内容を気にせず保存を行う
-    (データが存在しないことによる異常の処理はパーサーの責務とする)
+    デフォルトでは開催カレンダーに沿って探索し、開催がないとわかった日・回以降は取得しない
+    (詳細は keiba_machine_learning/netkeiba/crawlers.py を参照)
+
+    --exhaustive を指定した場合は全ての組み合わせを取得する
+
+    いずれの場合もレース結果が存在しないページは保存せず、取得結果をマニフェストに記録する
+    (詳細は keiba_machine_learning/netkeiba/manifests.py を参照)
+    再実行時はマニフェストを見てデータが存在しないレースは取得せず、取得に失敗したものや壊れているもの、
+    その年が終わる前にデータが存在しなかったもののうち1日以上前に取得したものだけ取得し直す
 
 
     Args:
         year (int): コマンドライン引数としてダウンロード対象とするレースが開催された年を指定する
+        --requests-per-second (float): 秒間リクエスト数の上限(デフォルトは 1.0)
+        --max-connections (int): 同時接続数の上限(デフォルトは 4)
+        --exhaustive: 探索を打ち切らずに全ての組み合わせをダウンロードする
+        --archive: 1レース1ファイルではなく、年ごとのアーカイブ(RACE_ARCHIVE_DIR)にまとめて保存する
+        --metrics (str): 取得のレイテンシ・バイト数・失敗数などを保存するファイル(拡張子が .json なら JSON、それ以外は Prometheus のテキスト形式)
 
     Examples:
         ※ 実行時はパスを通すこと
@@ -20,34 +32,66 @@
         source venv/bin/activate
         export PYTHONPATH=".:$PYTHONPATH"
         python scripts/netkeiba/download_race_pages.py 2019
+        python scripts/netkeiba/download_race_pages.py 2019 --metrics /var/lib/node_exporter/textfile/keiba_download.prom
 """
 import os
-import time
-import sys
-import urllib.request
+import argparse
 from tqdm import tqdm
 
-from keiba_machine_learning.netkeiba.constants import RACE_DATA_DIR
-from keiba_machine_learning.models import RaceTrac
-from keiba_machine_learning.netkeiba.models import Race
+from keiba_machine_learning.netkeiba.constants import RACE_DATA_DIR, RACE_ARCHIVE_DIR
+from keiba_machine_learning.netkeiba.models import RaceKey
+from keiba_machine_learning.netkeiba.race_ids import all_race_ids
+from keiba_machine_learning.netkeiba.downloaders import RacePageDownloader
+from keiba_machine_learning.netkeiba.crawlers import RaceCalendarCrawler
+from keiba_machine_learning.netkeiba.instrumentation import PipelineMetrics, set_metrics
+from keiba_machine_learning.netkeiba.manifests import CrawlManifest
+from keiba_machine_learning.netkeiba.stores import ArchivePageStore, set_page_store
 
 
 os.makedirs(RACE_DATA_DIR, exist_ok=True)
 
-args = sys.argv
-YEAR = int(args[1])
-
-races = []
-for race_track in RaceTrac:
-    for series_number in range(1, Race.MAX_SERIES_NUMBER + 1):
-        for day_number in range(1, Race.MAX_DAY_NUMBER + 1):
-            for race_number in range(1, Race.MAX_RACE_NUMBER + 1):
-                races.append(Race(year=YEAR, race_track=race_track,
-                                  series_number=series_number, day_number=day_number, race_number=race_number))
-
-for race in tqdm(races):
-    if os.path.exists(race.file_path):
-        continue
-    else:
-        urllib.request.urlretrieve(race.url, race.file_path)
-        time.sleep(1)
+parser = argparse.ArgumentParser()
+parser.add_argument('year', type=int)
+parser.add_argument('--requests-per-second', type=float, default=1.0)
+parser.add_argument('--max-connections', type=int, default=4)
+parser.add_argument('--exhaustive', action='store_true')
+parser.add_argument('--archive', action='store_true')
+parser.add_argument('--metrics')
+args = parser.parse_args()
+YEAR = args.year
+
+metrics = None
+if args.metrics:
+    metrics = PipelineMetrics()
+    set_metrics(metrics)
+
+if args.archive:
+    set_page_store(ArchivePageStore(RACE_ARCHIVE_DIR))
+
+manifest = CrawlManifest()
+downloader = RacePageDownloader(requests_per_second=args.requests_per_second,
+                                max_connections=args.max_connections,
+                                manifest=manifest)
+
+if args.exhaustive:
+    races = RaceKey.from_ids(all_race_ids(YEAR))
+
+    races = [race for race in races if manifest.needs_fetch(race)]
+
+    with tqdm(total=len(races)) as progress_bar:
+        failed_races = downloader.run(races, on_done=lambda _: progress_bar.update())
+else:
+    with tqdm() as progress_bar:
+        result = RaceCalendarCrawler(downloader).run(
+            YEAR, on_done=lambda _: progress_bar.update())
+
+    print(f"{len(result.found_races)} races found with {result.request_count} requests.")
+    failed_races = result.failed_races
+
+for race in failed_races:
+    print(f"race_id: {race.id} can't download.")
+
+manifest.close()
+
+if metrics is not None:
+    metrics.save(args.metrics)
@@ -0,0 +1,55 @@
+"""負荷試験・ベンチマーク用に netkeiba のレースページに似せたページを生成するスクリプト
+
+    RACE_DATA_DIR と同じ形式({race_id}.html)、または --archive を指定すると RACE_ARCHIVE_DIR と同じ形式で保存する
+    (生成するページについては keiba_machine_learning/netkeiba/synthetic.py を参照)
+
+    実際のデータと混ざらないように保存先は必ず指定する
+    生成したディレクトリは create_race_result_data_frame.py などの入力として使える
+
+    Args:
+        output: 保存先のディレクトリ
+        --since (int): 最初の年(デフォルトは 1986)
+        --until (int): 最後の年(デフォルトは 2020)
+        --scale (float): 1年あたりのレース数の実際に対する倍率(デフォルトは 1.0。1年あたり最大で約2.4倍)
+        --seed (int): 乱数のシード
+        --padding (int): スクレイピングに使わない部分のバイト数(デフォルトは 30000)
+        --archive: 年ごとのアーカイブにまとめて保存する
+
+    Examples:
+        ※ 実行時はパスを通すこと
+        ※ 以下はコマンドライン上にて
+
+        source venv/bin/activate
+        export PYTHONPATH=".:$PYTHONPATH"
+        # 35年分(実際と同程度)
+        python scripts/netkeiba/generate_synthetic_race_pages.py /tmp/synthetic_race --since 1986 --until 2020
+        # 10倍(年を10倍にする。実在しない年も4桁であれば使える)
+        python scripts/netkeiba/generate_synthetic_race_pages.py /tmp/synthetic_race_x10 --since 1700 --until 2049 --archive
+"""
+import argparse
+from tqdm import tqdm
+
+from keiba_machine_learning.netkeiba.stores import ArchivePageStore, DirectoryPageStore
+from keiba_machine_learning.netkeiba.synthetic import SyntheticCorpus, synthetic_race_ids, write_corpus
+
+parser = argparse.ArgumentParser()
+parser.add_argument('output')
+parser.add_argument('--since', type=int, default=1986)
+parser.add_argument('--until', type=int, default=2020)
+parser.add_argument('--scale', type=float, default=1.0)
+parser.add_argument('--seed', type=int, default=0)
+parser.add_argument('--padding', type=int, default=30_000)
+parser.add_argument('--archive', action='store_true')
+args = parser.parse_args()
+
+corpus = SyntheticCorpus(seed=args.seed, padding=args.padding)
+race_ids = synthetic_race_ids(range(args.since, args.until + 1), scale=args.scale, seed=args.seed)
+
+if args.archive:
+    with ArchivePageStore(args.output) as store:
+        store.write_many(tqdm(corpus.iter_pages(race_ids), total=len(race_ids)))
+else:
+    with tqdm(total=len(race_ids)) as progress_bar:
+        write_corpus(corpus, DirectoryPageStore(args.output), race_ids, on_written=lambda _: progress_bar.update())
+
+print(f"{len(race_ids)} pages written to {args.output}.")
@@ -0,0 +1,38 @@
+"""1レース1ファイルで保存したレースページを年ごとのアーカイブにまとめるスクリプト
+
+    RACE_DATA_DIR 配下の {race_id}.html を RACE_ARCHIVE_DIR 配下の {year}.pages.gz にまとめる
+    (詳細は keiba_machine_learning/netkeiba/stores.py を参照)
+
+    Args:
+        --remove: アーカイブに書き込んだ後に元のファイルを削除する
+
+    Examples:
+        ※ 実行時はパスを通すこと
+        ※ 以下はコマンドライン上にて
+
+        source venv/bin/activate
+        export PYTHONPATH=".:$PYTHONPATH"
+        python scripts/netkeiba/pack_race_pages.py
+"""
+import os
+import argparse
+from tqdm import tqdm
+
+from keiba_machine_learning.netkeiba.constants import RACE_DATA_DIR, RACE_ARCHIVE_DIR
+from keiba_machine_learning.netkeiba.stores import ArchivePageStore, DirectoryPageStore
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--remove', action='store_true')
+args = parser.parse_args()
+
+directory_store = DirectoryPageStore(RACE_DATA_DIR)
+race_ids = directory_store.race_ids()
+
+with ArchivePageStore(RACE_ARCHIVE_DIR) as archive_store:
+    race_ids = [race_id for race_id in race_ids if race_id not in archive_store]
+    archive_store.write_many(tqdm(directory_store.iter_pages(race_ids), total=len(race_ids)))
+
+    if args.remove:
+        for race_id in race_ids:
+            if archive_store.size(race_id) == directory_store.size(race_id):
+                os.remove(directory_store.file_path(race_id))
@@ -0,0 +1,45 @@
+"""マニフェスト導入前にダウンロードしたレースファイルをマニフェストに登録するスクリプト
+
+    レース結果が存在しないファイルは EMPTY として登録する
+    (登録後はそれらのファイルは不要なので、--remove-empty を指定すると削除する)
+
+    Args:
+        year (int): コマンドライン引数として対象とするレースが開催された年を指定する
+        --remove-empty: レース結果が存在しないファイルを削除する
+        --archive: 年ごとのアーカイブ(RACE_ARCHIVE_DIR)に保存したページを対象とする
+
+    Examples:
+        ※ 実行時はパスを通すこと
+        ※ 以下はコマンドライン上にて
+
+        source venv/bin/activate
+        export PYTHONPATH=".:$PYTHONPATH"
+        python scripts/netkeiba/register_race_pages.py 2019
+"""
+import os
+import argparse
+
+from keiba_machine_learning.netkeiba.models import RaceKey
+from keiba_machine_learning.netkeiba.race_ids import all_race_ids
+from keiba_machine_learning.netkeiba.constants import RACE_ARCHIVE_DIR
+from keiba_machine_learning.netkeiba.manifests import CrawlManifest, PageStatus
+from keiba_machine_learning.netkeiba.stores import ArchivePageStore, set_page_store
+
+parser = argparse.ArgumentParser()
+parser.add_argument('year', type=int)
+parser.add_argument('--remove-empty', action='store_true')
+parser.add_argument('--archive', action='store_true')
+args = parser.parse_args()
+
+if args.archive:
+    set_page_store(ArchivePageStore(RACE_ARCHIVE_DIR))
+
+races = RaceKey.from_ids(all_race_ids(args.year))
+
+with CrawlManifest() as manifest:
+    manifest.register_files(races)
+
+    for race in races:
+        entry = manifest.get(race.id)
+        if args.remove_empty and not args.archive and entry is not None and entry.status == PageStatus.EMPTY and os.path.exists(race.file_path):
+            os.remove(race.file_path)
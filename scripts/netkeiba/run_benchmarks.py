@@ -0,0 +1,70 @@
+"""スクレイピング・データセットの作成・特徴量の変換・学習の速度を計測するスクリプト
+
+    テスト用のフィクスチャのページを対象にする(詳細は keiba_machine_learning/benchmarks.py を参照)
+    --baseline を指定すると保存済みの結果と比べ、--threshold を超えて遅くなった項目があれば終了コード 1 で終了する
+
+    Args:
+        --sizes (int): 特徴量の変換・学習を計測する行数(複数指定可。デフォルトは 1000 10000 100000)
+        --repeat (int): 各項目を計測する回数(デフォルトは 3)
+        --parser: HTMLのパースに使うライブラリ(html.parser | lxml)
+        --output: 結果を保存する JSON ファイル
+        --baseline: 比較対象の結果の JSON ファイル
+        --threshold (float): 許容する悪化の割合(デフォルトは 0.2)
+
+    Examples:
+        ※ 実行時はパスを通すこと
+        ※ 以下はコマンドライン上にて
+
+        source venv/bin/activate
+        export PYTHONPATH=".:$PYTHONPATH"
+        python scripts/netkeiba/run_benchmarks.py --output data/benchmark_baseline.json
+        python scripts/netkeiba/run_benchmarks.py --baseline data/benchmark_baseline.json
+
+        scrape.race_information: 103.2 pages/s
+        ...
+        model.fit[100000]: 2.41 s (+35.2% vs baseline 1.78)
+"""
+import argparse
+import os
+import sys
+
+from keiba_machine_learning.benchmarks import DEFAULT_SIZES, compare, load_results, run_benchmarks, save_results
+from keiba_machine_learning.netkeiba.scrapers import ParserBackend
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           '../../keiba_machine_learning/netkeiba/tests/fixtures')
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES))
+parser.add_argument('--repeat', type=int, default=3)
+parser.add_argument('--parser', choices=[backend.value for backend in ParserBackend],
+                    default=ParserBackend.HTML_PARSER.value)
+parser.add_argument('--output')
+parser.add_argument('--baseline')
+parser.add_argument('--threshold', type=float, default=0.2)
+args = parser.parse_args()
+
+pages = []
+for file_name in sorted(os.listdir(FIXTURE_DIR)):
+    with open(os.path.join(FIXTURE_DIR, file_name), mode='rb') as file:
+        pages.append(file.read())
+
+results = run_benchmarks(pages, sizes=args.sizes, repeat=args.repeat, parser=ParserBackend(args.parser))
+
+baseline = {result.name: result for result in load_results(args.baseline)} if args.baseline else {}
+for result in results:
+    line = f"{result.name}: {result.value:.4g} {result.unit}"
+    if result.name in baseline and baseline[result.name].value > 0:
+        change = result.value / baseline[result.name].value - 1
+        line += f" ({change:+.1%} vs baseline {baseline[result.name].value:.4g})"
+    print(line)
+
+if args.output is not None:
+    save_results(results, args.output)
+
+if args.baseline is not None:
+    regressions = compare(results, list(baseline.values()), threshold=args.threshold)
+    for regression in regressions:
+        print(f"regression: {regression.name} is {regression.change:.1%} worse than the baseline", file=sys.stderr)
+    if regressions:
+        sys.exit(1)
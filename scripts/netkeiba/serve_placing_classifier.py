@@ -0,0 +1,41 @@
+"""学習済みの分類器でレースを予想する HTTP サーバーを起動するスクリプト
+
+    同時に届いたリクエストは max-delay ミリ秒の間まとめてから1回で予想する(詳細は keiba_machine_learning/serving.py を参照)
+
+    Args:
+        --model: train_placing_classifier.py の --output で保存したファイル
+        --host: 待ち受けるホスト
+        --port: 待ち受けるポート
+        --max-delay: リクエストをまとめるために待つ最大のミリ秒数
+        --max-batch-size: 1回の予想でまとめる最大のレース数
+
+    Examples:
+        ※ 実行時はパスを通すこと
+        ※ 以下はコマンドライン上にて
+
+        source venv/bin/activate
+        export PYTHONPATH=".:$PYTHONPATH"
+        python scripts/netkeiba/serve_placing_classifier.py --model data/placing_classifier.pickle --port 8000
+        curl -s localhost:8000/metrics
+"""
+import argparse
+import asyncio
+
+from keiba_machine_learning.scoring import RaceScorer
+from keiba_machine_learning.serving import serve
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--model', required=True)
+parser.add_argument('--host', default='127.0.0.1')
+parser.add_argument('--port', type=int, default=8000)
+parser.add_argument('--max-delay', type=float, default=5.0)
+parser.add_argument('--max-batch-size', type=int, default=256)
+args = parser.parse_args()
+
+scorer = RaceScorer.load(args.model)
+
+try:
+    asyncio.run(serve(scorer, host=args.host, port=args.port,
+                      max_delay=args.max_delay / 1000, max_batch_size=args.max_batch_size))
+except KeyboardInterrupt:
+    pass
@@ -0,0 +1,43 @@
+"""データセットをチャンクごとに読み込みながら着順を予測する分類器を学習させるスクリプト
+
+    全期間のデータセットがメモリに載らなくても学習できる(詳細は keiba_machine_learning/training.py を参照)
+    最後に logistic_regression_exam.ipynb と同じく訓練データ・テストデータでの正解率を表示する
+
+    Args:
+        --since: この年以降のデータだけを使う(省略時は全て)
+        --chunk-size: 1回に読み込む行数
+        --epochs: 全データで学習させる回数
+        --output: 学習したモデルとエンコーダーの保存先(省略時は保存しない)
+
+    Examples:
+        ※ 実行時はパスを通すこと
+        ※ 事前にデータセットが用意されていること(`./create_race_result_data_frame.py` が実行済みであること)
+        ※ 以下はコマンドライン上にて
+
+        source venv/bin/activate
+        export PYTHONPATH=".:$PYTHONPATH"
+        python scripts/netkeiba/train_placing_classifier.py --since 2010 --output data/placing_classifier.pickle
+"""
+import argparse
+from tqdm import tqdm
+
+from keiba_machine_learning.features import FeaturePipeline
+from keiba_machine_learning.training import train_incrementally
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--since', type=int)
+parser.add_argument('--chunk-size', type=int, default=100_000)
+parser.add_argument('--epochs', type=int, default=5)
+parser.add_argument('--output')
+args = parser.parse_args()
+
+pipeline = FeaturePipeline(filters=None if args.since is None else [('year', '>=', args.since)])
+
+with tqdm(unit='rows') as progress_bar:
+    result = train_incrementally(pipeline, chunk_size=args.chunk_size, epochs=args.epochs,
+                                 on_chunk=progress_bar.update)
+
+print(result.train_score, result.test_score)
+
+if args.output is not None:
+    result.save(args.output)